@@ -1,6 +1,20 @@
-from pyarabic.araby import strip_tashkeel, normalize_hamza
+import re
+from pyarabic.araby import strip_tashkeel, strip_tatweel, normalize_hamza, normalize_alef, normalize_teh
 
 def preprocess_arabic_text(text):
     text = strip_tashkeel(text)  # Remove diacritics
     text = normalize_hamza(text)  # Normalize hamza characters
-    return text
\ No newline at end of file
+    return text
+
+def normalize_for_matching(text):
+    """Aggressive normalization for lexical matching (names, keywords, BM25 terms).
+    Folds alef/hamza/teh-marbuta/alef-maqsura variants so e.g. "أقرث" and "اقرث" compare equal."""
+    if not text:
+        return ""
+    text = strip_tatweel(strip_tashkeel(text))
+    text = normalize_alef(text)  # أ إ آ ى -> ا before hamza folding, so initial alef stays alef
+    text = preprocess_arabic_text(text)
+    text = normalize_teh(text)  # ة -> ه
+    text = text.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
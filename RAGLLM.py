@@ -1,34 +1,119 @@
 import os
 import json
 from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+try:
+    from pymongo import AsyncMongoClient
+    HAS_ASYNC_MONGO = True
+except ImportError:
+    HAS_ASYNC_MONGO = False
 import numpy as np
-import chromadb
-from chromadb.config import Settings
 from chromadb.utils import embedding_functions
-from transformers import pipeline
-from openai import OpenAI
-from env import MONGODB_URI, DATABASE_NAME, COLLECTION_NAME, CHROMA_COLLECTION_NAME, HF_TOKEN, OPENAI_API_KEY, CHROMA_PATH
+from openai import OpenAI, AsyncOpenAI
+from env import (
+    MONGODB_URI, DATABASE_NAME, COLLECTION_NAME, CHROMA_COLLECTION_NAME, HF_TOKEN, OPENAI_API_KEY, CHROMA_PATH,
+    NAME_INDEX_PATH, SCHEMA_CACHE_TTL, SCHEMA_CHANGE_STREAM, QUERY_COMPILER_MIN_CONFIDENCE,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_PATH,
+    MONGO_ASYNC, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_QUERY_TIMEOUT_MS,
+    TRANSLATION_TIMEOUT, STATS_SNAPSHOT, ROLLUP_COLLECTION_NAME, ROLLUP_REFRESH,
+    QUERY_MAX_RESULTS, QUERY_MAX_SCAN_DOCS, QUERY_MAX_FIELDS, NAME_SHORTLIST_SIZE,
+    LOCAL_TRANSLATOR_MODEL, LOCAL_TRANSLATOR_BACKEND, LOCAL_TRANSLATOR_MAX_NEW_TOKENS,
+    LOCAL_TRANSLATOR_BATCH_SIZE, LOCAL_TRANSLATOR_BATCH_WAIT_MS,
+    LEXICAL_INDEX_PATH, HYBRID_CANDIDATES, HYBRID_RRF_K, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH,
+    SCOPED_SEARCH_MAX_DISTANCE, VECTOR_STORE_BACKEND, FLAT_INDEX_PATH, FLAT_INDEX_RESCORE_FACTOR,
+    RETRIEVAL_TOKEN_BUDGET, RETRIEVAL_MAX_DISTANCE, RETRIEVAL_MMR_LAMBDA, RETRIEVAL_MAX_CHUNKS,
+    SHARD_MANIFEST_PATH, PROMPT_BUDGET_SYSTEM, PROMPT_BUDGET_HISTORY, PROMPT_BUDGET_STATISTICS, PROMPT_BUDGET_TEXT,
+    OPENAI_BASE_URL, PIPELINE_MODE, STAGE_DEADLINE_MONGO, STAGE_DEADLINE_RETRIEVAL, CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT, LLM_TRANSLATION_CONCURRENCY, LLM_GENERATION_CONCURRENCY, LLM_TRANSLATION_RPM,
+    LLM_GENERATION_RPM, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_PATH,
+)
+from name_index import NameIndex
+from name_matcher import TrigramNameMatcher
+from schema_cache import SchemaCache, flatten_field_names
+from query_compiler import QueryCompiler, ROLLUP_COLLECTION
+from query_cache import TranslatedQueryCache
+from stats_snapshot import StatisticsSnapshot, UnsupportedQuery
+from rollups import refresh_district_rollups, validate_pipeline, validate_filter, ROLLUP_FIELDS
+from query_guard import QueryGuard, QueryRejected, ensure_indexes
+from local_translator import LocalQueryTranslator
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from embedding_cache import CachedEmbeddingFunction
+from vector_store import ChromaVectorStore, FlatVectorStore, ShardedVectorStore
+from context_selection import select_context
+from prompt_budget import PromptBudgeter
+from stats_tool import TOOL_NAME, build_stats_tool, statistics_note, tool_arguments
+from resilience import CircuitBreaker, CircuitOpen
+from single_flight import SingleFlight
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
+from response_cache import ResponseCache, summary_hash
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+import time
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from contextlib import nullcontext
 import hashlib
 
 try:
-    from rag_logger import log_mongo_query, log_chroma_result, log_llm_context, log_error
+    from rag_logger import log_mongo_query, log_chroma_result, log_llm_context, log_error, log_query_cost, \
+        log_stream_timing, log_prompt_budget, log_pipeline_metadata
     _LOGGING_ENABLED = True
 except ImportError:
     _LOGGING_ENABLED = False
 
+TRANSLATION_PROMPT_TEMPLATE = """
+        Your goal is to provide me with a MongoDB query in pymongo format that can be used to retrieve data from a MongoDB collection.
+        Based on this Natural Language Query in English, Arabic or Hebrew: $query
+        The query should select the projection of up to 10 of the most relevant fields from the following list of fields: $fields
+        The query should be for the document with the metadata.name $closest_name.
+        Print the query in a single line as a JSON string, with fields query and projection, without any additional text or formatting. Have _id:0 in the projection.
+        example output:
+        {"query": {"metadata.name": "$closest_name"}, "projection": {"_id": 0, "field1": 1, "field2": 1}}
+
+        Exceptions to the single-village rule:
+        - If the question is about a whole district (totals or counts for a district), query the district rollup
+          collection instead. It has one document per district with the fields: """ + ", ".join(ROLLUP_FIELDS) + """
+          Known districts: $districts
+          example output: {"collection": "district_rollups", "query": {"district": "Haifa"}, "projection": {"_id": 0, "district": 1, "population_1945.total": 1}}
+        - If the question filters, ranks or compares several villages (e.g. villages with more than 10000 dunums),
+          output an aggregation pipeline over the village collection instead, using only $match, $group, $project,
+          $sort, $limit and $count stages.
+          example output: {"pipeline": [{"$match": {"geography.land.total_dunums": {"$gt": 10000}}}, {"$project": {"_id": 0, "metadata.name": 1, "geography.land.total_dunums": 1}}]}
+        """
+
 class MongoDBManager:
-    def __init__(self, embedding_fn, mongo_uri=MONGODB_URI, database_name=DATABASE_NAME, collection_name=COLLECTION_NAME):
+    def __init__(self, embedding_fn, mongo_uri=MONGODB_URI, database_name=DATABASE_NAME, collection_name=COLLECTION_NAME,
+                 embedding_model="", name_index_path=NAME_INDEX_PATH):
         self.mongo_client = None
         self.db = None
         self.collection = None
         self.query_translator = None
+        self.scheduler = None
         self.current_query = None
         self.embedding_fn = embedding_fn
         self.mongo_uri = mongo_uri
         self.database_name = database_name
         self.collection_name = collection_name
+        # Bulk-embedding every name on a rebuild would flush the query-embedding cache, so bypass it there
+        bulk_embedding_fn = embedding_fn.embedding_fn if isinstance(embedding_fn, CachedEmbeddingFunction) else None
+        self.name_index = NameIndex(embedding_fn, name_index_path, model_name=embedding_model,
+                                    bulk_embedding_fn=bulk_embedding_fn)
+        self.name_matcher = TrigramNameMatcher()
+        self.schema_cache = None
+        self.stats_snapshot = None
+        self.query_guard = None
+        self.rollups_available = False  # the compiler only routes district totals to a populated rollup collection
+        self.query_compiler = QueryCompiler()
+        self.compiler_min_confidence = QUERY_COMPILER_MIN_CONFIDENCE
+        self.query_cache = TranslatedQueryCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL,
+                                                db_path=QUERY_CACHE_PATH or None)
+        self._stats_tool = (None, None)  # (schema fingerprint, tool definition)
+        # Only connection-level errors and timeouts count against MongoDB; a rejected or invalid query does not
+        self.mongo_breaker = CircuitBreaker("mongo", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+                                            failure_types=(ConnectionFailure, ExecutionTimeout, asyncio.TimeoutError))
+        self.translator_breaker = CircuitBreaker("translator", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
         
         # Try to connect, but don't fail if MongoDB is not available
         if mongo_uri:
@@ -39,79 +124,176 @@ class MongoDBManager:
                 # Test connection
                 self.mongo_client.server_info()
                 print("[OK] MongoDB connected successfully")
+                self.schema_cache = SchemaCache(self.collection, ttl=SCHEMA_CACHE_TTL,
+                                                prompt_template=TRANSLATION_PROMPT_TEMPLATE)
+                if STATS_SNAPSHOT:
+                    self.stats_snapshot = StatisticsSnapshot(self.collection)
+                self.query_guard = QueryGuard(self.db, collection_name, max_results=QUERY_MAX_RESULTS,
+                                              max_scan_docs=QUERY_MAX_SCAN_DOCS, max_fields=QUERY_MAX_FIELDS)
+                self.schema_cache.add_listener(self._on_schema_change)
+                if SCHEMA_CHANGE_STREAM:
+                    self.schema_cache.start_change_stream()
             except Exception as e:
                 print(f"[WARNING] MongoDB connection failed: {str(e)}")
                 print("   Continuing without MongoDB - some features may be limited")
                 self.mongo_client = None
 
-    def initialize_query_translator(self, use_openAI=False, openai_client=None):
+    def refresh_rollups(self):
+        """Recompute the per-district rollup collection from the village statistics"""
+        try:
+            count = refresh_district_rollups(self.db, self.collection_name, ROLLUP_COLLECTION_NAME)
+            self.rollups_available = count > 0
+            print(f"[OK] District rollups refreshed ({count} districts)")
+        except Exception as e:
+            print(f"[WARNING] Could not refresh district rollups: {str(e)}")
+
+    def _ensure_rollups(self):
+        """Build the rollups if the load script never did (collection missing or empty), unless ROLLUP_REFRESH
+        rebuilds them on every change anyway"""
+        if ROLLUP_REFRESH:
+            self.refresh_rollups()
+            return
+        try:
+            self.rollups_available = self.db[ROLLUP_COLLECTION_NAME].estimated_document_count() > 0
+        except Exception as e:
+            print(f"[WARNING] Could not check the district rollups: {str(e)}")
+            self.rollups_available = False
+        if not self.rollups_available:
+            print("[WARNING] District rollup collection is missing or empty, building it")
+            self.refresh_rollups()
+
+    def ensure_indexes(self):
+        """Create the statistics collection indexes (idempotent; call at startup or after importing data)"""
+        if self.collection is None:
+            return
+        try:
+            ensure_indexes(self.collection)
+            self.query_guard.invalidate()
+            print("[OK] MongoDB indexes ensured")
+        except Exception as e:
+            print(f"[WARNING] Could not create MongoDB indexes: {str(e)}")
+
+    def _on_schema_change(self, snapshot):
+        """Keep derived structures in step with the statistics data"""
+        self.build_name_index()
+        self._ensure_rollups()
+        if self.query_guard is not None:
+            self.query_guard.invalidate()
+        if self.stats_snapshot is not None:
+            if self.stats_snapshot.is_ready():
+                self.stats_snapshot.reload_in_background(snapshot.fingerprint[:16])
+            else:
+                self.stats_snapshot.load(snapshot.fingerprint[:16])
+
+    def initialize_query_translator(self, use_openAI=False, openai_client=None, scheduler=None):
         self.openai_client = openai_client
+        self.scheduler = scheduler  # LLMScheduler shared with the chatbot; OpenAI is called directly without one
         if not use_openAI:
-            self.query_translator = pipeline("text2text-generation", model="google/flan-t5-large")
+            self.query_translator = LocalQueryTranslator(
+                model_name=LOCAL_TRANSLATOR_MODEL,
+                backend=LOCAL_TRANSLATOR_BACKEND,
+                max_new_tokens=LOCAL_TRANSLATOR_MAX_NEW_TOKENS,
+                max_batch_size=LOCAL_TRANSLATOR_BATCH_SIZE,
+                max_wait_ms=LOCAL_TRANSLATOR_BATCH_WAIT_MS,
+            )
+            self.query_translator.warm_up()
 
     def get_field_names(self, document, prefix=''):
         """Recursively get all field names from a MongoDB document"""
-        field_names = []
-        for key, value in document.items():
-            if isinstance(value, dict):
-                field_names.extend(self.get_field_names(value, f"{prefix}{key}."))
-            else:
-                field_names.append(f"{prefix}{key}")
-        return field_names
+        return flatten_field_names(document, prefix)
 
     def _set_query(self, query):
         """Set the current natural language query"""
         self.current_query = query
 
-    def _find_closest_name(self, names):
-        """Vector-based name matching"""
-        if not names:
-            return None
+    def build_name_index(self, force=False):
+        """Build (or load from disk) the village-name embedding index. Call at startup or after data changes."""
+        if self.schema_cache is None:
+            return
         try:
-            chroma_client = chromadb.Client(settings=Settings(allow_reset=True))
-            chroma_collection = chroma_client.get_or_create_collection(
-                "db_names_collection",
-                embedding_function=self.embedding_fn 
-            )
-            chroma_collection.add(
-                documents=names,
-                metadatas=[{"source": "name_list"}] * len(names),
-                ids=[str(i) for i in range(len(names))]
-            )
-            results = chroma_collection.query(
-                query_texts=[self.current_query],
-                n_results=1
-            )
-            return results['documents'][0][0] if results['documents'] and results['documents'][0] else names[0]
+            records = self.schema_cache.get().name_records
+            self.name_matcher.build(records)
+            if force:
+                self.name_index.rebuild(records)
+            else:
+                self.name_index.ensure(records)
+        except Exception as e:
+            print(f"[WARNING] Could not build name index: {str(e)}")
+
+    def invalidate_name_index(self, remove_file=False):
+        """Drop the name index; it is rebuilt on the next lookup"""
+        self.name_index.invalidate(remove_file=remove_file)
+
+    def _find_closest_name(self, names=None, query=None):
+        """Two-stage name matching: a trigram shortlist first, embeddings only to break ambiguous matches"""
+        fallback = names[0] if names else None
+        query = query or self.current_query
+        try:
+            if not self.name_matcher.is_ready() or not self.name_index.is_ready():
+                self.build_name_index()
+            shortlist = self.name_matcher.match(query, top_k=NAME_SHORTLIST_SIZE)
+            if shortlist and not self.name_matcher.is_ambiguous(shortlist):
+                return shortlist[0][0]
+            candidates = {name for name, _, _ in shortlist} if shortlist else None
+            matches = self.name_index.lookup(query, top_k=1, candidates=candidates)
+            if not matches and candidates is not None:
+                matches = self.name_index.lookup(query, top_k=1)
+            return matches[0][0] if matches else fallback
         except Exception as e:
             print(f"[WARNING] Error in _find_closest_name: {str(e)}")
-            return names[0] if names else None
+            return fallback
+
+    def resolve_villages(self, query):
+        """Villages a question clearly names (strong trigram matches only; no embedding fallback)"""
+        try:
+            if not self.name_matcher.is_ready():
+                self.build_name_index()
+            matches = self.name_matcher.match(query, top_k=NAME_SHORTLIST_SIZE)
+        except Exception as e:
+            print(f"[WARNING] Error in resolve_villages: {str(e)}")
+            return []
+        return [name for name, _, score in matches if score >= self.name_matcher.strong_score]
+
+    def closest_name(self, query):
+        """Best-matching village name for a question (None without the statistics collection)"""
+        if self.schema_cache is None:
+            return None
+        snapshot = self.schema_cache.get()
+        return self._find_closest_name(snapshot.names, query) if snapshot.names else None
+
+    def stats_tool(self):
+        """query_village_stats tool definition for the current schema, or None when MongoDB is not available"""
+        if self.schema_cache is None:
+            return None
+        snapshot = self.schema_cache.get()
+        if self._stats_tool[0] != snapshot.fingerprint:
+            self._stats_tool = (snapshot.fingerprint, build_stats_tool(snapshot.fields, snapshot.districts))
+        return self._stats_tool[1]
+
+    def refresh_schema(self):
+        """Explicitly reload the cached schema/names (e.g. after re-importing the statistics data)"""
+        if self.schema_cache is not None:
+            self.schema_cache.refresh()
 
-    def _generate_translation_prompt(self):
+    def _generate_translation_prompt(self, closest_name=None, query=None):
         """Generate the prompt for translating natural language to MongoDB query"""
-        if not self.collection:
+        if self.schema_cache is None:
             raise ValueError("MongoDB collection not available")
-        
-        names = self.collection.distinct("metadata.name")
-        closest_name = self._find_closest_name(names) if names else "unknown"
-
-        random_object = self.collection.find_one()
-        fields = self.get_field_names(random_object)
 
-        return f"""
-        Your goal is to provide me with a MongoDB query in pymongo format that can be used to retrieve data from a MongoDB collection.
-        Based on this Natural Language Query in English, Arabic or Hebrew: {self.current_query}
-        The query should select the projection of up to 10 of the most relevant fields from the following list of fields: {fields}
-        The query should be for the document with the metadata.name {closest_name}.
-        Print the query in a single line as a JSON string, with fields query and projection, without any additional text or formatting. Have _id:0 in the projection.
-        example output:
-        {{"query": {{"metadata.name": "{closest_name}"}}, "projection": {{"_id": 0, "field1": 1, "field2": 1}}}}
-        """
+        query = query or self.current_query
+        snapshot = self.schema_cache.get()
+        if closest_name is None:
+            closest_name = self._find_closest_name(snapshot.names, query) if snapshot.names else "unknown"
+        if self.query_translator is not None:
+            # flan-t5's input window is much shorter than the OpenAI prompt
+            return self.query_translator.build_prompt(query, closest_name, snapshot.fields)
+        template = self.schema_cache.get_prompt_template(snapshot)
+        return template.safe_substitute(query=query, closest_name=closest_name)
 
-    def _translate_with_openai(self, prompt):
+    def _translate_with_openai(self, prompt, priority=PRIORITY_INTERACTIVE):
         """Use OpenAI to translate natural language to MongoDB query"""
-        try:
-            response = self.openai_client.chat.completions.create(
+        def create():
+            return self.openai_client.chat.completions.create(
                 model="gpt-5-nano",
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that translates natural language to MongoDB queries."},
@@ -119,226 +301,986 @@ class MongoDBManager:
                 ],
                 max_completion_tokens=8000
             )
+        try:
+            if self.scheduler is not None:
+                response = self.scheduler.call_sync("translation", create, priority)
+            else:
+                response = create()
             return response.choices[0].message.content
         except Exception as e:
             raise Exception(f"OpenAI translation error: {str(e)}")
 
-    def _translate_to_mongo_query(self):
-        """Translate the current natural language query to a MongoDB query"""
+    def _translate_without_llm(self, query, info):
+        """Serve the translation from the query cache or the rule-based compiler.
+        Returns the query JSON, or None when the LLM translator is needed (info then holds closest_name)."""
+        if self.schema_cache is None:
+            raise ValueError("MongoDB collection not available")
+        snapshot = self.schema_cache.get()
+        info["schema_version"] = snapshot.fingerprint[:16]
+
+        cached = self.query_cache.get(query, info["schema_version"])
+        if cached is not None:
+            info["closest_name"] = cached.closest_name
+            info["translation_path"] = "cache"
+            return cached.query_json
+
+        # District totals and multi-village filters don't need a village name at all
+        compiled_query, confidence, intents = self.query_compiler.compile_aggregate(
+            query, snapshot.districts, known_fields=snapshot.fields
+        )
+        if compiled_query and confidence >= self.compiler_min_confidence and \
+                (self.rollups_available or "district" not in intents):
+            info["closest_name"] = ""
+            info["compiler_confidence"] = confidence
+            info["compiler_intents"] = intents
+            info["translation_path"] = "compiler"
+            return compiled_query
+
+        closest_name = self._find_closest_name(snapshot.names, query) if snapshot.names else "unknown"
+
+        compiled_query, confidence, intents = self.query_compiler.compile(
+            query, closest_name, known_fields=snapshot.fields
+        )
+        info["closest_name"] = closest_name
+        info["compiler_confidence"] = confidence
+        info["compiler_intents"] = intents
+        if compiled_query and confidence >= self.compiler_min_confidence:
+            info["translation_path"] = "compiler"
+            return compiled_query
+        return None
+
+    def _translate_to_mongo_query(self, info=None):
+        """Translate the current natural language query to a MongoDB query.
+        Tries the rule-based compiler first and only calls the LLM translator when its confidence is low.
+        Repeated questions are served from the translated-query cache without a name lookup or LLM call.
+        If `info` is a dict, it is filled with the translation path that served the request."""
         if not self.current_query:
             raise ValueError("No query set. Call set_query() first.")
 
-        prompt = self._generate_translation_prompt()
+        info = {} if info is None else info
+        translated_query = self._translate_without_llm(self.current_query, info)
+        if translated_query is not None:
+            return translated_query
+
+        prompt = self._generate_translation_prompt(info["closest_name"])
         
-        if self.query_translator is None:
-            if not hasattr(self, 'openai_client'):
-                raise ValueError("OpenAI client not initialized. Call initialize_query_translator() with use_openAI=True.")
-            translated_query = self._translate_with_openai(prompt)
-        else:
-            translated_query = self.query_translator(prompt, max_length=2000)
+        if self.query_translator is None and not hasattr(self, 'openai_client'):
+            raise ValueError("OpenAI client not initialized. Call initialize_query_translator() with use_openAI=True.")
+        with self.translator_breaker:
+            if self.query_translator is None:
+                translated_query = self._translate_with_openai(prompt, info.get("priority", PRIORITY_INTERACTIVE))
+            else:
+                translated_query = self.query_translator.translate(prompt)
+        info["translation_path"] = "llm"
         
         return translated_query
 
-    def _execute_query(self, query_json):
-        """Execute a MongoDB query from a JSON string"""
+    @staticmethod
+    def _parse_query_json(query_json):
+        """Parse translator output: either {"query", "projection"[, "collection"]} or {"pipeline"}"""
         try:
             query_dict = json.loads(query_json)
-            if not all(key in query_dict for key in ['query', 'projection']):
-                raise ValueError("Invalid query format. Must contain 'query' and 'projection' keys")
-            
-            results = list(self.collection.find(
-                query_dict['query'],
-                query_dict['projection']
-            ))
-            return results
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON query: {str(e)}")
+        if not isinstance(query_dict, dict):
+            raise ValueError("Invalid query format. Must be a JSON object")
+        if "pipeline" in query_dict:
+            validate_pipeline(query_dict["pipeline"])
+            return query_dict
+        if not all(key in query_dict for key in ['query', 'projection']):
+            raise ValueError("Invalid query format. Must contain 'query' and 'projection' keys, or 'pipeline'")
+        if query_dict.get("collection") not in (None, ROLLUP_COLLECTION):
+            raise ValueError(f"Unknown collection: {query_dict['collection']}")
+        validate_filter(query_dict["query"])
+        return query_dict
+
+    def _target_collection_name(self, query_dict):
+        if query_dict.get("collection") == ROLLUP_COLLECTION:
+            return ROLLUP_COLLECTION_NAME
+        return self.collection_name
+
+    def _guard_query(self, query_dict, info=None, natural_language_query=None):
+        """Check the plan, cap the result size and reject unbounded collection scans"""
+        closest_name = info.get("closest_name") if info is not None else None
+        target = self._target_collection_name(query_dict)
+        # Only the first query of a shape runs explain (and can hit a dead host)
+        breaker = nullcontext() if self.query_guard.is_cached(target, query_dict) else self.mongo_breaker
+        try:
+            with breaker:
+                guarded, plan = self.query_guard.check(target, query_dict, closest_name)
+        except QueryRejected as e:
+            if _LOGGING_ENABLED:
+                log_query_cost(natural_language_query, {"action": "rejected"}, 0.0, 0)
+            raise Exception(f"Query execution error: {str(e)}")
+        if info is not None:
+            info["query_plan"] = plan
+        return guarded, plan
+
+    def _log_cost(self, natural_language_query, plan, started, results):
+        if _LOGGING_ENABLED:
+            log_query_cost(natural_language_query, plan, (time.perf_counter() - started) * 1000, len(results))
+
+    def _find_in_snapshot(self, query_dict, info=None, natural_language_query=None):
+        """Evaluate the query against the in-memory snapshot; None means MongoDB must serve it.
+        The guard's row and projection caps apply here too."""
+        if self.stats_snapshot is None or not self.stats_snapshot.is_ready():
+            return None
+        if "pipeline" in query_dict or "collection" in query_dict:
+            return None
+        capped = self.query_guard.cap(query_dict) if self.query_guard is not None else query_dict
+        started = time.perf_counter()
+        try:
+            results = self.stats_snapshot.find(capped['query'], capped['projection'], capped.get('limit'))
+        except UnsupportedQuery:
+            return None
+        plan = {"stages": ["SNAPSHOT"], "indexes": [], "action": "snapshot"}
+        if info is not None:
+            info["execution_path"] = "snapshot"
+            info["snapshot_version"] = self.stats_snapshot.version
+            info["query_plan"] = plan
+        self._log_cost(natural_language_query, plan, started, results)
+        return results
+
+    def _execute_query(self, query_json, info=None):
+        """Execute a MongoDB query from a JSON string"""
+        query_dict = self._parse_query_json(query_json)
+        results = self._find_in_snapshot(query_dict, info, self.current_query)
+        if results is not None:
+            return results
+        if info is not None:
+            info["execution_path"] = "mongo"
+        query_dict, plan = self._guard_query(query_dict, info, self.current_query)
+        started = time.perf_counter()
+        try:
+            with self.mongo_breaker:
+                if "pipeline" in query_dict:
+                    results = list(self.collection.aggregate(query_dict['pipeline']))
+                else:
+                    results = list(self.db[self._target_collection_name(query_dict)].find(
+                        query_dict['query'],
+                        query_dict['projection']
+                    ).limit(query_dict['limit']))
+            self._log_cost(self.current_query, plan, started, results)
+            return results
+        except CircuitOpen:
+            raise
         except Exception as e:
             raise Exception(f"Query execution error: {str(e)}")
 
-    def get_documents_by_query(self, natural_language_query):
-        """Complete pipeline: translate natural language query and execute MongoDB query"""
-        if not self.mongo_client or not self.collection:
+    def _record_translation(self, natural_language_query, mongo_query, results, info):
+        """Cache a successfully executed translation and log the result"""
+        if info.get("translation_path") != "cache" and isinstance(mongo_query, str):
+            self.query_cache.put(natural_language_query, info.get("closest_name"), info.get("schema_version"),
+                                 mongo_query, info.get("translation_path"))
+        if _LOGGING_ENABLED:
+            log_mongo_query(mongo_query, results, natural_language_query, translation_path=info.get("translation_path"),
+                            execution_path=info.get("execution_path"))
+
+    def execute_stats_tool(self, arguments, natural_language_query, info=None):
+        """Run a query_village_stats call from the answer model (arguments are in the translator's JSON format)"""
+        if self.mongo_client is None or self.collection is None:
+            raise ValueError("MongoDB not available")
+        info = {} if info is None else info
+        info["translation_path"] = "tool"
+        self._set_query(natural_language_query)
+        arguments = tool_arguments(arguments)
+        results = self._execute_query(arguments, info)
+        if _LOGGING_ENABLED:
+            log_mongo_query(arguments, results, natural_language_query, translation_path="tool",
+                            execution_path=info.get("execution_path"))
+        return results
+
+    async def execute_stats_tool_async(self, arguments, natural_language_query, info=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute_stats_tool, arguments, natural_language_query, info)
+
+    def get_documents_by_query(self, natural_language_query, info=None):
+        """Complete pipeline: translate natural language query and execute MongoDB query.
+        Pass a dict as `info` to get per-request details (e.g. which translation path served it)."""
+        if self.mongo_client is None or self.collection is None:
             print("[WARNING] MongoDB not available, returning empty results")
             return []
         
+        info = {} if info is None else info
         self._set_query(natural_language_query)
-        mongo_query = self._translate_to_mongo_query()
-        results = self._execute_query(mongo_query)
+        mongo_query = self._translate_to_mongo_query(info)
+        results = self._execute_query(mongo_query, info)
+        self._record_translation(natural_language_query, mongo_query, results, info)
+        return results
+
+class AsyncMongoDBManager(MongoDBManager):
+    """MongoDBManager with a native asyncio path for the translation -> find chain.
+
+    Uses pymongo's AsyncMongoClient with its own connection pool and the async OpenAI
+    client, so a request no longer holds a default-executor thread while it waits on
+    the translator or the database. The synchronous client from MongoDBManager is kept
+    for the background schema/name-index refresh only.
+    """
+    def __init__(self, embedding_fn, mongo_uri=MONGODB_URI, database_name=DATABASE_NAME, collection_name=COLLECTION_NAME,
+                 embedding_model="", name_index_path=NAME_INDEX_PATH,
+                 max_pool_size=MONGO_MAX_POOL_SIZE, min_pool_size=MONGO_MIN_POOL_SIZE,
+                 max_idle_time_ms=MONGO_MAX_IDLE_TIME_MS, query_timeout_ms=MONGO_QUERY_TIMEOUT_MS,
+                 translation_timeout=TRANSLATION_TIMEOUT):
+        super().__init__(embedding_fn, mongo_uri, database_name, collection_name,
+                         embedding_model=embedding_model, name_index_path=name_index_path)
+        self.async_client = None
+        self.async_collection = None
+        self.async_rollup_collection = None
+        self.async_openai_client = None
+        self.query_timeout_ms = query_timeout_ms
+        self.translation_timeout = translation_timeout
+        if self.mongo_client is not None:
+            # The client connects lazily, on the event loop of its first operation
+            self.async_client = AsyncMongoClient(
+                mongo_uri,
+                maxPoolSize=max_pool_size,
+                minPoolSize=min_pool_size,
+                maxIdleTimeMS=max_idle_time_ms,
+                serverSelectionTimeoutMS=5000,
+                connectTimeoutMS=5000,
+            )
+            self.async_collection = self.async_client[database_name][collection_name]
+            self.async_rollup_collection = self.async_client[database_name][ROLLUP_COLLECTION_NAME]
+
+    def initialize_query_translator(self, use_openAI=False, openai_client=None, async_openai_client=None, scheduler=None):
+        super().initialize_query_translator(use_openAI=use_openAI, openai_client=openai_client, scheduler=scheduler)
+        self.async_openai_client = async_openai_client
+
+    async def _translate_with_openai_async(self, prompt, priority=PRIORITY_INTERACTIVE):
+        """Async variant of _translate_with_openai"""
+        def create():
+            return self.async_openai_client.chat.completions.create(
+                model="gpt-5-nano",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant that translates natural language to MongoDB queries."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_completion_tokens=8000
+            )
+        try:
+            if self.scheduler is not None:
+                response = await self.scheduler.call("translation", create, priority)
+            else:
+                response = await create()
+            return response.choices[0].message.content
+        except Exception as e:
+            raise Exception(f"OpenAI translation error: {str(e)}")
+
+    async def _translate_to_mongo_query_async(self, natural_language_query, info):
+        loop = asyncio.get_running_loop()
+        # Cache/compiler path is in-memory apart from a single query embedding on a name-index lookup
+        translated_query = await loop.run_in_executor(None, self._translate_without_llm, natural_language_query, info)
+        if translated_query is not None:
+            return translated_query
+
+        prompt = self._generate_translation_prompt(info["closest_name"], query=natural_language_query)
+        if self.query_translator is None and self.async_openai_client is None:
+            raise ValueError("OpenAI client not initialized. Call initialize_query_translator() with use_openAI=True.")
+        try:
+            with self.translator_breaker:
+                if self.query_translator is not None:
+                    translated_query = await asyncio.wait_for(self.query_translator.translate_async(prompt), self.translation_timeout)
+                else:
+                    translated_query = await asyncio.wait_for(
+                        self._translate_with_openai_async(prompt, info.get("priority", PRIORITY_INTERACTIVE)),
+                        self.translation_timeout)
+        except asyncio.CancelledError:
+            # The breaker does not count a cancellation; record_stage_timeout decides if it was a deadline
+            info["cancelled_in"] = "translator"
+            raise
+        info["translation_path"] = "llm"
+        return translated_query
+
+    async def _execute_query_async(self, query_json, info=None, natural_language_query=None):
+        """Execute a MongoDB query from a JSON string on the async client, bounded by query_timeout_ms"""
+        query_dict = self._parse_query_json(query_json)
+        results = self._find_in_snapshot(query_dict, info, natural_language_query)
+        if results is not None:
+            return results
+        if info is not None:
+            info["execution_path"] = "mongo"
+        if self.query_guard.is_cached(self._target_collection_name(query_dict), query_dict):
+            query_dict, plan = self._guard_query(query_dict, info, natural_language_query)
+        else:
+            # First query of this shape: explain runs once on the sync client
+            loop = asyncio.get_running_loop()
+            query_dict, plan = await loop.run_in_executor(None, self._guard_query, query_dict, info,
+                                                          natural_language_query)
+        started = time.perf_counter()
+        try:
+            with self.mongo_breaker:
+                if "pipeline" in query_dict:
+                    cursor = await self.async_collection.aggregate(query_dict['pipeline'], maxTimeMS=self.query_timeout_ms)
+                else:
+                    collection = self.async_rollup_collection if query_dict.get("collection") == ROLLUP_COLLECTION \
+                        else self.async_collection
+                    cursor = collection.find(query_dict['query'], query_dict['projection'])
+                    cursor = cursor.limit(query_dict['limit']).max_time_ms(self.query_timeout_ms)
+                results = await asyncio.wait_for(cursor.to_list(length=None), self.query_timeout_ms / 1000 + 1)
+            self._log_cost(natural_language_query, plan, started, results)
+            return results
+        except asyncio.CancelledError:
+            if info is not None:
+                info["cancelled_in"] = "mongo"
+            raise
+        except CircuitOpen:
+            raise
+        except asyncio.TimeoutError:
+            raise Exception(f"Query execution error: timed out after {self.query_timeout_ms} ms")
+        except Exception as e:
+            raise Exception(f"Query execution error: {str(e)}")
+
+    async def get_documents_by_query_async(self, natural_language_query, info=None):
+        """Async pipeline: translate natural language query and execute MongoDB query.
+        Cancelling the awaiting task cancels the in-flight translation / find."""
+        if self.async_collection is None:
+            print("[WARNING] MongoDB not available, returning empty results")
+            return []
+
+        info = {} if info is None else info
+        mongo_query = await self._translate_to_mongo_query_async(natural_language_query, info)
+        results = await self._execute_query_async(mongo_query, info, natural_language_query)
+        self._record_translation(natural_language_query, mongo_query, results, info)
+        return results
+
+    async def execute_stats_tool_async(self, arguments, natural_language_query, info=None):
+        """Run a query_village_stats call on the async client"""
+        if self.async_collection is None:
+            raise ValueError("MongoDB not available")
+        info = {} if info is None else info
+        info["translation_path"] = "tool"
+        arguments = tool_arguments(arguments)
+        results = await self._execute_query_async(arguments, info, natural_language_query)
         if _LOGGING_ENABLED:
-            log_mongo_query(mongo_query, results, natural_language_query)
+            log_mongo_query(arguments, results, natural_language_query, translation_path="tool",
+                            execution_path=info.get("execution_path"))
         return results
 
+    def record_stage_timeout(self, info):
+        """The stage task was cancelled at its deadline: count it against the dependency it was waiting on.
+        A call that timed out on its own (translation_timeout, query_timeout_ms) was already counted by its
+        breaker and is not counted again."""
+        breaker = {"translator": self.translator_breaker, "mongo": self.mongo_breaker}.get(info.pop("cancelled_in", None))
+        if breaker is not None:
+            breaker.record_failure()
+
+    async def close(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+
 class VectorDBManager:
     def __init__(self, embedding_fn, chroma_collection_name=CHROMA_COLLECTION_NAME, 
-                 chroma_path=CHROMA_PATH):
+                 chroma_path=CHROMA_PATH, lexical_index_path=LEXICAL_INDEX_PATH,
+                 backend=VECTOR_STORE_BACKEND, flat_index_path=FLAT_INDEX_PATH):
         # Note: No text_file_directory needed here - we only read from pre-built DB
-        self.chroma_client = chromadb.PersistentClient(path=chroma_path, settings=Settings(allow_reset=True))
-        self.chroma_collection = self.chroma_client.get_or_create_collection(
-            chroma_collection_name, 
-            embedding_function=embedding_fn
-        )
+        if backend == "flat":
+            self.store = FlatVectorStore(embedding_fn, flat_index_path, rescore_factor=FLAT_INDEX_RESCORE_FACTOR)
+        else:
+            self.store = self._open_chroma(embedding_fn, chroma_collection_name, chroma_path)
+        self.hybrid_candidates = HYBRID_CANDIDATES
+        self.rrf_k = HYBRID_RRF_K
+        self.scoped_max_distance = SCOPED_SEARCH_MAX_DISTANCE
+        self.embedding_fn = embedding_fn
+        self.context_token_budget = RETRIEVAL_TOKEN_BUDGET
+        self.max_distance = RETRIEVAL_MAX_DISTANCE
+        self.mmr_lambda = RETRIEVAL_MMR_LAMBDA
+        self.max_chunks = RETRIEVAL_MAX_CHUNKS
+        self._village_files = {}
+        self.lexical_index = BM25Index(lexical_index_path)
+        if not self.lexical_index.load():
+            print(f"[WARNING] No lexical index at {lexical_index_path}; retrieval is dense-only. Re-run vectorDB_preperation.py.")
+        # Re-running vectorDB_preperation.py rewrites the lexical index, so its mtime (with the chunk count) identifies the build
+        mtime = os.path.getmtime(lexical_index_path) if os.path.exists(lexical_index_path) else 0
+        self.build_version = f"{int(mtime)}:{self.store.count()}"
+        # Dense and lexical retrieval run side by side for every query
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
 
-    def query_text(self, query_text, n_results=5):
-        """Query the pre-built ChromaDB"""
-        results = self.chroma_collection.query(
-            query_texts=[query_text],
-            n_results=n_results
-        )
-        if _LOGGING_ENABLED:
-            docs = results.get("documents", [[]])[0] if results else []
-            metas = results.get("metadatas", [[]])[0] if results.get("metadatas") else None
-            dists = results.get("distances", [[]])[0] if results.get("distances") else None
-            log_chroma_result(query_text, docs, metas, dists)
-        return results
+    @staticmethod
+    def _open_chroma(embedding_fn, chroma_collection_name, chroma_path, manifest_path=SHARD_MANIFEST_PATH):
+        """One collection, or a fan-out store over the shard collections listed in the build manifest"""
+        manifest = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        if not manifest or not manifest.get("shard_by"):
+            return ChromaVectorStore(embedding_fn, chroma_collection_name, chroma_path)
+        collections = manifest["collections"]
+        shards = {name: ChromaVectorStore(embedding_fn, name, chroma_path) for name in collections}
+        print(f"[OK] Vector DB sharded by {manifest['shard_by']}: {len(shards)} collections")
+        return ShardedVectorStore(shards, shard_files=collections)
+
+    def build_village_file_index(self, name_records):
+        """Precompute village -> source files from the lexical index (file titles and name mentions)"""
+        self._village_files = self.lexical_index.village_groups(name_records)
+        print(f"[OK] Village file index built for {len(self._village_files)} villages")
+
+    def files_for_villages(self, villages):
+        files = set()
+        for village in villages or ():
+            files.update(self._village_files.get(village, ()))
+        return sorted(files)
+
+    def _dense_search(self, query_texts, n_results, files=None):
+        """One store call for a batch of queries sharing the same file filter"""
+        where = {"file_name": {"$in": files}} if files else None
+        return self.store.query(query_texts, n_results=n_results, where=where,
+                                include=["documents", "metadatas", "distances", "embeddings"])
+
+    @staticmethod
+    def _result_at(results, i):
+        """Single-query view (still in Chroma's nested shape) of row i of a batched result"""
+        return {key: [value[i]] for key, value in results.items()
+                if key != "included" and (isinstance(value, (list, tuple)) or hasattr(value, "shape"))}
+
+    def _fuse(self, dense, lexical_hits, n_results):
+        """Reciprocal-rank fusion of the dense result and BM25 hits, returned in Chroma's result format"""
+        dense_ids = dense.get("ids", [[]])[0] if dense else []
+        dense_docs = dense.get("documents", [[]])[0] if dense else []
+        dense_metas = (dense.get("metadatas") or [[]])[0] if dense else []
+        dense_dists = (dense.get("distances") or [[]])[0] if dense else []
+        dense_embs = dense.get("embeddings") if dense else None
+        dense_embs = dense_embs[0] if dense_embs is not None and len(dense_embs) else [None] * len(dense_ids)
+        by_id = {
+            doc_id: (dense_docs[i], dense_metas[i] if i < len(dense_metas) else None,
+                     dense_dists[i] if i < len(dense_dists) else None, dense_embs[i])
+            for i, doc_id in enumerate(dense_ids)
+        }
+        lexical_ids = [doc_id for doc_id, _ in lexical_hits]
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ids], k=self.rrf_k)[:n_results]
+
+        # Chunks only the lexical side found still need their text, metadata and embedding
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing:
+            fetched = self.store.get(missing, include=["documents", "metadatas", "embeddings"])
+            for i, doc_id in enumerate(fetched.get("ids", [])):
+                by_id[doc_id] = (fetched["documents"][i], fetched["metadatas"][i], None, fetched["embeddings"][i])
+
+        lexical_ids = set(lexical_ids)
+        ids = [doc_id for doc_id, _ in fused if doc_id in by_id]
+        return {
+            "ids": [ids],
+            "documents": [[by_id[doc_id][0] for doc_id in ids]],
+            "metadatas": [[by_id[doc_id][1] for doc_id in ids]],
+            "distances": [[by_id[doc_id][2] for doc_id in ids]],
+            "embeddings": [[by_id[doc_id][3] for doc_id in ids]],
+            "lexical": [[doc_id in lexical_ids for doc_id in ids]],
+            "scores": [[score for doc_id, score in fused if doc_id in by_id]],
+        }
+
+    def _search_batch(self, query_texts, pool_size, files=None):
+        """Candidate pools for queries sharing a file filter: one dense call for all of them, BM25 per query
+        concurrently. Hybrid when the lexical index is available, dense-only otherwise."""
+        dense_future = self._retrieval_pool.submit(self._dense_search, query_texts, pool_size, files)
+        if not self.lexical_index.is_ready():
+            dense = dense_future.result()
+            return [self._result_at(dense, i) for i in range(len(query_texts))]
+        lexical_futures = [self._retrieval_pool.submit(self.lexical_index.search, q, pool_size, files)
+                           for q in query_texts]
+        dense = dense_future.result()
+        return [self._fuse(self._result_at(dense, i), future.result(), pool_size)
+                for i, future in enumerate(lexical_futures)]
+
+    def _is_weak(self, results):
+        """Too few chunks, or none of them semantically close to the question"""
+        docs = results.get("documents", [[]])[0] if results else []
+        if len(docs) < 2:
+            return True
+        distances = [d for d in ((results.get("distances") or [[]])[0]) if d is not None]
+        return not distances or min(distances) > self.scoped_max_distance
+
+    def query_texts(self, query_texts, n_results=None, villages=None):
+        """Batched hybrid retrieval: the queries are embedded in one model call and searched with one store
+        call per distinct file filter. Returns one result per query, shaped like query_text's.
+        `villages` is an optional list (parallel to query_texts) of the villages each question names."""
+        query_texts = list(query_texts)
+        villages = villages or [None] * len(query_texts)
+        pool_size = max(n_results or 0, self.hybrid_candidates)
+        # Embeds every uncached query in one forward pass; the store's own embedding call then hits the cache
+        query_embeddings = self.embedding_fn(query_texts)
+
+        files = [self.files_for_villages(v) for v in villages]
+        results = [None] * len(query_texts)
+        groups = {}
+        for i, query_files in enumerate(files):
+            groups.setdefault(tuple(query_files), []).append(i)
+        for query_files, rows in groups.items():
+            if not query_files:
+                continue
+            pools = self._search_batch([query_texts[i] for i in rows], pool_size, list(query_files))
+            for i, pool in zip(rows, pools):
+                # Scoped results that are weak fall back to the whole collection below
+                results[i] = None if self._is_weak(pool) else pool
+
+        unscoped = [i for i, pool in enumerate(results) if pool is None]
+        if unscoped:
+            pools = self._search_batch([query_texts[i] for i in unscoped], pool_size)
+            for i, pool in zip(unscoped, pools):
+                results[i] = pool
+                files[i] = []
+
+        selected = []
+        for i, query_text in enumerate(query_texts):
+            result = select_context(
+                results[i], query_embeddings[i],
+                token_budget=self.context_token_budget,
+                max_distance=self.max_distance,
+                mmr_lambda=self.mmr_lambda,
+                max_chunks=n_results or self.max_chunks,
+            )
+            result["file_filter"] = files[i]
+            if _LOGGING_ENABLED:
+                docs = result.get("documents", [[]])[0] if result else []
+                metas = result.get("metadatas", [[]])[0] if result.get("metadatas") else None
+                dists = result.get("distances", [[]])[0] if result.get("distances") else None
+                log_chroma_result(query_text, docs, metas, dists)
+            selected.append(result)
+        return selected
+
+    def query_text(self, query_text, n_results=None, villages=None):
+        """Hybrid query: dense (Chroma) and BM25 retrieval run concurrently, fused with reciprocal-rank fusion.
+        When the question names villages, only their source files are searched unless those results are weak.
+        The pool is then merged, diversified and cut to the context token budget (at most n_results chunks)."""
+        return self.query_texts([query_text], n_results=n_results, villages=[villages])[0]
 
 class LLMChatbot:
-    def __init__(self, model_name="gpt-4o-mini", openai_api_key=OPENAI_API_KEY):  # Fixed: Changed from invalid "gpt-5-nano" to valid model
+    def __init__(self, model_name="gpt-4o-mini", openai_api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL):  # Fixed: Changed from invalid "gpt-5-nano" to valid model
         self.model_name = model_name
-        self.openai_client = OpenAI(api_key=openai_api_key)
+        # Retries are left to the scheduler (backoff with jitter, slot kept while backing off)
+        self.openai_client = OpenAI(api_key=openai_api_key, base_url=base_url, max_retries=0)
+        self.async_openai_client = AsyncOpenAI(api_key=openai_api_key, base_url=base_url, max_retries=0)
+        self.scheduler = LLMScheduler(
+            translation_concurrency=LLM_TRANSLATION_CONCURRENCY,
+            generation_concurrency=LLM_GENERATION_CONCURRENCY,
+            translation_rpm=LLM_TRANSLATION_RPM,
+            generation_rpm=LLM_GENERATION_RPM,
+            max_retries=LLM_MAX_RETRIES,
+            backoff_base=LLM_BACKOFF_BASE,
+            backoff_max=LLM_BACKOFF_MAX,
+        )
+        self.prompt_budgeter = PromptBudgeter(
+            model=model_name,
+            system_budget=PROMPT_BUDGET_SYSTEM,
+            history_budget=PROMPT_BUDGET_HISTORY,
+            statistics_budget=PROMPT_BUDGET_STATISTICS,
+            text_budget=PROMPT_BUDGET_TEXT,
+        )
 
     def set_model(self, model_name):
         self.model_name = model_name
+        self.prompt_budgeter.model = model_name
 
-    async def generate_response(self, mongo_data, chroma_data, user_query, history_summary=None, stream=False, on_token=None):
-        if _LOGGING_ENABLED:
-            log_llm_context(user_query, mongo_data, chroma_data, history_summary)
-        prompt = f"""
-        You are an AI assistant that answers questions based on the following data:
-        {history_summary if history_summary else "No previous conversation history."}
-        
-        The answer must be as detailed as possible based on the context you are provided in this prompt, and in the language you were asked in. 
-        Give less detailed answers if the question is general, or if the context does not seem related to the question.
-        DO NOT refer to the context or data, just answer the question based on them.
-        
-        If you are asked about yourself, tell the user that you are the Rahalah AI assistant, and you are here to help them with their questions.
-        
-        If the answer is not included in the provided context:
-        1. Apologize to the user in the language you were asked.
-        2. Tell them that you are an AI assistant and you are here to help them with their questions.
-        3. Ask them to ask a different question or use different wording.
-        4. Do not mention the context or the knowledge base, just say that you are an AI assistant and you are here to help them with their questions.
-        5. If you are told 'افصع', answer: يفوت وما يطلع
+    @staticmethod
+    def _messages(prompt):
+        return [
+            {"role": "system", "content": "You are a helpful AI assistant."},
+            {"role": "user", "content": prompt}
+        ]
+
+    async def _stream_chat(self, messages, user_query, on_token=None, metrics=None, tools=None, started=None,
+                           priority=PRIORITY_INTERACTIVE):
+        """Stream one completion with the async client, pushing each content token to on_token as it arrives.
+        Returns (text, tool calls); tool call deltas are assembled into {"id", "name", "arguments"} dicts.
+        A generation slot is held until the stream ends; only opening the stream is retried.
+        Cancelling the calling task closes the upstream stream (no more tokens are generated or billed)."""
+        start = started if started is not None else time.perf_counter()
+        first_token_at = None
+        tokens_list = []
+        tool_calls = {}
+        cancelled = False
+        await self.scheduler.acquire("generation", priority)
+        try:
+            stream_resp = await self.scheduler.retry("generation", lambda: self.async_openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                max_completion_tokens=8000,
+                stream=True,
+                **({"tools": tools} if tools else {})
+            ))
+        except BaseException:
+            self.scheduler.release("generation")
+            raise
+        try:
+            async for event in stream_resp:
+                if not event.choices:
+                    continue
+                delta = getattr(event.choices[0], "delta", None)
+                if delta is None:
+                    continue
+                for call in getattr(delta, "tool_calls", None) or []:
+                    entry = tool_calls.setdefault(call.index, {"id": None, "name": "", "arguments": ""})
+                    if call.id:
+                        entry["id"] = call.id
+                    if call.function is not None:
+                        if call.function.name:
+                            entry["name"] = call.function.name
+                        if call.function.arguments:
+                            entry["arguments"] += call.function.arguments
+                token = getattr(delta, "content", None)
+                if not token:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                tokens_list.append(token)
+                if on_token:
+                    if asyncio.iscoroutinefunction(on_token):
+                        await on_token(token)
+                    else:
+                        on_token(token)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            await stream_resp.close()
+            self.scheduler.release("generation")
+            ttft_ms = (first_token_at - start) * 1000 if first_token_at is not None else None
+            total_ms = (time.perf_counter() - start) * 1000
+            if metrics is not None:
+                metrics.update({"ttft_ms": ttft_ms, "generation_ms": total_ms,
+                                "completion_chunks": len(tokens_list), "cancelled": cancelled})
+            if _LOGGING_ENABLED:
+                log_stream_timing(user_query, ttft_ms, total_ms, len(tokens_list), cancelled)
+        return "".join(tokens_list), [tool_calls[i] for i in sorted(tool_calls)]
 
-        Statistics/Information Data:
-        {mongo_data}
+    async def _stream_response(self, prompt, user_query, on_token=None, metrics=None, priority=PRIORITY_INTERACTIVE):
+        """Stream the answer to a single prompt"""
+        text, _ = await self._stream_chat(self._messages(prompt), user_query, on_token, metrics, priority=priority)
+        return text
 
-        Text Data:
-        {chroma_data}
+    async def _complete_chat(self, messages, tools=None, priority=PRIORITY_INTERACTIVE):
+        """One non-streaming completion: (text, tool calls)"""
+        response = await self.scheduler.call("generation", lambda: self.async_openai_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            max_completion_tokens=8000,
+            **({"tools": tools} if tools else {})
+        ), priority)
+        message = response.choices[0].message
+        tool_calls = [{"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                      for call in (message.tool_calls or [])]
+        return message.content or "", tool_calls
 
-        Question: {user_query}
-        """
+    async def generate_response(self, mongo_data, chroma_data, user_query, history_summary=None, stream=False, on_token=None,
+                                metrics=None, priority=PRIORITY_INTERACTIVE):
+        if _LOGGING_ENABLED:
+            log_llm_context(user_query, mongo_data, chroma_data, history_summary)
+        prompt, token_counts = self.prompt_budgeter.build(mongo_data, chroma_data, user_query, history_summary)
+        if metrics is not None:
+            metrics["prompt_tokens"] = token_counts
+        if _LOGGING_ENABLED:
+            log_prompt_budget(user_query, token_counts)
         
         #print("Prompt:", prompt)
 
         try:
-            loop = asyncio.get_event_loop()
             if not stream:
-                def sync_call():
-                    response = self.openai_client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful AI assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_completion_tokens=8000
-                    )
-                    return response.choices[0].message.content
-                return await loop.run_in_executor(None, sync_call)
+                # Async client through the scheduler: no executor thread is held while waiting on OpenAI
+                text, _ = await self._complete_chat(self._messages(prompt), priority=priority)
+                return text
             else:
-                tokens_list = []
-                def sync_stream():
-                    stream_resp = self.openai_client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful AI assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_completion_tokens=8000,
-                        stream=True
-                    )
-                    for event in stream_resp:
-                        try:
-                            choice = event.choices[0]
-                            delta = getattr(choice, "delta", None)
-                            if delta is None:
-                                continue
-                            token = getattr(delta, "content", None)
-                            if token:
-                                tokens_list.append(token)
-                                print(token, end="", flush=True)
-                        except Exception:
-                            continue
-                    print("")
-                
-                await loop.run_in_executor(None, sync_stream)
-                full_text = "".join(tokens_list)
-                if on_token:
-                    for token in tokens_list:
-                        if asyncio.iscoroutinefunction(on_token):
-                            await on_token(token)
-                        else:
-                            on_token(token)
-                return full_text
+                return await self._stream_response(prompt, user_query, on_token, metrics, priority)
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    async def generate_response_with_tools(self, statistics, chroma_data, user_query, tools, run_tool, history_summary=None,
+                                           stream=False, on_token=None, metrics=None, max_tool_rounds=2,
+                                           priority=PRIORITY_INTERACTIVE):
+        """Single-call mode: the prompt carries the retrieved text and `statistics` (a note pointing at the tool),
+        and the model calls the tools only when the question needs them. `run_tool(name, arguments)` is awaited
+        for each call and returns the text handed back to the model. After max_tool_rounds the model must answer."""
+        if _LOGGING_ENABLED:
+            log_llm_context(user_query, statistics, chroma_data, history_summary)
+        prompt, token_counts = self.prompt_budgeter.build(statistics, chroma_data, user_query, history_summary)
+        if metrics is not None:
+            metrics["prompt_tokens"] = token_counts
+        if _LOGGING_ENABLED:
+            log_prompt_budget(user_query, token_counts)
+
+        messages = self._messages(prompt)
+        start = time.perf_counter()
+        answer, rounds, calls_made = [], 0, 0
+        try:
+            while True:
+                round_tools = tools if tools and rounds < max_tool_rounds else None
+                rounds += 1
+                if stream:
+                    round_metrics = {}
+                    text, tool_calls = await self._stream_chat(messages, user_query, on_token, round_metrics,
+                                                               tools=round_tools, started=start, priority=priority)
+                    if metrics is not None:
+                        # Time to first token is counted from the first round, across tool calls
+                        if metrics.get("ttft_ms") is None:
+                            metrics["ttft_ms"] = round_metrics["ttft_ms"]
+                        metrics["generation_ms"] = round_metrics["generation_ms"]
+                        metrics["completion_chunks"] = metrics.get("completion_chunks", 0) + round_metrics["completion_chunks"]
+                        metrics["cancelled"] = round_metrics["cancelled"]
+                else:
+                    text, tool_calls = await self._complete_chat(messages, round_tools, priority)
+                answer.append(text)
+                if not tool_calls:
+                    break
+                messages.append({
+                    "role": "assistant",
+                    "content": text or None,
+                    "tool_calls": [{"id": call["id"], "type": "function",
+                                    "function": {"name": call["name"], "arguments": call["arguments"]}}
+                                   for call in tool_calls],
+                })
+                for call in tool_calls:
+                    result = await run_tool(call["name"], call["arguments"])
+                    messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+                calls_made += len(tool_calls)
+            if metrics is not None:
+                metrics.update({"llm_rounds": rounds, "tool_calls": calls_made})
+            return "".join(answer)
         except Exception as e:
             return f"Error: {str(e)}"
 
 
 class RAGSystem:
-    def __init__(self, embedding_model="LaBSE"):
+    def __init__(self, embedding_model="LaBSE", pipeline_mode=PIPELINE_MODE):
         self.embedding_model = embedding_model
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=embedding_model, 
-            token=HF_TOKEN
+        self.pipeline_mode = pipeline_mode  # "two_call" or "tool" ("tools" is accepted too)
+        # One cached embedding function shared by the name index and Chroma: each text is embedded once
+        self.embedding_fn = CachedEmbeddingFunction(
+            embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=embedding_model, 
+                token=HF_TOKEN
+            ),
+            model_name=embedding_model,
+            max_size=EMBEDDING_CACHE_SIZE,
+            path=EMBEDDING_CACHE_PATH or None,
         )
-        self.mongo_manager = MongoDBManager(self.embedding_fn)
+        if MONGO_ASYNC and HAS_ASYNC_MONGO:
+            self.mongo_manager = AsyncMongoDBManager(self.embedding_fn, embedding_model=embedding_model)
+        else:
+            self.mongo_manager = MongoDBManager(self.embedding_fn, embedding_model=embedding_model)
         self.vector_db_manager = VectorDBManager(self.embedding_fn)
         self.chatbot = LLMChatbot()
-        self._query_cache = {}  # Simple dict cache
+        self.response_cache = ResponseCache(max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                                            threshold=RESPONSE_CACHE_THRESHOLD, db_path=RESPONSE_CACHE_PATH or None)
+        self.stage_deadlines = {"mongo": STAGE_DEADLINE_MONGO, "retrieval": STAGE_DEADLINE_RETRIEVAL}
+        # Concurrent identical questions (same normalized text and history) share one pipeline run
+        self._single_flight = SingleFlight()
+        # Event loop for process_query_sync, started on first use
+        self._sync_loop = None
+        self._sync_loop_lock = threading.Lock()
 
     def initialize_components(self, use_openAI=True):
-        self.mongo_manager.initialize_query_translator(use_openAI=use_openAI, openai_client=self.chatbot.openai_client)
+        if isinstance(self.mongo_manager, AsyncMongoDBManager):
+            self.mongo_manager.initialize_query_translator(use_openAI=use_openAI, openai_client=self.chatbot.openai_client,
+                                                           async_openai_client=self.chatbot.async_openai_client,
+                                                           scheduler=self.chatbot.scheduler)
+        else:
+            self.mongo_manager.initialize_query_translator(use_openAI=use_openAI, openai_client=self.chatbot.openai_client,
+                                                           scheduler=self.chatbot.scheduler)
+        if self.mongo_manager.schema_cache is not None:
+            self.mongo_manager.schema_cache.get()
+        self.mongo_manager.build_name_index()
+        self.mongo_manager.ensure_indexes()
+        if self.mongo_manager.schema_cache is not None:
+            self.vector_db_manager.build_village_file_index(self.mongo_manager.schema_cache.get().name_records)
+            self.mongo_manager.schema_cache.add_listener(
+                lambda snapshot: self.vector_db_manager.build_village_file_index(snapshot.name_records)
+            )
 
-    async def process_query(self, query, summary=None, stream=False, on_token=None):
-        """Async pipeline: translate query, run DB lookups (in parallel) and generate response."""
-        
-        # Check cache first (simple optimization for identical queries)
-        cache_key = hashlib.md5(f"{query}".encode()).hexdigest()
-        if cache_key in self._query_cache:
-            cached_response = self._query_cache[cache_key]
+    async def process_query(self, query, summary=None, stream=False, on_token=None, priority=PRIORITY_INTERACTIVE):
+        """Async pipeline: translate query, run DB lookups (in parallel) and generate response.
+        In "tool" pipeline mode the translation is folded into the answer call (see _answer_with_tools).
+        `priority` orders this request's OpenAI calls in the scheduler (interactive before batch)."""
+        response, _ = await self.process_query_with_metadata(query, summary=summary, stream=stream, on_token=on_token,
+                                                             priority=priority)
+        return response
+
+    async def process_query_with_metadata(self, query, summary=None, stream=False, on_token=None,
+                                          priority=PRIORITY_INTERACTIVE):
+        """process_query, also returning metadata about how the answer was produced: the stages that timed out,
+        failed or were skipped by an open circuit, per-stage latency, the translation path and generation timing."""
+        # Check the answer cache first: same question or a close paraphrase, in the same context
+        loop = asyncio.get_event_loop()
+        # Both can block (a cold village matcher reads Mongo and embeds every name), so keep them off the loop
+        villages, embeddings = await asyncio.gather(
+            loop.run_in_executor(None, self.mongo_manager.resolve_villages, query),
+            loop.run_in_executor(None, self.embedding_fn, [query]))
+        embedding = embeddings[0]
+        cache_key = (embedding, self.context_version(), summary_hash(summary), villages)
+        cached, similarity = self.response_cache.get(query, *cache_key)
+        if cached is not None:
             if on_token and stream:
-                # Yield cached response token-by-token
-                for token in cached_response.split():
+                # Replay the answer in the chunks it was originally streamed as
+                for token in cached.tokens:
                     if asyncio.iscoroutinefunction(on_token):
-                        await on_token(token + " ")
+                        await on_token(token)
                     else:
-                        on_token(token + " ")
-            return cached_response
+                        on_token(token)
+            metadata = self._new_metadata()
+            metadata["cache_hit"] = True
+            metadata["cache_similarity"] = round(similarity, 4)
+            return cached.response, metadata
+
+        # Identical questions already in flight: attach to that run (and its token stream) instead of starting another
+        flight_key = hashlib.sha1(f"{normalize_for_matching(query)}\x00{summary or ''}".encode("utf-8")).hexdigest()
+        (response, metadata), leader, tokens = await self._single_flight.run(
+            flight_key,
+            lambda publish: self._run_pipeline(query, summary, stream, publish if stream else None, cache_key, priority),
+            on_token if stream else None,
+        )
+        if on_token and stream and not tokens and response:
+            # Joined a non-streaming run: the whole answer arrives as one token
+            if asyncio.iscoroutinefunction(on_token):
+                await on_token(response)
+            else:
+                on_token(response)
+        return response, dict(metadata, coalesced=not leader)
+
+    def context_version(self):
+        """Cached answers are only reused with the same index build, statistics schema and answer model"""
+        schema = self.mongo_manager.schema_cache.get().fingerprint[:16] if self.mongo_manager.schema_cache is not None \
+            else "none"
+        version = f"{self.vector_db_manager.build_version}:{schema}:{self.chatbot.model_name}"
+        return hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+
+    def _new_metadata(self):
+        return {"pipeline_mode": self.pipeline_mode, "cache_hit": False, "coalesced": False, "timed_out": [],
+                "failed": {}, "circuit_open": [], "stage_ms": {}}
+
+    async def _run_pipeline(self, query, summary, stream, on_token, cache_key, priority):
+        """One pipeline run for process_query_with_metadata: (response, metadata)"""
+        metadata = self._new_metadata()
+        info, metrics = {"priority": priority, "villages": cache_key[3]}, {}
+        tokens = []
+        if on_token is not None:
+            publish = on_token
+
+            async def on_token(token):
+                # Keep the streamed chunks so a cache hit replays them with the same boundaries
+                tokens.append(token)
+                if asyncio.iscoroutinefunction(publish):
+                    await publish(token)
+                else:
+                    publish(token)
+        if self.pipeline_mode in ("tool", "tools"):
+            response = await self._answer_with_tools(query, summary, stream, on_token, info, metrics, metadata)
+        else:
+            response = await self._answer_two_call(query, summary, stream, on_token, info, metrics, metadata)
+        for key in ("translation_path", "execution_path", "closest_name", "schema_version"):
+            if key in info:
+                metadata[key] = info[key]
+        metadata["generation"] = {key: value for key, value in metrics.items() if key != "prompt_tokens"}
+        metadata["prompt_tokens"] = metrics.get("prompt_tokens")
+        if _LOGGING_ENABLED:
+            log_pipeline_metadata(query, metadata)
+
+        # Answers built from partial context, and errors, are not cached
+        degraded = metadata["timed_out"] or metadata["failed"] or metadata["circuit_open"]
+        if response and not degraded and not response.startswith("Error:"):
+            self.response_cache.put(query, *cache_key, response, tokens if stream else None)
         
+        return response, metadata
+
+    async def _await_stage(self, name, future, deadline, metadata, default, query=None):
+        """Wait for one pipeline stage up to its deadline. On a timeout, an error or an open circuit the stage is
+        recorded in metadata and `default` is returned, so the answer goes ahead with the context that did arrive."""
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(future, deadline)
+        except asyncio.TimeoutError:
+            metadata["timed_out"].append(name)
+        except CircuitOpen:
+            metadata["circuit_open"].append(name)
+        except Exception as e:
+            metadata["failed"][name] = str(e)
+            if _LOGGING_ENABLED:
+                log_error(f"{name}_stage_error", str(e), {"query": query})
+        finally:
+            # A stage can run more than once per request (one mongo lookup per tool call): add up the time
+            metadata["stage_ms"][name] = metadata["stage_ms"].get(name, 0.0) + (time.perf_counter() - started) * 1000
+        return default
+
+    async def _answer_two_call(self, query, summary, stream, on_token, info, metrics, metadata):
+        """Translate the question to a Mongo query and retrieve text in parallel, then generate the answer"""
         loop = asyncio.get_event_loop()
         
         # Run MongoDB and Chroma queries in PARALLEL instead of sequentially
-        mongo_task = loop.run_in_executor(None, self.mongo_manager.get_documents_by_query, query)
-        chroma_task = loop.run_in_executor(None, self.vector_db_manager.query_text, query)
+        if isinstance(self.mongo_manager, AsyncMongoDBManager):
+            mongo_task = asyncio.ensure_future(self.mongo_manager.get_documents_by_query_async(query, info))
+        else:
+            mongo_task = loop.run_in_executor(None, self.mongo_manager.get_documents_by_query, query, info)
+        villages = info["villages"]
+        chroma_task = loop.run_in_executor(None, lambda: self.vector_db_manager.query_text(query, villages=villages))
         
-        # Wait for both to complete
-        mongo_data, chroma_results = await asyncio.gather(mongo_task, chroma_task)
+        # Wait for both, each up to its own deadline
+        mongo_data, chroma_results = await asyncio.gather(
+            self._await_stage("mongo", mongo_task, self.stage_deadlines["mongo"], metadata, [], query),
+            self._await_stage("retrieval", chroma_task, self.stage_deadlines["retrieval"], metadata, {}, query),
+        )
+        # A sync lookup keeps running in its executor thread and records its own outcome on the breakers
+        if "mongo" in metadata["timed_out"] and isinstance(self.mongo_manager, AsyncMongoDBManager):
+            self.mongo_manager.record_stage_timeout(info)
         chroma_data = chroma_results.get("documents", [[]])[0] if chroma_results else []
         
         # Generate response
-        response = await self.chatbot.generate_response(mongo_data, chroma_data, query, summary, stream=stream, on_token=on_token)
-        
-        # Cache the response (only cache non-streaming for simplicity)
-        if not stream:
-            self._query_cache[cache_key] = response
-            # Keep cache size bounded (max 100 entries)
-            if len(self._query_cache) > 100:
-                self._query_cache.pop(next(iter(self._query_cache)))
-        
+        started = time.perf_counter()
+        response = await self.chatbot.generate_response(mongo_data, chroma_data, query, summary, stream=stream,
+                                                        on_token=on_token, metrics=metrics, priority=info["priority"])
+        metadata["stage_ms"]["generation"] = (time.perf_counter() - started) * 1000
+        return response
+
+    async def _call_stats_tool(self, name, arguments, query, info, metadata):
+        """Tool executor for the single-call mode: runs the model's query and renders the documents for it"""
+        if name != TOOL_NAME:
+            return f"Error: unknown tool {name}"
+        results = await self._await_stage("mongo", self.mongo_manager.execute_stats_tool_async(arguments, query, info),
+                                          self.stage_deadlines["mongo"], metadata, None, query)
+        if results is None:
+            if "mongo" in metadata["timed_out"] and isinstance(self.mongo_manager, AsyncMongoDBManager):
+                self.mongo_manager.record_stage_timeout(info)
+            return "Error: the statistics lookup failed or timed out; answer from the text data."
+        statistics, _, _, _ = self.chatbot.prompt_budgeter.render_statistics(results)
+        return statistics or "[]"
+
+    async def _answer_with_tools(self, query, summary, stream, on_token, info, metrics, metadata):
+        """Single-call pipeline: only text retrieval runs up front; the answer model queries MongoDB through
+        the query_village_stats tool when the question needs statistics, so other questions skip translation"""
+        loop = asyncio.get_event_loop()
+        villages = info["villages"]
+        chroma_task = loop.run_in_executor(None, lambda: self.vector_db_manager.query_text(query, villages=villages))
+        tool = self.mongo_manager.stats_tool()
+        if tool is not None:
+            info["closest_name"] = villages[0] if villages else await self._await_stage(
+                "names", loop.run_in_executor(None, self.mongo_manager.closest_name, query),
+                self.stage_deadlines["retrieval"], metadata, None, query)
+        chroma_results = await self._await_stage("retrieval", chroma_task, self.stage_deadlines["retrieval"],
+                                                 metadata, {}, query)
+        chroma_data = chroma_results.get("documents", [[]])[0] if chroma_results else []
+
+        statistics = statistics_note(info.get("closest_name")) if tool is not None else []
+        started = time.perf_counter()
+        response = await self.chatbot.generate_response_with_tools(
+            statistics, chroma_data, query,
+            tools=[tool] if tool is not None else None,
+            run_tool=lambda name, arguments: self._call_stats_tool(name, arguments, query, info, metadata),
+            history_summary=summary, stream=stream, on_token=on_token, metrics=metrics, priority=info["priority"],
+        )
+        metadata["stage_ms"]["generation"] = (time.perf_counter() - started) * 1000
         return response
 
+    def _get_sync_loop(self):
+        """One long-lived loop in a daemon thread: the async OpenAI and Mongo clients and the scheduler's
+        futures are bound to the loop they first ran on, so every sync call must reuse it"""
+        with self._sync_loop_lock:
+            if self._sync_loop is None:
+                self._sync_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._sync_loop.run_forever, name="rag-sync-loop", daemon=True).start()
+            return self._sync_loop
+
     def process_query_sync(self, query, summary=None, stream=False, on_token=None):
-        return asyncio.run(self.process_query(query, summary=summary, stream=stream, on_token=on_token))
+        future = asyncio.run_coroutine_threadsafe(
+            self.process_query(query, summary=summary, stream=stream, on_token=on_token), self._get_sync_loop())
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            future.cancel()
+            raise
 
 if __name__ == "__main__":
     rag_system = RAGSystem()
@@ -349,7 +1291,7 @@ if __name__ == "__main__":
 
     #Example: stream to console using the sync wrapper
     print("Streaming response:")
-    response = rag_system.process_query_sync(query, stream=True)
+    response = rag_system.process_query_sync(query, stream=True, on_token=lambda t: print(t, end="", flush=True))
     
     print("\nFinal response (collected):")
     print(response)
\ No newline at end of file
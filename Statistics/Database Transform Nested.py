@@ -1,6 +1,14 @@
+import os
+import sys
 import pandas as pd
 from pymongo import MongoClient
-from env import mongodb_URI
+
+# env, rollups and query_guard live at the repository root; run this from there (the data path is relative to it)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from env import MONGODB_URI, DATABASE_NAME, COLLECTION_NAME, ROLLUP_COLLECTION_NAME, VILLAGE_DATA_PATH
+from rollups import refresh_district_rollups
+from query_guard import ensure_indexes
 
 def transform_village_data(df):
     """Transform flat dataframe into nested documents with cleaned metadata"""
@@ -56,6 +64,13 @@ def transform_village_data(df):
             }
         }
         
+        # GeoJSON point for the 2dsphere index (GeoJSON order is [lon, lat])
+        if pd.notna(row["Latitude"]) and pd.notna(row["Longitude"]):
+            doc["metadata"]["location"] = {
+                "type": "Point",
+                "coordinates": [float(row["Longitude"]), float(row["Latitude"])]
+            }
+
         # Add optional fields only if they exist
         if pd.notna(row.get("No._of_Schools")):
             doc["community"] = {
@@ -73,16 +88,22 @@ def transform_village_data(df):
 # Example usage
 if __name__ == "__main__":
     # Load data
-    df = pd.read_excel('./Data/cleaned_Village_data.xlsx')
+    df = pd.read_excel(VILLAGE_DATA_PATH)
     
     # Transform data
     village_docs = transform_village_data(df)
     
     # Connect to MongoDB
-    client = MongoClient(mongodb_URI)
-    db = client['Villages']
+    client = MongoClient(MONGODB_URI)
+    db = client[DATABASE_NAME]
     
     # Insert transformed data
-    db.villageStatistics.drop()  # Clear existing data  
-    db.villageStatistics.insert_many(village_docs)
-    print(f"Successfully inserted {len(village_docs)} transformed village documents")
\ No newline at end of file
+    db[COLLECTION_NAME].drop()  # Clear existing data  
+    db[COLLECTION_NAME].insert_many(village_docs)
+    print(f"Successfully inserted {len(village_docs)} transformed village documents")
+
+    ensure_indexes(db[COLLECTION_NAME])
+
+    # Rebuild the per-district rollups the backend serves district-level questions from
+    district_count = refresh_district_rollups(db, COLLECTION_NAME, ROLLUP_COLLECTION_NAME)
+    print(f"Refreshed rollups for {district_count} districts")
\ No newline at end of file
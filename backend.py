@@ -8,6 +8,7 @@ import asyncio
 import uuid
 import os
 from RAGLLM import RAGSystem
+from llm_scheduler import PRIORITIES, PRIORITY_INTERACTIVE
 from env import CORS_ORIGINS
 
 try:
@@ -35,6 +36,7 @@ class InitializeRequest(BaseModel):
 class QueryRequest(BaseModel):
     question: str
     session_id: str  # To maintain chat history per session
+    priority: str = "interactive"  # "batch" for offline/bulk callers: their OpenAI calls queue behind interactive ones
 
 class ChatHistoryItem(BaseModel):
     question: str
@@ -103,8 +105,11 @@ async def query(request: QueryRequest):
         # Generate history summary
         history_summary = generate_history_summary(chat_history[request.session_id])
         
-        # Get response from RAG system (non-streaming)
-        response = rag_llm.process_query_sync(request.question, summary=history_summary, stream=False)
+        # Get response from RAG system (non-streaming); awaited on the app's loop so the
+        # async Mongo client's connection pool is shared across requests
+        priority = PRIORITIES.get(request.priority, PRIORITY_INTERACTIVE)
+        response, metadata = await rag_llm.process_query_with_metadata(request.question, summary=history_summary,
+                                                                      stream=False, priority=priority)
         
         # Store the interaction in history
         chat_history[request.session_id].append(
@@ -121,7 +126,8 @@ async def query(request: QueryRequest):
         
         if _LOGGING_ENABLED:
             log_response_end(request.session_id, request.question, response, success=True)
-        return {"response": response}
+        # metadata lists the stages that timed out or failed (the answer was then built from partial context)
+        return {"response": response, "metadata": metadata}
     except Exception as e:
         if _LOGGING_ENABLED:
             log_response_end(request.session_id, request.question, str(e), success=False)
@@ -141,6 +147,8 @@ async def stream_query(request: QueryRequest):
         # Generate history summary
         history_summary = generate_history_summary(chat_history.get(request.session_id, []))
         
+        priority = PRIORITIES.get(request.priority, PRIORITY_INTERACTIVE)
+
         # Queue to collect tokens
         queue: asyncio.Queue = asyncio.Queue()
         
@@ -151,7 +159,8 @@ async def stream_query(request: QueryRequest):
         async def run_query_and_close():
             """Run the async query and signal when done"""
             try:
-                full_response = await rag_llm.process_query(request.question, summary=history_summary, stream=True, on_token=on_token)
+                full_response = await rag_llm.process_query(request.question, summary=history_summary, stream=True, on_token=on_token,
+                                                            priority=priority)
                 # Store in chat history if session_id provided
                 if request.session_id:
                     chat_history[request.session_id].append(
@@ -165,6 +174,10 @@ async def stream_query(request: QueryRequest):
                         chat_history[request.session_id] = chat_history[request.session_id][-10:]
                 if _LOGGING_ENABLED:
                     log_response_end(request.session_id or "unknown", request.question, full_response, success=True)
+            except asyncio.CancelledError:
+                if _LOGGING_ENABLED:
+                    log_response_end(request.session_id or "unknown", request.question, "client disconnected", success=False)
+                raise
             except Exception as e:
                 if _LOGGING_ENABLED:
                     log_response_end(request.session_id or "unknown", request.question, str(e), success=False)
@@ -174,19 +187,24 @@ async def stream_query(request: QueryRequest):
                 await queue.put(None)  # Signal end of stream
         
         # Start background task
-        asyncio.create_task(run_query_and_close())
+        task = asyncio.create_task(run_query_and_close())
         
         async def event_generator():
             """Generate SSE events from queued tokens"""
-            while True:
-                token = await queue.get()
-                if token is None:
-                    break
-                # Send token as-is to preserve spaces and formatting
-                # Replace newlines with a special marker to preserve them in SSE
-                token_str = str(token).replace('\n', '\\n')
-                yield f"data: {token_str}\n\n"
-            yield "event: done\ndata: \n\n"
+            try:
+                while True:
+                    token = await queue.get()
+                    if token is None:
+                        break
+                    # Send token as-is to preserve spaces and formatting
+                    # Replace newlines with a special marker to preserve them in SSE
+                    token_str = str(token).replace('\n', '\\n')
+                    yield f"data: {token_str}\n\n"
+                yield "event: done\ndata: \n\n"
+            finally:
+                # Client went away before the answer finished: stop generating (closes the OpenAI stream)
+                if not task.done():
+                    task.cancel()
         
         return StreamingResponse(event_generator(), media_type="text/event-stream")
     except Exception as e:
@@ -197,6 +215,21 @@ async def get_chat_history(session_id: str):
     """Get full chat history for a session"""
     return chat_history.get(session_id, [])
 
+@app.get("/stats")
+async def get_stats():
+    """Cache and pipeline counters"""
+    return {
+        "response_cache": rag_llm.response_cache.stats(),
+        "translated_query_cache": rag_llm.mongo_manager.query_cache.stats(),
+        "embedding_cache": rag_llm.embedding_fn.stats(),
+        "single_flight": rag_llm._single_flight.stats(),
+        "llm_scheduler": rag_llm.chatbot.scheduler.stats(),
+        "circuit_breakers": {
+            breaker.name: breaker.stats()
+            for breaker in (rag_llm.mongo_manager.mongo_breaker, rag_llm.mongo_manager.translator_breaker)
+        },
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
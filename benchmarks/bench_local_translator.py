@@ -0,0 +1,97 @@
+"""
+Latency benchmark: the original fp32 text2text pipeline vs LocalQueryTranslator backends.
+
+Sequential runs measure per-request latency; the concurrent run submits all
+prompts at once to show what micro-batching buys under load.
+
+    python benchmarks/bench_local_translator.py --backends fp32 int8 onnx --runs 10
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import pipeline
+from local_translator import LocalQueryTranslator
+
+PROMPTS = [
+    'Translate this question to a MongoDB query over the villageStatistics collection. '
+    'Return JSON with "query" and "projection". Question: What was the population of {name} in 1945?',
+    'Translate this question to a MongoDB query over the villageStatistics collection. '
+    'Return JSON with "query" and "projection". Question: How many schools did {name} have?',
+    'Translate this question to a MongoDB query over the villageStatistics collection. '
+    'Return JSON with "query" and "projection". Question: How much land in {name} was irrigated?',
+]
+NAMES = ["Lifta", "Deir Yassin", "Al-Tantura", "Iqrit", "Saffuriyya"]
+
+
+def _summary(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+    print(f"{label:<28} p50={statistics.median(latencies) * 1000:8.1f} ms  "
+          f"p95={p95 * 1000:8.1f} ms  mean={statistics.mean(latencies) * 1000:8.1f} ms")
+
+
+def _prompts(runs):
+    return [PROMPTS[i % len(PROMPTS)].format(name=NAMES[i % len(NAMES)]) for i in range(runs)]
+
+
+def bench_pipeline(model_name, runs):
+    """The translator as it was: fp32 pipeline, max_length=2000"""
+    translator = pipeline("text2text-generation", model=model_name)
+    translator("warm up", max_length=16)
+    latencies = []
+    for prompt in _prompts(runs):
+        start = time.perf_counter()
+        translator(prompt, max_length=2000)
+        latencies.append(time.perf_counter() - start)
+    _summary("pipeline fp32 (baseline)", latencies)
+
+
+def bench_backend(model_name, backend, runs, concurrency):
+    start = time.perf_counter()
+    translator = LocalQueryTranslator(model_name=model_name, backend=backend)
+    translator.warm_up()
+    print(f"[{backend}] load + warm-up: {time.perf_counter() - start:.1f} s")
+
+    latencies = []
+    for prompt in _prompts(runs):
+        start = time.perf_counter()
+        translator.translate(prompt)
+        latencies.append(time.perf_counter() - start)
+    _summary(f"{translator.backend} sequential", latencies)
+
+    def timed(prompt):
+        start = time.perf_counter()
+        translator.translate(prompt)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, _prompts(runs)))
+    wall = time.perf_counter() - start
+    _summary(f"{translator.backend} x{concurrency} concurrent", latencies)
+    print(f"{'':<28} throughput={runs / wall:.2f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="google/flan-t5-large")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "onnx"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--skip-baseline", action="store_true", help="Don't run the original pipeline")
+    args = parser.parse_args()
+
+    if not args.skip_baseline:
+        bench_pipeline(args.model, args.runs)
+    for backend in args.backends:
+        bench_backend(args.model, backend, args.runs, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
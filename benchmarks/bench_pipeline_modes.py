@@ -0,0 +1,86 @@
+"""
+End-to-end latency of the two pipeline modes: "two_call" (translate, then answer)
+vs "tool" (one answer call that queries MongoDB through a tool when needed).
+
+Runs RAGSystem.process_query for every question in both modes against whatever
+OPENAI_BASE_URL points at; with benchmarks/openai_stub.py the LLM latency is
+fixed, so the difference is the round trips each mode makes:
+
+    python benchmarks/openai_stub.py --latency-ms 400 &
+    OPENAI_BASE_URL=http://127.0.0.1:8901/v1 OPENAI_API_KEY=stub \\
+        python benchmarks/bench_pipeline_modes.py --runs 3 --stream
+
+The response and translated-query caches are cleared before every call.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAGLLM import RAGSystem
+from bench_vector_store import DEFAULT_QUERIES
+
+
+def _summary(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+    print(f"{label:<24} p50={statistics.median(latencies) * 1000:8.1f} ms  "
+          f"p95={p95 * 1000:8.1f} ms  mean={statistics.mean(latencies) * 1000:8.1f} ms")
+
+
+async def _run(rag_system, queries, runs, stream):
+    totals, ttfts = [], []
+    for _ in range(runs):
+        for query in queries:
+            rag_system.response_cache.clear()
+            rag_system.mongo_manager.query_cache.clear()
+            first_token = []
+
+            def on_token(token):
+                if not first_token:
+                    first_token.append(time.perf_counter())
+
+            start = time.perf_counter()
+            await rag_system.process_query(query, stream=stream, on_token=on_token if stream else None)
+            totals.append(time.perf_counter() - start)
+            if first_token:
+                ttfts.append(first_token[0] - start)
+    return totals, ttfts
+
+
+async def _compare(rag_system, queries, args):
+    # Warm the embedding model, name index and connection pools before timing
+    await rag_system.process_query(queries[0])
+    for mode in args.modes:
+        rag_system.pipeline_mode = mode
+        totals, ttfts = await _run(rag_system, queries, args.runs, args.stream)
+        _summary(f"{mode} end-to-end", totals)
+        if ttfts:
+            _summary(f"{mode} first token", ttfts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["two_call", "tool"], choices=["two_call", "tool"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="Stream answers and report time to first token")
+    parser.add_argument("--queries", help="Text file with one question per line")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    rag_system = RAGSystem()
+    rag_system.initialize_components(use_openAI=True)
+    # One event loop for every run: the async Mongo and OpenAI clients are bound to the loop they first ran on
+    asyncio.run(_compare(rag_system, queries, args))
+
+
+if __name__ == "__main__":
+    main()
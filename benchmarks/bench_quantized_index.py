@@ -0,0 +1,77 @@
+"""
+Quantized flat index vs the float32 flat index: memory, latency and recall@k.
+
+Builds one flat index per quantization from the Chroma collection in temporary
+directories and queries each with the same (pre-computed) query embeddings.
+The unquantized float32 index is exact and serves as ground truth.
+
+    python benchmarks/bench_quantized_index.py --k 5 --queries my_questions.txt
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from chromadb.utils import embedding_functions
+from env import CHROMA_PATH, CHROMA_COLLECTION_NAME, HF_TOKEN
+from embedding_cache import CachedEmbeddingFunction
+from vector_store import FlatVectorStore, QUANTIZATIONS, read_chroma_collection, write_flat_index
+from bench_vector_store import DEFAULT_QUERIES
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    parser.add_argument("--queries", help="Text file with one question per line")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    embedding_fn = CachedEmbeddingFunction(
+        embedding_functions.SentenceTransformerEmbeddingFunction(model_name="LaBSE", token=HF_TOKEN),
+        model_name="LaBSE",
+    )
+    embedding_fn(queries)
+    ids, documents, metadatas, embeddings = read_chroma_collection(CHROMA_PATH, CHROMA_COLLECTION_NAME)
+    print(f"{len(ids)} chunks, dim={len(embeddings[0])}")
+
+    workdir = tempfile.mkdtemp(prefix="flat_bench_")
+    try:
+        truth = None
+        print(f"{'index':<10} {'memory':>10} {'disk':>10} {'p50':>9} {'max':>9} {'recall@' + str(args.k):>10}")
+        for quantization in QUANTIZATIONS:
+            index_dir = os.path.join(workdir, quantization)
+            write_flat_index(index_dir, ids, documents, metadatas, embeddings, quantization=quantization)
+            store = FlatVectorStore(embedding_fn, index_dir, rescore_factor=args.rescore_factor)
+
+            latencies, results = [], None
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                results = store.query(queries, n_results=args.k, include=["distances"])
+                latencies.append((time.perf_counter() - start) / len(queries))
+            if truth is None:
+                truth = results["ids"]
+            recall = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(results["ids"], truth)])
+            print(f"{quantization:<10} {store.memory_bytes() / 1024:>8.0f}KB {_dir_size(index_dir) / 1024:>8.0f}KB "
+                  f"{statistics.median(latencies) * 1000:>7.2f}ms {max(latencies) * 1000:>7.2f}ms {recall:>10.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
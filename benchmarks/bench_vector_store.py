@@ -0,0 +1,100 @@
+"""
+Chroma (HNSW) vs the flat NumPy index: load time, query latency and recall@k.
+
+The flat index is exact, so its top-k is the ground truth; recall@k is the
+fraction of it the HNSW search returns. Query embeddings are computed once and
+shared, so only the store's own search time is measured.
+
+    python vector_store.py --dtype float16           # export first
+    python benchmarks/bench_vector_store.py --k 5 --queries my_questions.txt
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from chromadb.utils import embedding_functions
+from env import CHROMA_PATH, CHROMA_COLLECTION_NAME, FLAT_INDEX_PATH, HF_TOKEN
+from embedding_cache import CachedEmbeddingFunction
+from vector_store import ChromaVectorStore, FlatVectorStore
+
+DEFAULT_QUERIES = [
+    "What was the population of Lifta in 1945?",
+    "اعطيني معلومات عن حياة سكان الزيب",
+    "متى تم تهجير سكان اقرث",
+    "Describe the schools in Saffuriyya before 1948",
+    "ما هي المحاصيل الزراعية في قرية دير ياسين",
+    "How did the villagers of al-Tantura leave?",
+    "قرية ميعار المهجرة",
+    "Who owned the land in the Jenin district?",
+]
+
+
+def _timed(fn, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return result, latencies
+
+
+def _report(label, latencies):
+    print(f"{label:<24} p50={statistics.median(latencies) * 1000:7.2f} ms  "
+          f"max={max(latencies) * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--queries", help="Text file with one question per line")
+    parser.add_argument("--flat-path", default=FLAT_INDEX_PATH)
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    # Embed every query once up front; both stores then hit the cache
+    embedding_fn = CachedEmbeddingFunction(
+        embedding_functions.SentenceTransformerEmbeddingFunction(model_name="LaBSE", token=HF_TOKEN),
+        model_name="LaBSE",
+    )
+    embedding_fn(queries)
+
+    start = time.perf_counter()
+    chroma = ChromaVectorStore(embedding_fn, CHROMA_COLLECTION_NAME, CHROMA_PATH)
+    chroma.count()
+    print(f"chroma load: {(time.perf_counter() - start) * 1000:.1f} ms ({chroma.count()} chunks)")
+    start = time.perf_counter()
+    flat = FlatVectorStore(embedding_fn, args.flat_path)
+    print(f"flat load:   {(time.perf_counter() - start) * 1000:.1f} ms ({flat.count()} chunks, "
+          f"{flat.vectors.dtype}, {flat.vectors.nbytes / 1024:.0f} KiB)")
+
+    chroma_lat, flat_lat, recalls = [], [], []
+    for query in queries:
+        chroma_result, latencies = _timed(lambda: chroma.query([query], n_results=args.k), args.runs)
+        chroma_lat.extend(latencies)
+        flat_result, latencies = _timed(lambda: flat.query([query], n_results=args.k), args.runs)
+        flat_lat.extend(latencies)
+        truth = set(flat_result["ids"][0])
+        recalls.append(len(truth & set(chroma_result["ids"][0])) / max(len(truth), 1))
+
+    _report("chroma query", chroma_lat)
+    _report("flat query", flat_lat)
+    print(f"chroma recall@{args.k} vs exact: {np.mean(recalls):.3f}")
+
+    _, latencies = _timed(lambda: chroma.query(queries, n_results=args.k), args.runs)
+    _report(f"chroma batch x{len(queries)}", latencies)
+    _, latencies = _timed(lambda: flat.query(queries, n_results=args.k), args.runs)
+    _report(f"flat batch x{len(queries)}", latencies)
+
+
+if __name__ == "__main__":
+    main()
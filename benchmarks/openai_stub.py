@@ -0,0 +1,160 @@
+"""
+Local OpenAI-compatible chat completions stub for latency benchmarks and offline runs.
+
+Answers /v1/chat/completions (streaming or not) with a fixed simulated latency:
+--latency-ms before the first chunk and --token-ms per streamed chunk. It plays
+each role of the pipeline:
+  - translation calls (system prompt about MongoDB queries) get a single-village
+    query for the village named in the prompt;
+  - answer calls that offer the query_village_stats tool get a tool call when
+    the question looks statistical (numbers, population, land...), and a text
+    answer otherwise; the answer after a tool round quotes the tool result;
+  - everything else gets a canned text answer.
+
+The last request bodies are kept in `recent` (and at /stub/requests) so tests
+can check what each call was given.
+
+    python benchmarks/openai_stub.py --port 8901 --latency-ms 400 --token-ms 15
+    OPENAI_BASE_URL=http://127.0.0.1:8901/v1 OPENAI_API_KEY=stub uvicorn backend:app
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STATISTICAL = re.compile(
+    r"population|inhabitants|how many|how much|number of|dunums?|area|land|percent|statistic|"
+    r"عدد|سكان|مساحة|دونم|نسبة|كم",
+    re.IGNORECASE,
+)
+VILLAGE_NAME = re.compile(r'metadata\.name"?:? ?"([^"]*)"')
+ANSWER = ("This is a stub answer from the local OpenAI-compatible server. "
+          "It stands in for the model so the pipeline can be timed without network calls.")
+
+app = FastAPI(title="OpenAI stub")
+settings = {"latency_ms": 400.0, "token_ms": 15.0, "tool_projection": True}  # False: tool calls omit projection
+counters = {"requests": 0, "tool_calls": 0, "translations": 0}
+recent = deque(maxlen=50)
+
+
+def _question(messages):
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    match = re.search(r"Question: (.*)", user)
+    return match.group(1) if match else user
+
+
+def _village(messages):
+    for message in messages:
+        match = VILLAGE_NAME.search(message.get("content") or "")
+        if match:
+            return match.group(1)
+    return ""
+
+
+def _reply(body):
+    """(text, tool calls) the stub answers with"""
+    messages = body.get("messages", [])
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    if "MongoDB" in system:
+        counters["translations"] += 1
+        query = {"query": {"metadata.name": _village(messages)}, "projection": {"_id": 0}}
+        return json.dumps(query, ensure_ascii=False), []
+    tools = [t["function"]["name"] for t in body.get("tools") or []]
+    tool_results = [m.get("content") or "" for m in messages if m.get("role") == "tool"]
+    if tool_results:
+        return ANSWER + " Statistics: " + " ".join(tool_results), []
+    if "query_village_stats" in tools and STATISTICAL.search(_question(messages)):
+        counters["tool_calls"] += 1
+        arguments = {"query": {"metadata.name": _village(messages)}}
+        if settings["tool_projection"]:
+            arguments["projection"] = {"_id": 0}
+        return "", [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                     "function": {"name": "query_village_stats",
+                                  "arguments": json.dumps(arguments, ensure_ascii=False)}}]
+    return ANSWER, []
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+
+async def _stream(completion_id, model, text, tool_calls):
+    await asyncio.sleep(settings["latency_ms"] / 1000)
+    yield f"data: {json.dumps(_chunk(completion_id, model, {'role': 'assistant', 'content': ''}))}\n\n"
+    for i, call in enumerate(tool_calls):
+        # Arguments arrive in fragments, like the real API
+        arguments = call["function"]["arguments"]
+        head = {"index": i, "id": call["id"], "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""}}
+        yield f"data: {json.dumps(_chunk(completion_id, model, {'tool_calls': [head]}))}\n\n"
+        for start in range(0, len(arguments), 16):
+            part = {"index": i, "function": {"arguments": arguments[start:start + 16]}}
+            yield f"data: {json.dumps(_chunk(completion_id, model, {'tool_calls': [part]}))}\n\n"
+    for token in re.findall(r"\S+\s*", text):
+        await asyncio.sleep(settings["token_ms"] / 1000)
+        yield f"data: {json.dumps(_chunk(completion_id, model, {'content': token}))}\n\n"
+    finish = "tool_calls" if tool_calls else "stop"
+    yield f"data: {json.dumps(_chunk(completion_id, model, {}, finish))}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+    recent.append(body)
+    model = body.get("model", "stub")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    text, tool_calls = _reply(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream(completion_id, model, text, tool_calls), media_type="text/event-stream")
+
+    tokens = len(re.findall(r"\S+\s*", text))
+    await asyncio.sleep((settings["latency_ms"] + tokens * settings["token_ms"]) / 1000)
+    message = {"role": "assistant", "content": text or None}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    """Requests served so far, to count LLM round trips per pipeline mode"""
+    return counters
+
+
+@app.get("/stub/requests")
+async def stub_requests():
+    """The most recent request bodies, oldest first"""
+    return list(recent)
+
+
+@app.post("/stub/reset")
+async def stub_reset():
+    for key in counters:
+        counters[key] = 0
+    recent.clear()
+    return counters
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Delay before the first chunk")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="Delay per streamed chunk")
+    args = parser.parse_args()
+    settings.update(latency_ms=args.latency_ms, token_ms=args.token_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
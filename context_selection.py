@@ -0,0 +1,156 @@
+"""
+Post-retrieval selection of the chunks that go into the prompt.
+
+Takes the fused candidate pool from VectorDBManager (Chroma result shape, with
+embeddings) and:
+  1. merges adjacent chunks of the same file into one passage, removing the
+     overlap the splitter added between them;
+  2. drops candidates whose distance to the question is past max_distance
+     (chunks BM25 matched are kept, they matched a name or number exactly);
+  3. orders the rest with maximal marginal relevance, so near-duplicate chunks
+     (overlaps, the same source imported twice) don't crowd out other sources;
+  4. fills a token budget in that order instead of taking a fixed count.
+"""
+import os
+import numpy as np
+from token_utils import count_tokens
+
+
+class Chunk:
+    def __init__(self, chunk_id, document, metadata, distance, embedding, lexical=False, rank=0):
+        self.ids = [chunk_id]
+        self.document = document
+        self.metadata = metadata or {}
+        self.distance = distance
+        self.embedding = embedding
+        self.lexical = lexical
+        self.rank = rank
+
+
+def _position(chunk_id):
+    """(file key, chunk index) from ids like "<file_idx>_<idx>", or None"""
+    prefix, _, idx = str(chunk_id).rpartition("_")
+    return (prefix, int(idx)) if prefix and idx.isdigit() else None
+
+
+def _split_title(document, metadata):
+    """Chunks are stored as "<file stem> - <text>"; return (title prefix, text)"""
+    file_name = (metadata or {}).get("file_name")
+    if file_name:
+        title = os.path.splitext(file_name)[0] + " - "
+        if document.startswith(title):
+            return title, document[len(title):]
+    return "", document
+
+
+def _join_overlapping(left, right, max_overlap=400):
+    for n in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:n]):
+            return left + right[n:]
+    return left + " " + right
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def chunks_from_results(results, query_embedding):
+    """Candidate chunks from a single-query result dict, filling in distances the lexical side lacks"""
+    ids = results.get("ids", [[]])[0]
+    documents = results.get("documents", [[]])[0]
+    metadatas = (results.get("metadatas") or [[]])[0]
+    distances = (results.get("distances") or [[]])[0]
+    embeddings = results.get("embeddings")
+    embeddings = embeddings[0] if embeddings is not None and len(embeddings) else [None] * len(ids)
+    lexical = (results.get("lexical") or [[]])[0]
+    chunks = []
+    for i, chunk_id in enumerate(ids):
+        embedding = np.asarray(embeddings[i], dtype=np.float32) if embeddings[i] is not None else None
+        distance = distances[i] if i < len(distances) else None
+        if distance is None and embedding is not None:
+            distance = float(np.sum((embedding - query_embedding) ** 2))
+        chunks.append(Chunk(chunk_id, documents[i], metadatas[i] if i < len(metadatas) else None, distance,
+                            embedding, lexical=bool(lexical[i]) if i < len(lexical) else False, rank=i))
+    return chunks
+
+
+def merge_adjacent(chunks):
+    """Merge runs of consecutive chunks from the same file into one passage"""
+    by_file, singles = {}, []
+    for chunk in chunks:
+        position = _position(chunk.ids[0])
+        if position is None:
+            singles.append(chunk)
+        else:
+            by_file.setdefault(position[0], []).append((position[1], chunk))
+
+    merged = list(singles)
+    for parts in by_file.values():
+        parts.sort(key=lambda p: p[0])
+        run_idx, run = parts[0]
+        for idx, chunk in parts[1:]:
+            if idx == run_idx + 1:
+                _, text = _split_title(chunk.document, chunk.metadata)
+                run.document = _join_overlapping(run.document, text)
+                run.ids.extend(chunk.ids)
+                distances = [d for d in (run.distance, chunk.distance) if d is not None]
+                run.distance = min(distances) if distances else None
+                if run.embedding is not None and chunk.embedding is not None:
+                    run.embedding = _normalize(_normalize(run.embedding) + _normalize(chunk.embedding))
+                run.lexical = run.lexical or chunk.lexical
+                run.rank = min(run.rank, chunk.rank)
+            else:
+                merged.append(run)
+                run = chunk
+            run_idx = idx
+        merged.append(run)
+    return sorted(merged, key=lambda c: c.rank)
+
+
+def mmr_order(chunks, query_embedding, mmr_lambda=0.7):
+    """Order chunks by maximal marginal relevance: relevance to the question minus redundancy with picks so far"""
+    if not chunks or query_embedding is None or any(c.embedding is None for c in chunks):
+        return list(chunks)
+    vectors = np.stack([_normalize(c.embedding) for c in chunks])
+    relevance = vectors @ _normalize(query_embedding)
+    similarity = vectors @ vectors.T
+    selected, remaining = [], list(range(len(chunks)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [chunks[i] for i in selected]
+
+
+def select_context(results, query_embedding, token_budget=1500, max_distance=None, mmr_lambda=0.7,
+                   max_chunks=None):
+    """Merge, cut off, diversify and budget a candidate pool. Returns a result dict in Chroma's shape."""
+    query_embedding = np.asarray(query_embedding, dtype=np.float32) if query_embedding is not None else None
+    chunks = merge_adjacent(chunks_from_results(results, query_embedding))
+    if max_distance is not None:
+        chunks = [c for c in chunks if c.lexical or c.distance is None or c.distance <= max_distance]
+
+    picked, used = [], 0
+    for chunk in mmr_order(chunks, query_embedding, mmr_lambda):
+        if max_chunks and len(picked) >= max_chunks:
+            break
+        tokens = count_tokens(chunk.document)
+        if picked and used + tokens > token_budget:
+            continue
+        picked.append(chunk)
+        used += tokens
+
+    return {
+        "ids": [[c.ids[0] for c in picked]],
+        "documents": [[c.document for c in picked]],
+        "metadatas": [[c.metadata for c in picked]],
+        "distances": [[c.distance for c in picked]],
+        "merged_ids": [[c.ids for c in picked]],
+        "context_tokens": used,
+    }
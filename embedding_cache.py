@@ -0,0 +1,156 @@
+"""
+Shared LRU cache in front of the sentence-transformer embedding function.
+
+A single CachedEmbeddingFunction is handed to both MongoDBManager (name index
+lookups) and VectorDBManager (Chroma queries), so a question is embedded once
+per process instead of once per consumer per request. Entries are keyed by
+(model name, whitespace/Unicode-normalized text) and stored as float32 rows.
+
+With a path, the vectors live in a memory-mapped float32 file (one row per
+slot) and the key -> slot map in a JSON sidecar, so the cache survives restarts.
+"""
+import os
+import json
+import atexit
+import hashlib
+import unicodedata
+import threading
+from collections import OrderedDict
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+
+def _cache_text(text):
+    """Cache-key normalization only: it must not change what the model would embed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, embedding_fn, model_name="", max_size=5000, path=None, flush_every=32):
+        self.embedding_fn = embedding_fn
+        self.model_name = model_name
+        self.max_size = max_size
+        self.path = path
+        self.flush_every = flush_every
+        self._slots = OrderedDict()     # key -> row in _vectors, LRU order
+        self._free = []                 # rows released by eviction
+        self._vectors = None            # (max_size, dim) float32, ndarray or memmap
+        self._dim = None
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self._load()
+            atexit.register(self.flush)
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_name}\x1f{_cache_text(text)}".encode("utf-8")).hexdigest()
+
+    def _allocate(self, dim):
+        self._dim = dim
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._vectors = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32,
+                                                      shape=(self.max_size, dim))
+        else:
+            self._vectors = np.empty((self.max_size, dim), dtype=np.float32)
+        self._free = list(range(self.max_size - 1, -1, -1))
+
+    def _load(self):
+        keys_path = self.path + ".keys.json"
+        if not (os.path.exists(self.path) and os.path.exists(keys_path)):
+            return
+        try:
+            with open(keys_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(self.path, mmap_mode="r+")
+            if meta.get("model_name") != self.model_name or vectors.shape[0] != self.max_size:
+                return
+            self._vectors, self._dim = vectors, vectors.shape[1]
+            self._slots = OrderedDict((key, row) for key, row in meta["slots"])
+            used = set(self._slots.values())
+            self._free = [row for row in range(self.max_size - 1, -1, -1) if row not in used]
+        except Exception as e:
+            print(f"[WARNING] Could not load embedding cache from {self.path}: {str(e)}")
+            self._slots, self._vectors, self._dim = OrderedDict(), None, None
+
+    def flush(self):
+        """Persist the memmap and key map (no-op without a path)"""
+        if not self.path or self._vectors is None:
+            return
+        with self._lock:
+            self._vectors.flush()
+            meta = {"model_name": self.model_name, "slots": list(self._slots.items())}
+            self._dirty = 0
+        tmp_path = self.path + ".keys.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.path + ".keys.json")
+
+    def _put(self, key, vector):
+        if self._vectors is None:
+            self._allocate(vector.shape[0])
+        if key in self._slots:
+            row = self._slots[key]
+            self._slots.move_to_end(key)
+        else:
+            if not self._free:
+                _, row = self._slots.popitem(last=False)
+                self.evictions += 1
+            else:
+                row = self._free.pop()
+            self._slots[key] = row
+        self._vectors[row] = vector
+        self._dirty += 1
+
+    def __call__(self, input):
+        """Embed a list of texts; only texts not in the cache reach the model, in one batch"""
+        keys = [self._key(text) for text in input]
+        results = [None] * len(input)
+        missing = OrderedDict()      # key -> first text with that key
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._slots.get(key)
+                if row is not None:
+                    self._slots.move_to_end(key)
+                    results[i] = np.array(self._vectors[row])
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, input[i])
+                    self.misses += 1
+        if missing:
+            computed = np.asarray(self.embedding_fn(list(missing.values())), dtype=np.float32)
+            fresh = dict(zip(missing.keys(), computed))
+            with self._lock:
+                for key, vector in fresh.items():
+                    self._put(key, vector)
+                should_flush = self.path and self._dirty >= self.flush_every
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = fresh[key].copy()
+            if should_flush:
+                self.flush()
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._slots = OrderedDict()
+            self._free = list(range(self.max_size - 1, -1, -1)) if self._vectors is not None else []
+            self._dirty += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "size": len(self._slots),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "persistent": bool(self.path),
+        }
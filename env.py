@@ -6,11 +6,106 @@ load_dotenv()
 MONGODB_URI=os.getenv("MONGODB_URI")
 DATABASE_NAME = "Villages"
 COLLECTION_NAME = "villageStatistics"
+ROLLUP_COLLECTION_NAME = "villageDistrictRollups"
 CHROMA_COLLECTION_NAME = "VillageDocuments"
 TEXT_FILE_DIRECTORY = "./Data/Documents"
 CHROMA_PATH = "./chroma_data"
+# Vector store backend: "chroma" (PersistentClient) or "flat" (exact NumPy index exported from chroma_data)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+FLAT_INDEX_PATH = os.getenv("FLAT_INDEX_PATH", "./chroma_data/flat_index")
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32")
+# Quantized flat index ("none", "int8" or "binary"); candidates are rescored on the full-precision memmap
+FLAT_INDEX_QUANTIZATION = os.getenv("FLAT_INDEX_QUANTIZATION", "none")
+FLAT_INDEX_RESCORE_FACTOR = int(os.getenv("FLAT_INDEX_RESCORE_FACTOR", "10"))
+# Shard the vector DB by "district" or "language" at build time (empty = one collection); the manifest lists the shards
+SHARD_BY = os.getenv("SHARD_BY", "")
+SHARD_MANIFEST_PATH = os.getenv("SHARD_MANIFEST_PATH", "./chroma_data/shards.json")
+VILLAGE_DATA_PATH = "./Data/cleaned_Village_data.xlsx"
+# BM25 index over the Chroma chunks (built by vectorDB_preperation.py, lives next to the Chroma data)
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./chroma_data/lexical_index.npz")
+# Hybrid retrieval: candidates taken from each retriever before reciprocal-rank fusion, and the RRF k constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Village-scoped retrieval falls back to the whole collection if no scoped chunk is within this Chroma distance
+SCOPED_SEARCH_MAX_DISTANCE = float(os.getenv("SCOPED_SEARCH_MAX_DISTANCE", "1.0"))
+# Post-retrieval selection: token budget for retrieved text, distance cutoff (squared L2), MMR trade-off, max chunks
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))
+RETRIEVAL_MAX_DISTANCE = float(os.getenv("RETRIEVAL_MAX_DISTANCE", "1.3"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+RETRIEVAL_MAX_CHUNKS = int(os.getenv("RETRIEVAL_MAX_CHUNKS", "8"))
+NAME_INDEX_PATH = os.getenv("NAME_INDEX_PATH", "./name_index/village_names.npz")
+# Trigram name matcher: shortlist size handed to the embedding re-ranker when a match is ambiguous
+NAME_SHORTLIST_SIZE = int(os.getenv("NAME_SHORTLIST_SIZE", "8"))
+# Schema/name cache for the statistics collection: TTL in seconds, and whether to follow a Mongo change stream
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "600"))
+SCHEMA_CHANGE_STREAM = os.getenv("SCHEMA_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+# Rule-based query compiler: below this confidence the LLM translator is used instead
+QUERY_COMPILER_MIN_CONFIDENCE = float(os.getenv("QUERY_COMPILER_MIN_CONFIDENCE", "0.75"))
+# Translated Mongo query cache: max entries, TTL in seconds, optional SQLite file to persist across restarts
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1000"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")
+# Semantic answer cache: max entries, TTL in seconds, cosine similarity a paraphrase needs to reuse an answer,
+# and an optional SQLite file to persist it across restarts
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+# Native async Mongo path (pymongo AsyncMongoClient): pool sizing and per-call timeouts
+MONGO_ASYNC = os.getenv("MONGO_ASYNC", "true").lower() in ("1", "true", "yes")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_QUERY_TIMEOUT_MS = int(os.getenv("MONGO_QUERY_TIMEOUT_MS", "5000"))
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", "30"))
+# Per-stage deadlines in seconds for the statistics lookup (translation + query) and the text retrieval; when one
+# passes, the answer is generated from the context that has arrived and the stage is listed in the response metadata
+STAGE_DEADLINE_MONGO = float(os.getenv("STAGE_DEADLINE_MONGO", "6"))
+STAGE_DEADLINE_RETRIEVAL = float(os.getenv("STAGE_DEADLINE_RETRIEVAL", "4"))
+# Circuit breakers for MongoDB and the query translator: consecutive failures to open, seconds before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+# Rebuild the district rollups from the backend when the statistics data changes (a $out over the whole
+# collection); off by default: the data-load script (Statistics/Database Transform Nested.py) refreshes them,
+# and the backend only builds them when the rollup collection is missing or empty
+ROLLUP_REFRESH = os.getenv("ROLLUP_REFRESH", "false").lower() in ("1", "true", "yes")
+# Serve statistics queries from an in-memory columnar snapshot (falls back to MongoDB for unsupported filters)
+STATS_SNAPSHOT = os.getenv("STATS_SNAPSHOT", "true").lower() in ("1", "true", "yes")
+# Query-plan guard: max rows returned, max collection size a full scan is tolerated on, max projected fields
+QUERY_MAX_RESULTS = int(os.getenv("QUERY_MAX_RESULTS", "50"))
+QUERY_MAX_SCAN_DOCS = int(os.getenv("QUERY_MAX_SCAN_DOCS", "1000"))
+QUERY_MAX_FIELDS = int(os.getenv("QUERY_MAX_FIELDS", "15"))
+# Local flan-t5 translator (used when use_openAI=False): backend is "int8" (torch dynamic quantization),
+# "onnx" (ONNX Runtime int8, needs optimum[onnxruntime]) or "fp32"; concurrent requests are micro-batched
+LOCAL_TRANSLATOR_MODEL = os.getenv("LOCAL_TRANSLATOR_MODEL", "google/flan-t5-large")
+LOCAL_TRANSLATOR_BACKEND = os.getenv("LOCAL_TRANSLATOR_BACKEND", "int8")
+LOCAL_TRANSLATOR_MAX_NEW_TOKENS = int(os.getenv("LOCAL_TRANSLATOR_MAX_NEW_TOKENS", "256"))
+LOCAL_TRANSLATOR_BATCH_SIZE = int(os.getenv("LOCAL_TRANSLATOR_BATCH_SIZE", "8"))
+LOCAL_TRANSLATOR_BATCH_WAIT_MS = int(os.getenv("LOCAL_TRANSLATOR_BATCH_WAIT_MS", "15"))
+# Query-embedding LRU cache shared by the name index and Chroma; optional memory-mapped .npy file to persist it
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "5000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+# Answer prompt token budgets per section (unused history/statistics budget is given to the retrieved text)
+PROMPT_BUDGET_SYSTEM = int(os.getenv("PROMPT_BUDGET_SYSTEM", "700"))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", "400"))
+PROMPT_BUDGET_STATISTICS = int(os.getenv("PROMPT_BUDGET_STATISTICS", "1200"))
+PROMPT_BUDGET_TEXT = int(os.getenv("PROMPT_BUDGET_TEXT", "2000"))
+# Outbound OpenAI scheduler: concurrent requests and requests per minute (0 = unlimited) for the translation and
+# answer-generation pools, and retries with exponential backoff + jitter on 429/5xx (base and cap in seconds)
+LLM_TRANSLATION_CONCURRENCY = int(os.getenv("LLM_TRANSLATION_CONCURRENCY", "8"))
+LLM_GENERATION_CONCURRENCY = int(os.getenv("LLM_GENERATION_CONCURRENCY", "16"))
+LLM_TRANSLATION_RPM = int(os.getenv("LLM_TRANSLATION_RPM", "0"))
+LLM_GENERATION_RPM = int(os.getenv("LLM_GENERATION_RPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Answer pipeline: "two_call" (translate to a Mongo query, then answer) or "tool"/"tools" (the answer model gets a
+# query_village_stats tool and only queries MongoDB when the question needs statistics)
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "two_call")
 HF_TOKEN=os.getenv("HF_TOKEN")
 OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")  
+# OpenAI-compatible endpoint (e.g. benchmarks/openai_stub.py); empty = api.openai.com
+OPENAI_BASE_URL=os.getenv("OPENAI_BASE_URL") or None
 BACKEND_URL=os.getenv("BACKEND_URL")
 # CORS configuration - comma-separated list of allowed origins, or "*" for all (development only)
 CORS_ORIGINS=os.getenv("CORS_ORIGINS", "http://localhost:8501,http://127.0.0.1:8501").split(",")
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+On-disk BM25 inverted index over the Chroma chunks.
+
+Built by vectorDB_preperation.DataPreparer over exactly the same chunk ids and
+texts that go into Chroma, so lexical and dense hits can be fused by id.
+Terms are normalized with normalize_for_matching() and a light Arabic prefix
+strip (ال / وال / بال ...), so spelling variants of village names, years and
+proper nouns match exactly where dense retrieval only matches loosely.
+
+The index is stored as CSR-style NumPy arrays (.npz): per-term slices of
+(doc, term frequency) postings. A search only touches the postings of the
+query's terms and scores them with vectorized NumPy operations.
+
+Each chunk also records its group (the source file name), so searches can be
+restricted to a set of files and village names can be mapped to the files that
+are about them (by file title, or by how many chunks of a file mention them).
+"""
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+
+_ARABIC_PREFIX = re.compile(r"^(وال|بال|كال|فال|لل|ال)(?=\w{2,})")
+
+
+def tokenize(text):
+    """Normalized terms of a text (Arabic-aware, article-stripped)"""
+    return [_ARABIC_PREFIX.sub("", token) for token in normalize_for_matching(text).split()]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked id lists. Returns [(id, fused score)] best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class BM25Index:
+    def __init__(self, index_path=None, k1=1.5, b=0.75):
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self._terms = {}          # term -> row in offsets
+        self._offsets = None      # (n_terms + 1,) int64, slice bounds into postings
+        self._post_docs = None    # (n_postings,) int32 doc rows
+        self._post_tf = None      # (n_postings,) float32 term frequencies
+        self._doc_len = None      # (n_docs,) float32
+        self._idf = None          # (n_terms,) float32
+        self.groups = []          # group (source file) names
+        self._doc_group = None    # (n_docs,) int32 row in groups, -1 if none
+        self._lock = threading.Lock()
+
+    def is_ready(self):
+        return self._offsets is not None and len(self.ids) > 0
+
+    def build(self, ids, documents, groups=None):
+        """Index documents (parallel to ids); groups optionally gives each document's source file"""
+        postings = defaultdict(list)
+        doc_len = np.zeros(len(documents), dtype=np.float32)
+        for row, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            doc_len[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((row, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        post_docs = np.empty(offsets[-1], dtype=np.int32)
+        post_tf = np.empty(offsets[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            rows = postings[term]
+            post_docs[offsets[i]:offsets[i + 1]] = [r for r, _ in rows]
+            post_tf[offsets[i]:offsets[i + 1]] = [tf for _, tf in rows]
+
+        group_names = sorted(set(groups)) if groups else []
+        group_rows = {group: i for i, group in enumerate(group_names)}
+        doc_group = np.array([group_rows[g] for g in groups] if groups else [-1] * len(documents), dtype=np.int32)
+        self._set(list(ids), terms, offsets, post_docs, post_tf, doc_len, group_names, doc_group)
+
+    def _set(self, ids, terms, offsets, post_docs, post_tf, doc_len, group_names, doc_group):
+        n_docs = max(len(ids), 1)
+        df = np.diff(offsets).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        with self._lock:
+            self.ids = ids
+            self._terms = {term: i for i, term in enumerate(terms)}
+            self._offsets = offsets
+            self._post_docs = post_docs
+            self._post_tf = post_tf
+            self._doc_len = doc_len
+            self._idf = idf
+            self.groups = group_names
+            self._doc_group = doc_group
+
+    def save(self, index_path=None):
+        index_path = index_path or self.index_path
+        if not index_path or not self.is_ready():
+            return
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        terms = sorted(self._terms, key=self._terms.get)
+        tmp_path = index_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=np.array(self.ids, dtype=str),
+            terms=np.array(terms, dtype=str),
+            offsets=self._offsets,
+            post_docs=self._post_docs,
+            post_tf=self._post_tf,
+            doc_len=self._doc_len,
+            groups=np.array(self.groups, dtype=str),
+            doc_group=self._doc_group,
+        )
+        os.replace(tmp_path, index_path)
+
+    def load(self, index_path=None):
+        """Load the persisted index. Returns True on success."""
+        index_path = index_path or self.index_path
+        if not index_path or not os.path.exists(index_path):
+            return False
+        try:
+            data = np.load(index_path, allow_pickle=False)
+            self._set(data["ids"].tolist(), data["terms"].tolist(), data["offsets"],
+                      data["post_docs"], data["post_tf"], data["doc_len"],
+                      data["groups"].tolist(), data["doc_group"])
+            return True
+        except Exception as e:
+            print(f"[WARNING] Could not load lexical index from {index_path}: {str(e)}")
+            return False
+
+    def _group_mask(self, groups):
+        rows = [i for i, group in enumerate(self.groups) if group in groups]
+        return np.isin(self._doc_group, rows)
+
+    def search(self, query, top_k=20, groups=None):
+        """Return up to top_k (chunk_id, bm25 score) tuples, best first.
+        `groups` restricts the search to chunks of those source files."""
+        if not self.is_ready() or not query:
+            return []
+        with self._lock:
+            terms, offsets, post_docs, post_tf = self._terms, self._offsets, self._post_docs, self._post_tf
+            doc_len, idf, ids = self._doc_len, self._idf, self.ids
+            mask = self._group_mask(groups) if groups else None
+        scores = np.zeros(len(ids), dtype=np.float32)
+        avg_len = float(doc_len.mean()) or 1.0
+        for term in set(tokenize(query)):
+            i = terms.get(term)
+            if i is None:
+                continue
+            rows = post_docs[offsets[i]:offsets[i + 1]]
+            tf = post_tf[offsets[i]:offsets[i + 1]]
+            norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / avg_len)
+            scores[rows] += idf[i] * tf * (self.k1 + 1) / (tf + norm)
+        if mask is not None:
+            scores[~mask] = 0
+        matched = np.flatnonzero(scores)
+        if matched.size == 0:
+            return []
+        if matched.size > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(ids[row], float(scores[row])) for row in matched]
+
+    def _rows_with_all(self, tokens):
+        """Document rows containing every token"""
+        rows = None
+        for token in tokens:
+            i = self._terms.get(token)
+            if i is None:
+                return np.empty(0, dtype=np.int32)
+            postings = self._post_docs[self._offsets[i]:self._offsets[i + 1]]
+            rows = postings if rows is None else np.intersect1d(rows, postings, assume_unique=True)
+        return rows if rows is not None else np.empty(0, dtype=np.int32)
+
+    def village_groups(self, name_records, min_mentions=3):
+        """Map each village (name, alt_names) to the source files about it: files whose title contains
+        one of its names, or with at least min_mentions chunks mentioning one of them"""
+        if not self.is_ready() or not self.groups:
+            return {}
+        titles = [" " + " ".join(tokenize(os.path.splitext(group)[0])) + " " for group in self.groups]
+        village_files = {}
+        with self._lock:
+            for name, alt_names in name_records:
+                if not name:
+                    continue
+                files = set()
+                for label in [name] + [a for a in (alt_names or []) if a]:
+                    tokens = tokenize(label)
+                    if not tokens:
+                        continue
+                    phrase = " " + " ".join(tokens) + " "
+                    files.update(self.groups[i] for i, title in enumerate(titles) if phrase in title)
+                    group_rows = self._doc_group[self._rows_with_all(tokens)]
+                    counts = np.bincount(group_rows[group_rows >= 0], minlength=len(self.groups))
+                    files.update(self.groups[i] for i in np.flatnonzero(counts >= min_mentions))
+                if files:
+                    village_files[name] = sorted(files)
+        return village_files
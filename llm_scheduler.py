@@ -0,0 +1,243 @@
+"""
+Outbound scheduler for OpenAI calls.
+
+Each pool ("translation", "generation") has its own concurrency limit and
+token bucket (requests per minute), so a burst of answers cannot starve query
+translation or the other way round. Callers waiting for a slot are served by
+priority (interactive before batch), then in arrival order. Calls that fail
+with 429, a 5xx or a connection error are retried with exponential backoff and
+full jitter, honouring Retry-After; the slot is kept while backing off, so a
+rate-limited pool slows down instead of piling more requests on the provider.
+
+Both the event loop and executor threads (the synchronous translator path) use
+the same pools: async callers wait on a future, threads on an event.
+"""
+import time
+import heapq
+import random
+import asyncio
+import threading
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from openai import APIConnectionError
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0  # tokens per second; 0 = unlimited
+        self.capacity = burst or max(1.0, self.rate * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token; returns the seconds to wait before using it (the balance goes negative under load)"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "event", "enqueued_at", "granted", "cancelled")
+
+    def __init__(self, future=None, loop=None, event=None):
+        self.future = future
+        self.loop = loop
+        self.event = event
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class _Pool:
+    def __init__(self, name, concurrency, rate_per_minute):
+        self.name = name
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate_per_minute)
+        self.in_flight = 0
+        self.queue = []  # heap of (priority, seq, waiter)
+        self.waits_ms = deque(maxlen=1000)
+        self.counters = {"granted": 0, "retries": 0, "rate_limited": 0, "errors": 0}
+
+
+class LLMScheduler:
+    def __init__(self, translation_concurrency=8, generation_concurrency=16, translation_rpm=0, generation_rpm=0,
+                 max_retries=4, backoff_base=0.5, backoff_max=20.0):
+        self.pools = {
+            "translation": _Pool("translation", translation_concurrency, translation_rpm),
+            "generation": _Pool("generation", generation_concurrency, generation_rpm),
+        }
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _enqueue_or_grant(self, pool, priority, waiter):
+        """True if a slot was free and taken right away; otherwise the waiter is queued"""
+        with self._lock:
+            if pool.in_flight < pool.concurrency and not pool.queue:
+                pool.in_flight += 1
+                self._granted(pool, waiter)
+                return True
+            heapq.heappush(pool.queue, (priority, next(self._seq), waiter))
+            return False
+
+    def _granted(self, pool, waiter):
+        waiter.granted = True
+        pool.counters["granted"] += 1
+        pool.waits_ms.append((time.perf_counter() - waiter.enqueued_at) * 1000)
+
+    def release(self, pool_name):
+        """Hand the slot to the next waiter by priority, or free it"""
+        pool = self.pools[pool_name]
+        with self._lock:
+            while pool.queue:
+                _, _, waiter = heapq.heappop(pool.queue)
+                if not waiter.cancelled:
+                    self._granted(pool, waiter)
+                    break
+            else:
+                pool.in_flight -= 1
+                return
+        waiter.wake()
+
+    async def acquire(self, pool_name, priority=PRIORITY_INTERACTIVE):
+        pool = self.pools[pool_name]
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(future=loop.create_future(), loop=loop)
+        if self._enqueue_or_grant(pool, priority, waiter):
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = not waiter.granted
+            if waiter.granted:
+                # The slot was handed over just as the caller went away: pass it on
+                self.release(pool_name)
+            raise
+
+    def acquire_sync(self, pool_name, priority=PRIORITY_INTERACTIVE):
+        pool = self.pools[pool_name]
+        waiter = _Waiter(event=threading.Event())
+        if not self._enqueue_or_grant(pool, priority, waiter):
+            waiter.event.wait()
+
+    @asynccontextmanager
+    async def slot(self, pool_name, priority=PRIORITY_INTERACTIVE):
+        """Hold one of the pool's slots, e.g. for the whole length of a streamed answer"""
+        await self.acquire(pool_name, priority)
+        try:
+            yield
+        finally:
+            self.release(pool_name)
+
+    @contextmanager
+    def slot_sync(self, pool_name, priority=PRIORITY_INTERACTIVE):
+        self.acquire_sync(pool_name, priority)
+        try:
+            yield
+        finally:
+            self.release(pool_name)
+
+    def _retry_delay(self, pool, error, attempt):
+        """Seconds to back off before the next attempt, or None if the error is not worth retrying"""
+        status = getattr(error, "status_code", None)
+        if not (status == 429 or (status is not None and status >= 500) or isinstance(error, APIConnectionError)):
+            return None
+        if attempt >= self.max_retries:
+            return None
+        with self._lock:
+            pool.counters["retries"] += 1
+            if status == 429:
+                pool.counters["rate_limited"] += 1
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        try:
+            retry_after = float(response.headers.get("retry-after")) if response is not None else 0.0
+        except (TypeError, ValueError):
+            retry_after = 0.0
+        return max(delay, min(retry_after, self.backoff_max))
+
+    def _failed(self, pool):
+        with self._lock:
+            pool.counters["errors"] += 1
+
+    async def retry(self, pool_name, make_call):
+        """Await make_call() (a fresh request each attempt) within the pool's rate limit, retrying transient errors.
+        The caller must already hold a slot."""
+        pool = self.pools[pool_name]
+        attempt = 0
+        while True:
+            wait = pool.bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await make_call()
+            except Exception as e:
+                delay = self._retry_delay(pool, e, attempt)
+                if delay is None:
+                    self._failed(pool)
+                    raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def retry_sync(self, pool_name, make_call):
+        pool = self.pools[pool_name]
+        attempt = 0
+        while True:
+            wait = pool.bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return make_call()
+            except Exception as e:
+                delay = self._retry_delay(pool, e, attempt)
+                if delay is None:
+                    self._failed(pool)
+                    raise
+            attempt += 1
+            time.sleep(delay)
+
+    async def call(self, pool_name, make_call, priority=PRIORITY_INTERACTIVE):
+        """One scheduled request: wait for a slot by priority, then run it with rate limiting and retries"""
+        async with self.slot(pool_name, priority):
+            return await self.retry(pool_name, make_call)
+
+    def call_sync(self, pool_name, make_call, priority=PRIORITY_INTERACTIVE):
+        with self.slot_sync(pool_name, priority):
+            return self.retry_sync(pool_name, make_call)
+
+    def stats(self):
+        result = {}
+        with self._lock:
+            for name, pool in self.pools.items():
+                waits = sorted(pool.waits_ms)
+                result[name] = {
+                    "concurrency": pool.concurrency,
+                    "in_flight": pool.in_flight,
+                    "queue_depth": sum(1 for _, _, waiter in pool.queue if not waiter.cancelled),
+                    "wait_ms_p50": round(waits[len(waits) // 2], 2) if waits else 0.0,
+                    "wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0,
+                    "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+                    **pool.counters,
+                }
+        return result
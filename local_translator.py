@@ -0,0 +1,193 @@
+"""
+CPU-optimized local backend for the NL -> MongoDB query translator (flan-t5).
+
+Backends:
+  - "int8": PyTorch dynamic quantization of the Linear layers (qint8), no extra deps.
+  - "onnx": ONNX Runtime export via optimum, dynamically quantized to int8 (optional dependency).
+  - "fp32": the unquantized model, kept as the baseline for benchmarks.
+
+Requests are micro-batched: concurrent translations that arrive within
+`max_wait_ms` of each other are padded into one generate() call. The model is
+warmed up at startup so the first user request doesn't pay for lazy init.
+
+The OpenAI translation prompt (field list, district rollups, pipelines) is far
+longer than flan-t5's input window, and right-truncating it cut off the
+question. build_prompt() renders a short prompt instead: instructions and the
+question first, then as many field names as still fit in max_input_tokens.
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+from string import Template
+from concurrent.futures import Future
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+
+try:
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    HAS_ONNX = True
+except ImportError:
+    HAS_ONNX = False
+
+WARMUP_PROMPT = 'Translate to a MongoDB query: population of Lifta. {"query": {"metadata.name": "Lifta"}}'
+
+# Question and instructions come before the field list, which is the part that gets shortened
+LOCAL_TRANSLATION_PROMPT = Template(
+    'Translate the question into a MongoDB query. Output one line of JSON with "query" and "projection"; '
+    'put "_id": 0 and up to 10 relevant fields in the projection.\n'
+    'Question: $query\n'
+    'Village (metadata.name): $closest_name\n'
+    'Example: {"query": {"metadata.name": "$closest_name"}, "projection": {"_id": 0, "field1": 1, "field2": 1}}\n'
+    'Fields: '
+)
+
+
+class LocalQueryTranslator:
+    def __init__(self, model_name="google/flan-t5-large", backend="int8", max_new_tokens=256,
+                 max_input_tokens=1024, max_batch_size=8, max_wait_ms=15, num_threads=None,
+                 onnx_dir="./onnx_models"):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_new_tokens = max_new_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.onnx_dir = onnx_dir
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = self._load_model()
+        self._field_tokens = {}  # field name -> token count in the prompt's field list
+        self.truncated_inputs = 0
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._batch_loop, daemon=True)
+        self._worker.start()
+
+    def _load_model(self):
+        if self.backend == "onnx":
+            if not HAS_ONNX:
+                print("[WARNING] optimum[onnxruntime] not installed, falling back to int8 PyTorch backend")
+                self.backend = "int8"
+            else:
+                return self._load_onnx()
+        model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+        model.eval()
+        if self.backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self):
+        """Export once to onnx_dir, quantize the exported graphs to int8, and load with ONNX Runtime"""
+        export_dir = os.path.join(self.onnx_dir, self.model_name.replace("/", "__"))
+        quantized_dir = export_dir + "-int8"
+        if not os.path.isdir(quantized_dir):
+            model = ORTModelForSeq2SeqLM.from_pretrained(self.model_name, export=True)
+            model.save_pretrained(export_dir)
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            for file_name in os.listdir(export_dir):
+                if file_name.endswith(".onnx"):
+                    quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=file_name)
+                    quantizer.quantize(save_dir=quantized_dir, quantization_config=config)
+            self.tokenizer.save_pretrained(quantized_dir)
+        return ORTModelForSeq2SeqLM.from_pretrained(
+            quantized_dir,
+            encoder_file_name="encoder_model_quantized.onnx",
+            decoder_file_name="decoder_model_quantized.onnx",
+            decoder_with_past_file_name="decoder_with_past_model_quantized.onnx",
+        )
+
+    def warm_up(self):
+        """Run one translation so weights, kernels and thread pools are initialized before traffic"""
+        self.translate(WARMUP_PROMPT)
+
+    def _token_count(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def build_prompt(self, query, closest_name, fields):
+        """Translation prompt that fits max_input_tokens: the field list is cut short, never the question"""
+        head = LOCAL_TRANSLATION_PROMPT.safe_substitute(query=query, closest_name=closest_name)
+        budget = self.max_input_tokens - self._token_count(head) - 1  # 1 for the end-of-sequence token
+        kept = []
+        for field in fields:
+            tokens = self._field_tokens.get(field)
+            if tokens is None:
+                tokens = self._token_count(field + ", ")
+                self._field_tokens[field] = tokens
+            if tokens > budget:
+                break
+            kept.append(field)
+            budget -= tokens
+        return head + ", ".join(kept)
+
+    def _generate(self, prompts, max_new_tokens):
+        lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        truncated = sum(1 for length in lengths if length > self.max_input_tokens)
+        if truncated:
+            self.truncated_inputs += truncated
+            print(f"[WARNING] Local translator input truncated to {self.max_input_tokens} tokens "
+                  f"({max(lengths)} tokens in the longest prompt)")
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                max_length=self.max_input_tokens)
+        with torch.inference_mode():
+            output_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens, num_beams=1, do_sample=False)
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Callers that gave up while queued (a translation timeout or stage deadline) have cancelled their
+            # future; drop them. The rest are marked running, so they can no longer be cancelled under us.
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            prompts = [prompt for prompt, _, _ in batch]
+            max_new_tokens = max(tokens for _, tokens, _ in batch)
+            try:
+                outputs = self._generate(prompts, max_new_tokens)
+            except Exception as e:
+                for _, _, future in batch:
+                    self._resolve(future, exception=e)
+                continue
+            for (_, _, future), output in zip(batch, outputs):
+                self._resolve(future, result=output)
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        """Complete one caller's future; a failure here must never stop the worker thread"""
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except Exception as e:
+            print(f"[WARNING] Local translator could not deliver a result: {str(e)}")
+
+    def submit(self, prompt, max_new_tokens=None):
+        """Queue a prompt for the next micro-batch; returns a concurrent.futures.Future"""
+        future = Future()
+        self._requests.put((prompt, min(max_new_tokens or self.max_new_tokens, self.max_new_tokens), future))
+        return future
+
+    def translate(self, prompt, max_new_tokens=None):
+        return self.submit(prompt, max_new_tokens).result()
+
+    async def translate_async(self, prompt, max_new_tokens=None):
+        return await asyncio.wrap_future(self.submit(prompt, max_new_tokens))
+
+    def __call__(self, prompt, max_length=None):
+        """Drop-in for the old text2text pipeline call; returns the generated text"""
+        return self.translate(prompt, max_new_tokens=max_length)
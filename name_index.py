@@ -0,0 +1,160 @@
+"""
+Precomputed embedding index over village names and alternative names.
+
+Vectors are L2-normalized and kept in a single NumPy matrix, so a lookup is one
+embedding call plus one matrix-vector product. The index is persisted to disk
+and only rebuilt when the underlying name list changes.
+"""
+import os
+import hashlib
+import threading
+import numpy as np
+
+
+class NameIndex:
+    def __init__(self, embedding_fn, index_path, model_name="", bulk_embedding_fn=None):
+        self.embedding_fn = embedding_fn
+        self.bulk_embedding_fn = bulk_embedding_fn or embedding_fn  # used for rebuilds only
+        self.index_path = index_path
+        self.model_name = model_name
+        self.vectors = None      # (n, dim) float32, L2-normalized
+        self.labels = []         # surface form that was embedded (name or alt name)
+        self.canonical = []      # metadata.name each row resolves to
+        self.fingerprint = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def _expand(records):
+        """Turn (name, alt_names) records into parallel label/canonical lists"""
+        labels, canonical = [], []
+        seen = set()
+        for name, alt_names in records:
+            if not name:
+                continue
+            for label in [name] + [a for a in (alt_names or []) if a]:
+                key = (label, name)
+                if key in seen:
+                    continue
+                seen.add(key)
+                labels.append(label)
+                canonical.append(name)
+        return labels, canonical
+
+    def compute_fingerprint(self, records):
+        labels, canonical = self._expand(records)
+        digest = hashlib.sha1(self.model_name.encode("utf-8"))
+        for label, name in zip(labels, canonical):
+            digest.update(f"{label}\x1f{name}\x1e".encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_ready(self):
+        return self.vectors is not None and len(self.labels) > 0
+
+    def load(self):
+        """Load the persisted index from disk. Returns True on success."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            data = np.load(self.index_path, allow_pickle=False)
+            with self._lock:
+                self.vectors = data["vectors"].astype(np.float32, copy=False)
+                self.labels = data["labels"].tolist()
+                self.canonical = data["canonical"].tolist()
+                self.fingerprint = str(data["fingerprint"])
+            return True
+        except Exception as e:
+            print(f"[WARNING] Could not load name index from {self.index_path}: {str(e)}")
+            return False
+
+    def save(self):
+        if not self.index_path or not self.is_ready():
+            return
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.index_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=self.vectors,
+            labels=np.array(self.labels, dtype=str),
+            canonical=np.array(self.canonical, dtype=str),
+            fingerprint=np.array(self.fingerprint),
+        )
+        os.replace(tmp_path, self.index_path)
+
+    def rebuild(self, records):
+        """Embed all names and alt names and persist the result"""
+        labels, canonical = self._expand(records)
+        if not labels:
+            self.invalidate()
+            return
+        vectors = self._normalize(self.bulk_embedding_fn(labels))
+        with self._lock:
+            self.vectors = vectors
+            self.labels = labels
+            self.canonical = canonical
+            self.fingerprint = self.compute_fingerprint(records)
+        self.save()
+        print(f"[OK] Name index built with {len(labels)} entries")
+
+    def ensure(self, records):
+        """Load from disk or rebuild if the persisted index is stale for these records"""
+        fingerprint = self.compute_fingerprint(records)
+        if self.is_ready() and self.fingerprint == fingerprint:
+            return
+        if self.load() and self.fingerprint == fingerprint:
+            return
+        self.rebuild(records)
+
+    def invalidate(self, remove_file=False):
+        """Drop the in-memory index (and optionally the persisted copy)"""
+        with self._lock:
+            self.vectors = None
+            self.labels = []
+            self.canonical = []
+            self.fingerprint = None
+        if remove_file and self.index_path and os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def lookup(self, text, top_k=1, candidates=None):
+        """Return up to top_k (canonical_name, matched_label, score) tuples, best first.
+        Each canonical name appears at most once (its best-scoring label wins).
+        `candidates` restricts the search to those canonical names (e.g. a trigram shortlist)."""
+        if not self.is_ready() or not text:
+            return []
+        with self._lock:
+            vectors, labels, canonical = self.vectors, self.labels, self.canonical
+        if candidates is not None:
+            rows = [i for i, name in enumerate(canonical) if name in candidates]
+            if not rows:
+                return []
+            vectors = vectors[rows]
+            labels = [labels[i] for i in rows]
+            canonical = [canonical[i] for i in rows]
+        query_vec = self._normalize(self.embedding_fn([text]))[0]
+        scores = vectors @ query_vec
+        # Over-fetch a little so alt names of the same village don't crowd out the top_k
+        k = min(top_k * 4, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        results, seen = [], set()
+        for i in top:
+            if canonical[i] in seen:
+                continue
+            seen.add(canonical[i])
+            results.append((canonical[i], labels[i], float(scores[i])))
+            if len(results) >= top_k:
+                break
+        return results
@@ -0,0 +1,94 @@
+"""
+Character-trigram inverted index over village names and alternative names.
+
+Names and queries are normalized with the Arabic-aware normalize_for_matching()
+(tashkeel, tatweel, alef/hamza/teh-marbuta folding) so transliterations such as
+"اقرت" / "اقرث" / "إقرث" share most of their trigrams. A lookup only touches the
+postings of the query's trigrams and returns a scored shortlist in microseconds;
+embeddings are only needed to re-rank the shortlist when the match is ambiguous.
+"""
+import re
+import threading
+from collections import defaultdict
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+
+_ARTICLE = re.compile(r"^(al|el|ال)\s*")
+
+
+def _trigrams(text):
+    """Padded character trigrams of each word"""
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _label_forms(label):
+    """Normalized label plus the form without a leading definite article ("al-", "el-", "ال")"""
+    normalized = normalize_for_matching(label)
+    forms = {normalized}
+    stripped = _ARTICLE.sub("", normalized)
+    if stripped:
+        forms.add(stripped)
+    return forms
+
+
+class TrigramNameMatcher:
+    def __init__(self, strong_score=0.8, ambiguity_margin=0.1):
+        self.strong_score = strong_score
+        self.ambiguity_margin = ambiguity_margin
+        self._postings = {}     # trigram -> list of entry ids
+        self._entries = []      # (canonical, label, trigram count)
+        self._lock = threading.Lock()
+
+    def is_ready(self):
+        return bool(self._entries)
+
+    def build(self, records):
+        """Index (name, alt_names) records"""
+        postings = defaultdict(list)
+        entries = []
+        for name, alt_names in records:
+            if not name:
+                continue
+            for label in [name] + [a for a in (alt_names or []) if a]:
+                for form in _label_forms(label):
+                    grams = _trigrams(form)
+                    if not grams:
+                        continue
+                    entry_id = len(entries)
+                    entries.append((name, label, len(grams)))
+                    for gram in grams:
+                        postings[gram].append(entry_id)
+        with self._lock:
+            self._postings = dict(postings)
+            self._entries = entries
+
+    def match(self, text, top_k=5):
+        """Return up to top_k (canonical_name, matched_label, score) tuples, best first.
+        score is the fraction of the name's trigrams found in the text (1.0 = name fully contained)."""
+        if not text or not self._entries:
+            return []
+        with self._lock:
+            postings, entries = self._postings, self._entries
+        hits = defaultdict(int)
+        for gram in _trigrams(normalize_for_matching(text)):
+            for entry_id in postings.get(gram, ()):
+                hits[entry_id] += 1
+        best = {}
+        for entry_id, count in hits.items():
+            name, label, total = entries[entry_id]
+            score = count / total
+            if name not in best or score > best[name][2]:
+                best[name] = (name, label, score)
+        return sorted(best.values(), key=lambda r: -r[2])[:top_k]
+
+    def is_ambiguous(self, matches):
+        """True when the shortlist has no clear winner and should be re-ranked with embeddings"""
+        if not matches:
+            return True
+        if matches[0][2] < self.strong_score:
+            return True
+        return len(matches) > 1 and matches[1][2] >= matches[0][2] - self.ambiguity_margin
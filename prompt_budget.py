@@ -0,0 +1,158 @@
+"""
+Token-budgeted prompt assembly for LLMChatbot.generate_response.
+
+The prompt has four sections, each with its own token budget for the target
+model: system (the fixed instructions and the question), history (the chat
+summary), statistics (the MongoDB results) and text (the retrieved chunks).
+MongoDB documents are rendered as compact "path: value" lines instead of
+Python reprs; documents and chunks are kept in their ranked order until their
+section is full, and budget the history and statistics sections don't use is
+passed on to the text section.
+"""
+import math
+from datetime import datetime
+from token_utils import count_tokens, truncate_to_tokens
+
+INSTRUCTIONS = """You are an AI assistant that answers questions based on the following data:
+{history}
+
+The answer must be as detailed as possible based on the context you are provided in this prompt, and in the language you were asked in.
+Give less detailed answers if the question is general, or if the context does not seem related to the question.
+DO NOT refer to the context or data, just answer the question based on them.
+
+If you are asked about yourself, tell the user that you are the Rahalah AI assistant, and you are here to help them with their questions.
+
+If the answer is not included in the provided context:
+1. Apologize to the user in the language you were asked.
+2. Tell them that you are an AI assistant and you are here to help them with their questions.
+3. Ask them to ask a different question or use different wording.
+4. Do not mention the context or the knowledge base, just say that you are an AI assistant and you are here to help them with their questions.
+5. If you are told 'افصع', answer: يفوت وما يطلع
+
+Statistics/Information Data:
+{statistics}
+
+Text Data:
+{text}
+
+Question: {question}
+"""
+
+NO_HISTORY = "No previous conversation history."
+
+
+def _is_empty(value):
+    if value is None or value == "" or value == [] or value == {}:
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _flatten(value, prefix=""):
+    """(dotted path, scalar) pairs of a nested document, skipping empty values"""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == "_id":
+                continue
+            yield from _flatten(child, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        for i, child in enumerate(value):
+            yield from _flatten(child, f"{prefix}[{i}]")
+    elif not _is_empty(value):
+        yield prefix, value
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.4g}"
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, list):
+        return ", ".join(_format_value(v) for v in value if not _is_empty(v))
+    return str(value)
+
+
+def render_documents(documents):
+    """Compact key/value rendering: one line per field, a blank line between documents"""
+    if isinstance(documents, dict):
+        documents = [documents]
+    if not isinstance(documents, list):
+        return [str(documents)] if documents else []
+    rendered = []
+    for document in documents:
+        lines = [f"{path}: {_format_value(value)}" for path, value in _flatten(document)]
+        if lines:
+            rendered.append("\n".join(lines))
+    return rendered
+
+
+class PromptBudgeter:
+    def __init__(self, model="gpt-4o-mini", system_budget=700, history_budget=400, statistics_budget=1200,
+                 text_budget=2000):
+        self.model = model
+        self.budgets = {
+            "system": system_budget,
+            "history": history_budget,
+            "statistics": statistics_budget,
+            "text": text_budget,
+        }
+
+    def _fill(self, items, budget, separator="\n\n"):
+        """Keep items in order while they fit; the first item is truncated rather than dropped"""
+        kept, used = [], 0
+        separator_tokens = count_tokens(separator, self.model)
+        for item in items:
+            tokens = count_tokens(item, self.model) + (separator_tokens if kept else 0)
+            if used + tokens <= budget:
+                kept.append(item)
+                used += tokens
+            elif not kept:
+                kept.append(truncate_to_tokens(item, budget, self.model))
+                used = count_tokens(kept[0], self.model)
+                break
+        return separator.join(kept), used, len(kept)
+
+    def _history(self, history_summary):
+        """Most recent lines of the summary that fit"""
+        if not history_summary:
+            return NO_HISTORY, count_tokens(NO_HISTORY, self.model)
+        lines = history_summary.splitlines()
+        kept, used = [], 0
+        for line in reversed(lines):
+            tokens = count_tokens(line, self.model) + 1
+            if used + tokens > self.budgets["history"]:
+                break
+            kept.append(line)
+            used += tokens
+        return "\n".join(reversed(kept)), used
+
+    def render_statistics(self, mongo_data):
+        """Rendered MongoDB documents cut to the statistics budget: (text, tokens, documents kept, documents)"""
+        documents = render_documents(mongo_data)
+        statistics, statistics_tokens, documents_kept = self._fill(documents, self.budgets["statistics"])
+        return statistics, statistics_tokens, documents_kept, len(documents)
+
+    def build(self, mongo_data, chroma_data, user_query, history_summary=None):
+        """Return (prompt, token counts per section)"""
+        question = truncate_to_tokens(user_query, self.budgets["system"] // 2, self.model)
+        system_tokens = count_tokens(INSTRUCTIONS, self.model) + count_tokens(question, self.model)
+
+        history, history_tokens = self._history(history_summary)
+        statistics, statistics_tokens, documents_kept, documents = self.render_statistics(mongo_data)
+
+        # Whatever history and statistics left over goes to the retrieved text
+        spare = (self.budgets["history"] - history_tokens) + (self.budgets["statistics"] - statistics_tokens)
+        chunks = [c for c in (chroma_data or []) if c]
+        text, text_tokens, chunks_kept = self._fill(chunks, self.budgets["text"] + max(spare, 0))
+
+        prompt = INSTRUCTIONS.format(history=history, statistics=statistics or "[]", text=text or "[]",
+                                     question=question)
+        counts = {
+            "system": system_tokens,
+            "history": history_tokens,
+            "statistics": statistics_tokens,
+            "text": text_tokens,
+            "total": count_tokens(prompt, self.model),
+            "documents": f"{documents_kept}/{documents}",
+            "chunks": f"{chunks_kept}/{len(chunks)}",
+        }
+        return prompt, counts
@@ -0,0 +1,143 @@
+"""
+Bounded LRU + TTL cache of translated MongoDB queries.
+
+Entries are keyed by (normalized question, resolved village name, schema
+version). A second, small map remembers which village a normalized question
+resolved to, so a hit skips both the name lookup and the translation call.
+Optionally backed by SQLite so the cache survives restarts.
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+
+
+class CachedTranslation:
+    def __init__(self, query_json, closest_name, translation_path, created_at=None):
+        self.query_json = query_json
+        self.closest_name = closest_name
+        self.translation_path = translation_path
+        self.created_at = created_at or time.time()
+
+
+class TranslatedQueryCache:
+    def __init__(self, max_size=1000, ttl=86400, db_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()   # (text, name, version) -> CachedTranslation
+        self._resolved = {}             # (text, version) -> name
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            self._open_db()
+
+    @staticmethod
+    def normalize(text):
+        return normalize_for_matching(text)
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS translated_queries (
+                    text TEXT, closest_name TEXT, schema_version TEXT,
+                    query_json TEXT, translation_path TEXT, created_at REAL,
+                    PRIMARY KEY (text, closest_name, schema_version))"""
+            )
+            self._conn.commit()
+            self._load_from_db()
+        except Exception as e:
+            print(f"[WARNING] Translated-query cache on disk unavailable ({self.db_path}): {str(e)}")
+            self._conn = None
+
+    def _load_from_db(self):
+        min_created = time.time() - self.ttl if self.ttl else 0
+        self._conn.execute("DELETE FROM translated_queries WHERE created_at < ?", (min_created,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT text, closest_name, schema_version, query_json, translation_path, created_at "
+            "FROM translated_queries ORDER BY created_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for text, name, version, query_json, path, created_at in reversed(rows):
+            self._entries[(text, name, version)] = CachedTranslation(query_json, name, path, created_at)
+            self._resolved[(text, version)] = name
+
+    def _expired(self, entry):
+        return bool(self.ttl) and time.time() - entry.created_at > self.ttl
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        text, name, version = key
+        if self._resolved.get((text, version)) == name:
+            del self._resolved[(text, version)]
+        if self._conn is not None:
+            self._conn.execute(
+                "DELETE FROM translated_queries WHERE text=? AND closest_name=? AND schema_version=?", key
+            )
+            self._conn.commit()
+
+    def get(self, query_text, schema_version):
+        """Return a CachedTranslation for this question, or None"""
+        text = self.normalize(query_text)
+        with self._lock:
+            name = self._resolved.get((text, schema_version))
+            key = (text, name, schema_version)
+            entry = self._entries.get(key) if name is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._expired(entry):
+                self._delete(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, query_text, closest_name, schema_version, query_json, translation_path):
+        text = self.normalize(query_text)
+        key = (text, closest_name, schema_version)
+        entry = CachedTranslation(query_json, closest_name, translation_path)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._resolved[(text, schema_version)] = closest_name
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO translated_queries VALUES (?, ?, ?, ?, ?, ?)",
+                    (text, closest_name, schema_version, query_json, translation_path, entry.created_at)
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._delete(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._resolved.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM translated_queries")
+                self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "persistent": self._conn is not None,
+        }
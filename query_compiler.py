@@ -0,0 +1,389 @@
+"""
+Rule-based natural language -> MongoDB compiler for the common statistics intents.
+
+Handles population (by group), land areas (by type), schools/mosques/churches,
+occupation date / military operation and exodus cause for a single village,
+using a multilingual (English/Arabic/Hebrew) synonym table over the nested
+fields produced by `Statistics/Database Transform Nested.py`. It emits the same
+{"query", "projection"} JSON as the LLM translator, together with a confidence
+score; callers fall back to the LLM when the confidence is low.
+
+compile_aggregate() covers the multi-village shapes: district totals (served
+from the district rollup collection) and numeric thresholds such as
+"villages with more than 10,000 dunums"; a number only becomes a threshold when
+it sits next to the field's noun.
+"""
+import re
+import json
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+
+POP = "demographics.population.year_1945"
+LAND = "geography.land"
+FACILITIES = "community.facilities"
+
+# Each intent: keywords that trigger it, the fields it projects, and optional
+# sub-groups that narrow the projection when one of their keywords is present.
+# "generic" keywords also trigger the intent but are too ambiguous on their own
+# ("area code", "the cause of ..."): a question matched only through them is
+# compiled with at most GENERIC_MATCH_CONFIDENCE, so the LLM translator takes it.
+INTENTS = {
+    "population": {
+        "keywords": ["population", "inhabitant", "resident", "how many people", "people lived", "census",
+                     "سكان", "نسمة", "تعداد", "أهالي", "عدد الناس",
+                     "אוכלוסי", "תושבים", "כמה אנשים"],
+        "fields": [f"{POP}.total", f"{POP}.arabs", f"{POP}.jews"],
+        "groups": {
+            "arabs": (["arab", "palestinian", "عرب", "فلسطيني", "ערבי", "ערבים"], [f"{POP}.arabs", f"{POP}.total"]),
+            "jews": (["jew", "jewish", "يهود", "יהודי", "יהודים"], [f"{POP}.jews", f"{POP}.total"]),
+        },
+    },
+    "land": {
+        "keywords": ["land", "lands", "dunum", "cultivable", "cultivat", "agricultur",
+                     "أرض", "أراضي", "دونم", "زراع",
+                     "אדמ", "דונם", "חקלא"],
+        "generic": ["area", "مساحة", "שטח"],
+        "fields": [f"{LAND}.total_dunums", f"{LAND}.cultivable.citrus_banana",
+                   f"{LAND}.cultivable.irrigated", f"{LAND}.cultivable.cereal"],
+        "groups": {
+            "citrus_banana": (["citrus", "orange", "banana", "حمضيات", "برتقال", "موز", "הדר", "תפוז", "בננ"],
+                              [f"{LAND}.cultivable.citrus_banana"]),
+            "irrigated": (["irrigat", "plantation", "orchard", "مروية", "الري", "بساتين", "مزروعات", "השקיה", "מטעים"],
+                          [f"{LAND}.cultivable.irrigated"]),
+            "cereal": (["cereal", "grain", "wheat", "barley", "حبوب", "قمح", "شعير", "דגנים", "חיטה"],
+                       [f"{LAND}.cultivable.cereal"]),
+        },
+    },
+    "facilities": {
+        "keywords": [],
+        "fields": [f"{FACILITIES}.schools", f"{FACILITIES}.mosques", f"{FACILITIES}.churches"],
+        "groups": {
+            "schools": (["school", "education", "مدرسة", "مدارس", "تعليم", "בית ספר", "בתי ספר"],
+                        [f"{FACILITIES}.schools"]),
+            "mosques": (["mosque", "مسجد", "مساجد", "جامع", "מסגד"], [f"{FACILITIES}.mosques"]),
+            "churches": (["church", "كنيسة", "كنائس", "כנסי"], [f"{FACILITIES}.churches"]),
+        },
+    },
+    "occupation": {
+        "keywords": ["occupied", "occupation", "captured", "conquered", "depopulated", "fell", "fall",
+                     "military operation",
+                     "احتلال", "احتل", "سقوط", "سقطت", "عملية عسكرية",
+                     "כיבוש", "נכבש", "מבצע"],
+        "generic": ["when did", "operation", "متى", "מתי"],
+        "fields": ["history.occupation_date", "history.military_operation"],
+        "groups": {},
+    },
+    "exodus": {
+        "keywords": ["exodus", "expel", "expulsion", "fled", "flee", "displace", "nakba",
+                     "تهجير", "هجرة", "هجر", "نزوح", "طرد", "لجوء", "نكبة",
+                     "גירוש", "גורש", "בריחה", "עזיבה", "נכבה"],
+        "generic": ["why did", "cause", "سبب", "למה"],
+        "fields": ["history.exodus_cause", "history.occupation_date"],
+        "groups": {},
+    },
+}
+
+# Cues that the question needs more than a single-village lookup (comparisons,
+# rankings, other census years). The compiler defers to the LLM for these.
+COMPLEX_CUES = ["compare", "comparison", "versus", " vs ", "more than", "less than", "larger", "largest",
+                "smallest", "biggest", "rank", "average", "all villages", "which villages",
+                "مقارنة", "أكثر من", "أقل من", "أكبر", "أصغر", "متوسط", "كل القرى",
+                "השוואה", "יותר מ", "פחות מ", "הגדול", "ממוצע"]
+
+# Cues that the question is open-ended ("tell me about ..."), where a narrow
+# projection would likely miss what the user wants.
+BROAD_CUES = ["tell me about", "information about", "info about", "describe", "life", "history of",
+              "معلومات عن", "حدثني عن", "حياة", "تاريخ",
+              "ספר לי", "מידע על", "חיים"]
+
+# Village field -> field in the district rollup collection (see rollups.py)
+ROLLUP_FIELD_MAP = {
+    f"{POP}.total": "population_1945.total",
+    f"{POP}.arabs": "population_1945.arabs",
+    f"{POP}.jews": "population_1945.jews",
+    f"{LAND}.total_dunums": "land_dunums.total",
+    f"{LAND}.cultivable.citrus_banana": "land_dunums.citrus_banana",
+    f"{LAND}.cultivable.irrigated": "land_dunums.irrigated",
+    f"{LAND}.cultivable.cereal": "land_dunums.cereal",
+    f"{FACILITIES}.schools": "facilities.schools",
+    f"{FACILITIES}.mosques": "facilities.mosques",
+    f"{FACILITIES}.churches": "facilities.churches",
+}
+ROLLUP_COLLECTION = "district_rollups"
+
+VILLAGE_COUNT_CUES = ["how many villages", "number of villages", "كم قرية", "عدد القرى", "כמה כפרים", "מספר הכפרים"]
+# Questions about individual villages within a district ("which villages had a mosque"); a district
+# total cannot answer them
+PER_VILLAGE_CUES = ["which village", "what village", "list the villages", "villages with", "villages that",
+                    "villages where", "villages had", "villages have", "villages having",
+                    "اي القرى", "ما القرى", "القرى التي", "قرى فيها", "אילו כפרים", "כפרים ש", "כפרים עם"]
+DISTRICT_CUES = ["district", "subdistrict", "region", "قضاء", "لواء", "منطقة", "מחוז", "נפת", "אזור"]
+
+# Spelling variants of the Mandate-era districts; matched against the districts present in the data
+DISTRICT_ALIASES = [
+    ["Acre", "Akka", "عكا", "עכו"],
+    ["Baysan", "Beisan", "Beit Shean", "بيسان", "בית שאן"],
+    ["Beersheba", "Bir al-Sabi", "Beer Sheva", "بئر السبع", "באר שבע"],
+    ["Gaza", "غزة", "עזה"],
+    ["Haifa", "حيفا", "חיפה"],
+    ["Hebron", "al-Khalil", "الخليل", "חברון"],
+    ["Jaffa", "Yafa", "يافا", "יפו"],
+    ["Jenin", "جنين", "ג'נין"],
+    ["Jerusalem", "al-Quds", "القدس", "ירושלים"],
+    ["Nazareth", "الناصرة", "נצרת"],
+    ["Ramla", "Ramle", "الرملة", "רמלה"],
+    ["Safad", "Safed", "صفد", "צפת"],
+    ["Tiberias", "طبريا", "طبرية", "טבריה"],
+    ["Tulkarm", "طولكرم", "טול כרם"],
+]
+
+# "more than N" / "less than N" thresholds for multi-village filters
+THRESHOLD_PATTERNS = [
+    ("$gt", ["more than", "greater than", "over", "above", "at least", "أكثر من", "فوق", "יותר מ", "מעל"]),
+    ("$lt", ["less than", "fewer than", "under", "below", "أقل من", "دون", "פחות מ", "מתחת ל"]),
+]
+
+# Keywords that are prefixes of unrelated words ("landscape", "landmark") and must match as whole words.
+# ("acre" is not a keyword at all: it is also the Acre district.)
+WHOLE_WORD_KEYWORDS = {"land", "lands"}
+
+BASE_FIELDS = ["metadata.name", "metadata.district"]
+MAX_PROJECTED_FIELDS = 10
+CENSUS_YEAR = "1945"
+# Confidence ceiling for questions matched only through generic keywords; below the default
+# QUERY_COMPILER_MIN_CONFIDENCE (0.75), so they go to the LLM translator
+GENERIC_MATCH_CONFIDENCE = 0.5
+# How many words around a threshold may separate the number from the field's noun
+# ("more than 10000 dunums", "a population of more than 1000")
+THRESHOLD_NOUN_WINDOW = 3
+# Words that may follow a threshold number without naming a different unit ("... over 1000 in Acre")
+THRESHOLD_TRAILING_WORDS = {"in", "and", "or", "at", "the", "of", "from", "during", "في", "و", "من", "ב", "ו", "של"}
+
+
+def _prepare_text(text):
+    """Normalize a question for matching; thousands separators are dropped first so "10,000" stays one number"""
+    text = re.sub(r"(?<=\d)[,٬](?=\d{3})", "", text)
+    return f" {normalize_for_matching(text)} "
+
+
+def _compile_keyword(keyword):
+    normalized = normalize_for_matching(keyword)
+    if normalized in WHOLE_WORD_KEYWORDS:
+        return re.compile(r"\b" + re.escape(normalized) + r"\b")
+    if normalized.isascii():
+        # English keywords match on a word start so "school" also matches "schools"
+        return re.compile(r"\b" + re.escape(normalized))
+    # Arabic/Hebrew words take attached prefixes (و، ب، ال، ה...), so match anywhere
+    return re.compile(re.escape(normalized))
+
+
+def _compile_table(intents):
+    compiled = {}
+    for intent, spec in intents.items():
+        groups = {
+            group: ([_compile_keyword(k) for k in keywords], fields)
+            for group, (keywords, fields) in spec["groups"].items()
+        }
+        compiled[intent] = {
+            "keywords": [_compile_keyword(k) for k in spec["keywords"]],
+            "generic": [_compile_keyword(k) for k in spec.get("generic", [])],
+            "fields": spec["fields"],
+            "groups": groups,
+        }
+    return compiled
+
+
+def _compile_thresholds(patterns):
+    compiled = []
+    for op, cues in patterns:
+        alternatives = "|".join(re.escape(normalize_for_matching(c)) for c in cues)
+        compiled.append((op, re.compile(rf"(?:{alternatives})\s*(\d[\d\.]*)")))
+    return compiled
+
+
+class QueryCompiler:
+    def __init__(self, intents=INTENTS, complex_cues=COMPLEX_CUES, broad_cues=BROAD_CUES):
+        self.intents = _compile_table(intents)
+        self.complex_cues = [_compile_keyword(c.strip()) for c in complex_cues]
+        self.broad_cues = [_compile_keyword(c) for c in broad_cues]
+        self.village_count_cues = [_compile_keyword(c) for c in VILLAGE_COUNT_CUES]
+        self.per_village_cues = [_compile_keyword(c) for c in PER_VILLAGE_CUES]
+        self.district_cues = [_compile_keyword(c) for c in DISTRICT_CUES]
+        self.thresholds = _compile_thresholds(THRESHOLD_PATTERNS)
+        self._district_patterns = {}
+
+    @staticmethod
+    def _matches(patterns, text):
+        return any(p.search(text) for p in patterns)
+
+    def match_intents(self, text):
+        """Return {intent: [fields]} for every intent recognised in the (normalized) text"""
+        matched = {}
+        for intent, spec in self.intents.items():
+            groups = [g for g, (patterns, _) in spec["groups"].items() if self._matches(patterns, text)]
+            if not groups and not self._matches(spec["keywords"], text) and not self._matches(spec["generic"], text):
+                continue
+            if groups:
+                fields = [f for g in groups for f in spec["groups"][g][1]]
+            else:
+                fields = list(spec["fields"])
+            matched[intent] = fields
+        return matched
+
+    def _generic_only(self, text, matched):
+        """True if every matched intent was recognised only through its generic keywords"""
+        for intent in matched:
+            spec = self.intents[intent]
+            if self._matches(spec["keywords"], text) or \
+                    any(self._matches(patterns, text) for patterns, _ in spec["groups"].values()):
+                return False
+        return True
+
+    def _intent_patterns(self, intent):
+        spec = self.intents[intent]
+        return spec["keywords"] + [p for patterns, _ in spec["groups"].values() for p in patterns]
+
+    def compile(self, query_text, village_name, known_fields=None):
+        """Compile a question about one village.
+        Returns (query_json or None, confidence in [0, 1], list of matched intents)."""
+        if not query_text or not village_name:
+            return None, 0.0, []
+        text = _prepare_text(query_text)
+        matched = self.match_intents(text)
+        if not matched:
+            return None, 0.0, []
+
+        confidence = 0.9
+        if self._matches(self.complex_cues, text) or self._matches(self.per_village_cues, text) or \
+                self._matches(self.village_count_cues, text):
+            # About several villages, not a lookup of one
+            confidence -= 0.5
+        if self._matches(self.broad_cues, text):
+            confidence -= 0.3
+        if len(matched) > 3:
+            confidence -= 0.2
+        if "population" in matched:
+            years = set(re.findall(r"\b(1[89]\d\d|20\d\d)\b", text))
+            if years and years != {CENSUS_YEAR}:
+                confidence -= 0.4
+        if any(pattern.search(text) for _, pattern in self.thresholds):
+            # "over 100 ..." asks for a filter, not a single-village lookup
+            confidence -= 0.5
+        if self._generic_only(text, matched):
+            confidence = min(confidence, GENERIC_MATCH_CONFIDENCE)
+
+        fields = []
+        for intent_fields in matched.values():
+            for field in intent_fields:
+                if field not in fields:
+                    fields.append(field)
+        if known_fields is not None:
+            known = set(known_fields)
+            fields = [f for f in fields if f in known]
+            if not fields:
+                return None, 0.0, list(matched)
+        projection = {"_id": 0}
+        for field in (BASE_FIELDS + fields)[:MAX_PROJECTED_FIELDS]:
+            projection[field] = 1
+        query_json = json.dumps(
+            {"query": {"metadata.name": village_name}, "projection": projection},
+            ensure_ascii=False
+        )
+        return query_json, round(max(confidence, 0.0), 2), list(matched)
+
+    # --- multi-village / district-level questions ---------------------------
+
+    def _district_aliases(self, districts):
+        """{district: [compiled patterns]} for the districts present in the data (cached per district list)"""
+        key = tuple(districts)
+        patterns = self._district_patterns.get(key)
+        if patterns is None:
+            patterns = {}
+            for district in districts:
+                normalized = normalize_for_matching(district)
+                aliases = {district}
+                for group in DISTRICT_ALIASES:
+                    if normalized in (normalize_for_matching(a) for a in group):
+                        aliases.update(group)
+                patterns[district] = [_compile_keyword(a) for a in aliases]
+            self._district_patterns = {key: patterns}
+        return patterns
+
+    def _find_district(self, text, districts):
+        matches = [d for d, patterns in self._district_aliases(districts).items() if self._matches(patterns, text)]
+        return matches[0] if len(matches) == 1 else None
+
+    def _find_threshold(self, text, noun_patterns):
+        """(op, value) for "more than N" when the number belongs to the field's noun: the noun follows the
+        number ("more than 10000 dunums"), or precedes the cue with no other unit after the number
+        ("population over 1000"). "a church over 100 years old" has no threshold on churches."""
+        for op, pattern in self.thresholds:
+            match = pattern.search(text)
+            if not match:
+                continue
+            after = text[match.end():].split()[:THRESHOLD_NOUN_WINDOW]
+            before = text[:match.start()].split()[-THRESHOLD_NOUN_WINDOW:]
+            noun_after = self._matches(noun_patterns, " " + " ".join(after[:2]) + " ")
+            other_unit = bool(after) and after[0] not in THRESHOLD_TRAILING_WORDS and not noun_after
+            noun_before = self._matches(noun_patterns, " " + " ".join(before) + " ")
+            if not noun_after and (other_unit or not noun_before):
+                return None
+            try:
+                return op, float(match.group(1).rstrip("."))
+            except ValueError:
+                return None
+        return None
+
+    def compile_aggregate(self, query_text, districts=(), known_fields=None):
+        """Compile district totals and multi-village threshold filters.
+        Returns (query_json or None, confidence, list of matched intents)."""
+        if not query_text:
+            return None, 0.0, []
+        text = _prepare_text(query_text)
+        matched = {i: f for i, f in self.match_intents(text).items() if i in ("population", "land", "facilities")}
+        wants_count = self._matches(self.village_count_cues, text)
+        district = self._find_district(text, districts) if districts else None
+        threshold = self._find_threshold(text, self._intent_patterns(next(iter(matched)))) \
+            if len(matched) == 1 else None
+        confidence = GENERIC_MATCH_CONFIDENCE if matched and self._generic_only(text, matched) else 0.85
+
+        if threshold:
+            # "villages (in district D) with more than N <unit>"
+            op, value = threshold
+            intent, fields = next(iter(matched.items()))
+            field = fields[0]
+            if known_fields is not None and field not in set(known_fields):
+                return None, 0.0, list(matched)
+            query = {field: {op: value}}
+            if district:
+                query["metadata.district"] = district
+            if wants_count:
+                # "how many villages ... more than N": count them, the row cap would cut a list short
+                query_json = json.dumps({"pipeline": [{"$match": query}, {"$count": "village_count"}]},
+                                        ensure_ascii=False)
+                return query_json, confidence, [intent, "threshold", "count"]
+            projection = {"_id": 0, "metadata.name": 1, "metadata.district": 1, field: 1}
+            query_json = json.dumps({"query": query, "projection": projection}, ensure_ascii=False)
+            return query_json, confidence, [intent, "threshold"]
+
+        if district and (self._matches(self.district_cues, text) or wants_count) and (matched or wants_count):
+            if (wants_count and matched) or self._matches(self.per_village_cues, text) or \
+                    self._matches(self.complex_cues, text) or \
+                    any(pattern.search(text) for _, pattern in self.thresholds):
+                # Villages filtered, ranked or counted by a field ("how many villages had a school"): the
+                # rollup only holds district totals, so leave it to the LLM translator
+                return None, 0.0, list(matched) + ["district"]
+            # District totals come from the one precomputed rollup document
+            fields = [ROLLUP_FIELD_MAP[f] for intent_fields in matched.values() for f in intent_fields
+                      if f in ROLLUP_FIELD_MAP]
+            if wants_count:
+                fields.insert(0, "village_count")
+            projection = {"_id": 0, "district": 1}
+            for field in fields:
+                projection[field] = 1
+            query_json = json.dumps(
+                {"collection": ROLLUP_COLLECTION, "query": {"district": district}, "projection": projection},
+                ensure_ascii=False
+            )
+            return query_json, 0.85 if wants_count else confidence, list(matched) + ["district"]
+
+        return None, 0.0, []
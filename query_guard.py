@@ -0,0 +1,177 @@
+"""
+Index bootstrap and query-plan guard for the statistics collection.
+
+ensure_indexes() creates the indexes the translators' filters rely on. QueryGuard
+checks each translated query's plan with `explain` (planner only, nothing is
+executed) before it runs: queries that would scan the whole collection are
+anchored to the resolved village name when possible, allowed on small
+collections, and rejected otherwise. Results are capped at max_results rows and
+projections at max_fields included fields.
+Verdicts are cached per query shape, so explain runs once per shape, not per request.
+"""
+import json
+import threading
+
+def ensure_indexes(collection):
+    """Create the statistics indexes (idempotent). Backfills GeoJSON points for the 2dsphere index."""
+    collection.create_index("metadata.name", name="metadata_name")
+    collection.create_index("metadata.alt_names", name="metadata_alt_names")
+    collection.create_index("metadata.district", name="metadata_district")
+    collection.create_index(
+        [("metadata.name", "text"), ("metadata.alt_names", "text"), ("history.exodus_cause", "text")],
+        name="village_text", default_language="none"
+    )
+    # 2dsphere needs GeoJSON ([lon, lat]); build it from metadata.coordinates where both are valid numbers
+    collection.update_many(
+        {
+            "metadata.location": {"$exists": False},
+            "metadata.coordinates.lat": {"$type": "number", "$gte": -90, "$lte": 90},
+            "metadata.coordinates.lon": {"$type": "number", "$gte": -180, "$lte": 180},
+        },
+        [{"$set": {"metadata.location": {
+            "type": "Point",
+            "coordinates": ["$metadata.coordinates.lon", "$metadata.coordinates.lat"],
+        }}}]
+    )
+    collection.create_index([("metadata.location", "2dsphere")], name="metadata_location")
+
+
+def _shape(value):
+    """Replace literal values with their type so queries differing only in constants share a verdict"""
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shape(v) for v in value[:1]]
+    return type(value).__name__
+
+
+def _find_stages(plan, stages=None):
+    """Collect every "stage" value anywhere in an explain document"""
+    stages = [] if stages is None else stages
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for value in plan.values():
+            _find_stages(value, stages)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_stages(value, stages)
+    return stages
+
+
+def _find_index_names(plan, names=None):
+    names = [] if names is None else names
+    if isinstance(plan, dict):
+        if isinstance(plan.get("indexName"), str):
+            names.append(plan["indexName"])
+        for value in plan.values():
+            _find_index_names(value, names)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_index_names(value, names)
+    return names
+
+
+def _mentions_name(query):
+    """True if a filter refers to the village name fields anywhere"""
+    if isinstance(query, dict):
+        return any(k in ("metadata.name", "metadata.alt_names") or _mentions_name(v) for k, v in query.items())
+    if isinstance(query, list):
+        return any(_mentions_name(v) for v in query)
+    return False
+
+
+class QueryRejected(Exception):
+    pass
+
+
+class QueryGuard:
+    def __init__(self, db, collection_name, max_results=50, max_scan_docs=1000, max_fields=15):
+        self.db = db
+        self.collection_name = collection_name
+        self.max_results = max_results
+        self.max_fields = max_fields
+        self.max_scan_docs = max_scan_docs
+        self._verdicts = {}
+        self._doc_count = None
+        self._lock = threading.Lock()
+
+    def _shape_key(self, collection_name, query_dict):
+        body = query_dict.get("pipeline") if "pipeline" in query_dict else query_dict.get("query")
+        return collection_name + "|" + ("pipeline" if "pipeline" in query_dict else "find") + "|" + \
+            json.dumps(_shape(body), sort_keys=True)
+
+    def _explain(self, collection_name, query_dict):
+        if "pipeline" in query_dict:
+            command = {"aggregate": collection_name, "pipeline": query_dict["pipeline"], "cursor": {}}
+        else:
+            command = {"find": collection_name, "filter": query_dict["query"],
+                       "projection": query_dict.get("projection") or {}}
+        return self.db.command("explain", command, verbosity="queryPlanner")
+
+    def _collection_size(self):
+        if self._doc_count is None:
+            self._doc_count = self.db[self.collection_name].estimated_document_count()
+        return self._doc_count
+
+    def invalidate(self):
+        """Forget cached verdicts and sizes (call after reloading data or changing indexes)"""
+        with self._lock:
+            self._verdicts = {}
+            self._doc_count = None
+
+    def is_cached(self, collection_name, query_dict):
+        return self._shape_key(collection_name, query_dict) in self._verdicts
+
+    def _verdict(self, collection_name, query_dict):
+        key = self._shape_key(collection_name, query_dict)
+        verdict = self._verdicts.get(key)
+        if verdict is None:
+            explain = self._explain(collection_name, query_dict)
+            stages = _find_stages(explain)
+            verdict = {
+                "collection_scan": "COLLSCAN" in stages,
+                "stages": sorted(set(stages)),
+                "indexes": sorted(set(_find_index_names(explain))),
+            }
+            with self._lock:
+                self._verdicts[key] = verdict
+        return verdict
+
+    def cap(self, query_dict):
+        """Limit the rows and included projection fields a query may return"""
+        capped = dict(query_dict)
+        if "pipeline" in capped:
+            capped["pipeline"] = list(capped["pipeline"]) + [{"$limit": self.max_results}]
+        else:
+            capped["limit"] = self.max_results
+            projection = capped.get("projection") or {}
+            included = [field for field, flag in projection.items() if field != "_id" and flag]
+            if len(included) > self.max_fields:
+                keep = set(included[:self.max_fields])
+                capped["projection"] = {f: v for f, v in projection.items() if f == "_id" or not v or f in keep}
+        return capped
+
+    def check(self, collection_name, query_dict, closest_name=None):
+        """Return (query_dict to run, plan info). Raises QueryRejected for unbounded scans."""
+        verdict = self._verdict(collection_name, query_dict)
+        plan = {"stages": verdict["stages"], "indexes": verdict["indexes"], "action": "allowed"}
+        if not verdict["collection_scan"]:
+            return self.cap(query_dict), plan
+
+        if closest_name and "pipeline" not in query_dict and collection_name == self.collection_name \
+                and _mentions_name(query_dict["query"]):
+            # A single-village filter the index can't serve (e.g. a regex on the name):
+            # anchor it on the resolved village so the name index bounds the scan
+            anchored = dict(query_dict)
+            anchored["query"] = {"$and": [query_dict["query"], {"metadata.name": closest_name}]}
+            plan["action"] = "anchored_to_name"
+            plan["indexes"] = ["metadata_name"]
+            return self.cap(anchored), plan
+
+        if collection_name != self.collection_name or self._collection_size() <= self.max_scan_docs:
+            # Small collections (the rollups, or a few hundred villages) are cheap to scan once capped
+            plan["action"] = "allowed_small_scan"
+            return self.cap(query_dict), plan
+
+        raise QueryRejected("Query rejected: it would scan the whole collection without using an index")
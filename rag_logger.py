@@ -67,12 +67,16 @@ def log_query_start(session_id: str, query: str):
     _log_event("query_start", {"session_id": session_id, "query": query})
 
 
-def log_mongo_query(translated_query: str, results: list, query: str):
-    """Log MongoDB translated query and results."""
+def log_mongo_query(translated_query: str, results: list, query: str, translation_path: Optional[str] = None,
+                    execution_path: Optional[str] = None):
+    """Log MongoDB translated query and results.
+    translation_path: "cache", "compiler" or "llm"; execution_path: "snapshot" or "mongo"."""
     _log_event(
         "mongo_result",
         {
             "query": query,
+            "translation_path": translation_path,
+            "execution_path": execution_path,
             "translated_mongo_query": translated_query,
             "result_count": len(results),
             "results": _truncate(results, 1500),
@@ -80,6 +84,22 @@ def log_mongo_query(translated_query: str, results: list, query: str):
     )
 
 
+def log_query_cost(query: Optional[str], plan: dict, elapsed_ms: float, result_count: int):
+    """Log the plan and cost of a MongoDB query (stages, indexes used, guard action, latency)."""
+    _log_event(
+        "mongo_query_cost",
+        {
+            "query": query,
+            "action": plan.get("action"),
+            "stages": plan.get("stages"),
+            "indexes": plan.get("indexes"),
+            "elapsed_ms": round(elapsed_ms, 2),
+            "result_count": result_count,
+        },
+        level="WARNING" if plan.get("action") == "rejected" else "INFO",
+    )
+
+
 def log_chroma_result(query: str, documents: list, metadatas: Optional[list] = None, distances: Optional[list] = None):
     """Log ChromaDB query results."""
     data = {
@@ -107,6 +127,32 @@ def log_llm_context(query: str, mongo_data: Any, chroma_data: Any, history_summa
     )
 
 
+def log_prompt_budget(query: str, token_counts: dict):
+    """Log the per-section token counts of an assembled answer prompt."""
+    _log_event("prompt_budget", {"query": query, **token_counts})
+
+
+def log_stream_timing(query: str, ttft_ms: Optional[float], total_ms: float, chunk_count: int, cancelled: bool = False):
+    """Log time-to-first-token and total generation time of a streamed answer."""
+    _log_event(
+        "stream_timing",
+        {
+            "query": query,
+            "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+            "total_ms": round(total_ms, 2),
+            "chunk_count": chunk_count,
+            "cancelled": cancelled,
+        },
+    )
+
+
+def log_pipeline_metadata(query: str, metadata: dict):
+    """Log per-stage latency and the stages that timed out, failed or were skipped by an open circuit."""
+    level = "WARNING" if metadata.get("timed_out") or metadata.get("failed") or metadata.get("circuit_open") else "INFO"
+    stage_ms = {stage: round(ms, 2) for stage, ms in metadata.get("stage_ms", {}).items()}
+    _log_event("pipeline_metadata", {"query": query, **metadata, "stage_ms": stage_ms}, level)
+
+
 def log_response_end(session_id: str, query: str, response_preview: str, success: bool = True):
     """Log when response is complete."""
     _log_event(
@@ -0,0 +1,107 @@
+"""
+Circuit breaker for the pipeline's remote dependencies (MongoDB, the query translator).
+
+After failure_threshold consecutive failures the circuit opens and calls fail
+fast with CircuitOpen instead of waiting on a dead host; after reset_timeout
+seconds one trial call is let through (half-open) and its outcome closes or
+re-opens the circuit. Used as a context manager around the remote call:
+
+    with breaker:
+        results = collection.find(...)
+
+Only exceptions of failure_types count as failures; any other exception means
+the dependency answered (e.g. a rejected query) and counts as a success.
+A cancelled call counts as neither.
+"""
+import time
+import threading
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, failure_types=(Exception,)):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_types = failure_types
+        self._lock = threading.Lock()  # the sync Mongo path records outcomes from executor threads
+        self._open = False
+        self._opened_at = 0.0
+        self._failures = 0
+        self._trial_running = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def _state(self):
+        if not self._open:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        """True if a call may go ahead; in half-open state only one trial call at a time"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._rejected += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            self._open = False
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            half_open = self._open and self._trial_running
+            self._trial_running = False
+            if half_open or (not self._open and self._failures >= self.failure_threshold):
+                self._open = True
+                self._times_opened += 1
+            if self._open:
+                self._opened_at = time.monotonic()
+
+    def _release(self):
+        with self._lock:
+            self._trial_running = False
+
+    def __enter__(self):
+        self.check()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, self.failure_types):
+            self.record_failure()
+        elif issubclass(exc_type, Exception):
+            self.record_success()
+        else:
+            self._release()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "times_opened": self._times_opened,
+                "rejected": self._rejected,
+            }
@@ -0,0 +1,216 @@
+"""
+Semantic cache of generated answers.
+
+A lookup matches a stored answer when the question's embedding is close enough
+to the stored question's (cosine similarity >= threshold) and everything else
+that shapes the answer is the same: the context version (vector index build,
+statistics schema and answer model), the chat-history summary, the villages
+the question names and the numbers in it (so "Lifta in 1945" never answers
+"Iqrit in 1931", however similar the sentences are).
+
+Answers are stored with the tokens they were streamed as, so a hit is replayed
+with the original token boundaries (newlines and spacing included). Entries
+expire after ttl seconds and the least recently used are evicted beyond
+max_size. Optionally backed by SQLite so the cache survives restarts.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from DocumentManagement.NormalizeArabicText import normalize_for_matching
+
+_NUMBER = re.compile(r"\d+")
+
+
+class CachedResponse:
+    def __init__(self, text, embedding, context_version, summary_hash, villages, response, tokens,
+                 created_at=None):
+        self.text = text
+        self.embedding = embedding
+        self.context_version = context_version
+        self.summary_hash = summary_hash
+        self.villages = villages
+        self.response = response
+        self.tokens = tokens
+        self.created_at = created_at or time.time()
+
+
+def summary_hash(summary):
+    return hashlib.sha1((summary or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(self, max_size=1000, ttl=86400, threshold=0.95, db_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.db_path = db_path
+        self._entries = OrderedDict()   # entry id -> CachedResponse, least recently used first
+        self._groups = {}               # (context version, summary hash, villages, numbers) -> [entry ids]
+        self._matrices = {}             # group -> stacked, normalized embeddings (rebuilt when the group changes)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            self._open_db()
+
+    @staticmethod
+    def normalize(text):
+        return normalize_for_matching(text)
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _group_key(text, context_version, summary_hash, villages):
+        return context_version, summary_hash, tuple(sorted(villages or ())), tuple(_NUMBER.findall(text))
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY, text TEXT, context_version TEXT, summary_hash TEXT, villages TEXT,
+                    embedding BLOB, response TEXT, tokens TEXT, created_at REAL)"""
+            )
+            self._conn.commit()
+            self._load_from_db()
+        except Exception as e:
+            print(f"[WARNING] Response cache on disk unavailable ({self.db_path}): {str(e)}")
+            self._conn = None
+
+    def _load_from_db(self):
+        min_created = time.time() - self.ttl if self.ttl else 0
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (min_created,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, text, context_version, summary_hash, villages, embedding, response, tokens, created_at "
+            "FROM responses ORDER BY created_at DESC LIMIT ?", (self.max_size,)
+        ).fetchall()
+        for entry_id, text, version, s_hash, villages, embedding, response, tokens, created_at in reversed(rows):
+            entry = CachedResponse(text, np.frombuffer(embedding, dtype=np.float32), version, s_hash,
+                                   tuple(json.loads(villages)), response, json.loads(tokens), created_at)
+            self._add(entry_id, entry)
+            self._next_id = max(self._next_id, entry_id + 1)
+
+    def _add(self, entry_id, entry):
+        key = self._group_key(entry.text, entry.context_version, entry.summary_hash, entry.villages)
+        self._entries[entry_id] = entry
+        self._groups.setdefault(key, []).append(entry_id)
+        self._matrices.pop(key, None)
+
+    def _delete(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        key = self._group_key(entry.text, entry.context_version, entry.summary_hash, entry.villages)
+        ids = self._groups.get(key, [])
+        if entry_id in ids:
+            ids.remove(entry_id)
+        if not ids:
+            self._groups.pop(key, None)
+        self._matrices.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM responses WHERE id=?", (entry_id,))
+            self._conn.commit()
+
+    def _expired(self, entry):
+        return bool(self.ttl) and time.time() - entry.created_at > self.ttl
+
+    def _matrix(self, key):
+        if key not in self._matrices:
+            ids = list(self._groups[key])
+            self._matrices[key] = (ids, np.stack([self._entries[i].embedding for i in ids]))
+        return self._matrices[key]
+
+    def get(self, query_text, embedding, context_version, summary_hash, villages=()):
+        """Return (CachedResponse, similarity) for the closest stored question in the same context, or (None, best)"""
+        text = self.normalize(query_text)
+        key = self._group_key(text, context_version, summary_hash, villages)
+        with self._lock:
+            if key not in self._groups:
+                self.misses += 1
+                return None, 0.0
+            ids, matrix = self._matrix(key)
+            similarities = matrix @ self._unit(embedding)
+            for row in np.argsort(-similarities):
+                entry_id = ids[row]
+                entry = self._entries[entry_id]
+                exact = entry.text == text
+                if not exact and similarities[row] < self.threshold:
+                    break
+                if self._expired(entry):
+                    self._delete(entry_id)
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                if not exact:
+                    self.semantic_hits += 1
+                return entry, 1.0 if exact else float(similarities[row])
+            self.misses += 1
+            return None, float(similarities.max()) if len(similarities) else 0.0
+
+    def put(self, query_text, embedding, context_version, summary_hash, villages, response, tokens=None):
+        """Store an answer; tokens are the chunks it was streamed as (the whole answer as one chunk otherwise)"""
+        text = self.normalize(query_text)
+        entry = CachedResponse(text, self._unit(embedding), context_version, summary_hash, tuple(sorted(villages or ())),
+                               response, list(tokens) if tokens else [response])
+        with self._lock:
+            # One entry per question and context: a newer answer replaces the old one
+            key = self._group_key(text, context_version, summary_hash, entry.villages)
+            for entry_id in list(self._groups.get(key, [])):
+                if self._entries[entry_id].text == text:
+                    self._delete(entry_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._add(entry_id, entry)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry_id, text, context_version, summary_hash, json.dumps(list(entry.villages), ensure_ascii=False),
+                     entry.embedding.tobytes(), response, json.dumps(entry.tokens, ensure_ascii=False),
+                     entry.created_at)
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_size:
+                self._delete(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._matrices.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "persistent": self._conn is not None,
+        }
@@ -0,0 +1,98 @@
+"""
+Per-district rollups of the village statistics, plus validation for the
+aggregation pipelines the translators may emit.
+
+The rollup collection holds one small document per district:
+    {"district", "village_count",
+     "population_1945": {"total", "arabs", "jews"},
+     "land_dunums": {"total", "citrus_banana", "irrigated", "cereal"},
+     "facilities": {"schools", "mosques", "churches"},
+     "refreshed_at"}
+so district-level questions read one document instead of scanning villages.
+Refresh it whenever the statistics data is (re)loaded: the load script does,
+and the backend does too on schema changes when ROLLUP_REFRESH is set, or when
+the collection is missing or empty.
+"""
+from datetime import datetime, timezone
+
+ROLLUP_FIELDS = [
+    "district", "village_count",
+    "population_1945.total", "population_1945.arabs", "population_1945.jews",
+    "land_dunums.total", "land_dunums.citrus_banana", "land_dunums.irrigated", "land_dunums.cereal",
+    "facilities.schools", "facilities.mosques", "facilities.churches",
+]
+
+# Stages an LLM-generated pipeline may use: the ones the translation prompt advertises (read-only, single collection)
+ALLOWED_PIPELINE_STAGES = {"$match", "$group", "$project", "$sort", "$limit", "$count"}
+# Operators that run server-side JavaScript; rejected at any depth in a pipeline or filter
+FORBIDDEN_OPERATORS = {"$where", "$function", "$accumulator"}
+
+
+def _sum(path):
+    return {"$sum": {"$cond": [{"$isNumber": f"${path}"}, f"${path}", 0]}}
+
+
+def district_rollup_pipeline(target_collection):
+    """Aggregation that rebuilds the rollup collection from villageStatistics"""
+    return [
+        {"$match": {"metadata.district": {"$exists": True, "$ne": None}}},
+        {"$group": {
+            "_id": "$metadata.district",
+            "village_count": {"$sum": 1},
+            "pop_total": _sum("demographics.population.year_1945.total"),
+            "pop_arabs": _sum("demographics.population.year_1945.arabs"),
+            "pop_jews": _sum("demographics.population.year_1945.jews"),
+            "land_total": _sum("geography.land.total_dunums"),
+            "land_citrus_banana": _sum("geography.land.cultivable.citrus_banana"),
+            "land_irrigated": _sum("geography.land.cultivable.irrigated"),
+            "land_cereal": _sum("geography.land.cultivable.cereal"),
+            "schools": _sum("community.facilities.schools"),
+            "mosques": _sum("community.facilities.mosques"),
+            "churches": _sum("community.facilities.churches"),
+        }},
+        {"$project": {
+            "_id": 0,
+            "district": "$_id",
+            "village_count": 1,
+            "population_1945": {"total": "$pop_total", "arabs": "$pop_arabs", "jews": "$pop_jews"},
+            "land_dunums": {"total": "$land_total", "citrus_banana": "$land_citrus_banana",
+                            "irrigated": "$land_irrigated", "cereal": "$land_cereal"},
+            "facilities": {"schools": "$schools", "mosques": "$mosques", "churches": "$churches"},
+            "refreshed_at": {"$literal": datetime.now(timezone.utc)},
+        }},
+        {"$out": target_collection},
+    ]
+
+
+def refresh_district_rollups(db, source_collection, target_collection):
+    """Recompute the per-district rollup collection. Returns the number of districts."""
+    db[source_collection].aggregate(district_rollup_pipeline(target_collection))
+    db[target_collection].create_index("district", unique=True)
+    return db[target_collection].count_documents({})
+
+
+def validate_filter(value):
+    """Reject documents that use a code-running operator anywhere, however deeply nested"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in FORBIDDEN_OPERATORS:
+                raise ValueError(f"Operator {key} is not allowed")
+            validate_filter(item)
+    elif isinstance(value, list):
+        for item in value:
+            validate_filter(item)
+    return value
+
+
+def validate_pipeline(pipeline):
+    """Reject pipelines with stages that write, join or run code"""
+    if not isinstance(pipeline, list) or not pipeline:
+        raise ValueError("Invalid pipeline: must be a non-empty list of stages")
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise ValueError("Invalid pipeline stage: each stage must have exactly one operator")
+        operator = next(iter(stage))
+        if operator not in ALLOWED_PIPELINE_STAGES:
+            raise ValueError(f"Pipeline stage {operator} is not allowed")
+        validate_filter(stage[operator])
+    return pipeline
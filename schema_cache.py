@@ -0,0 +1,184 @@
+"""
+In-process cache of the statistics collection's schema and village names.
+
+Holds the flattened field catalogue, the distinct names (with alt names) and a
+translation-prompt template pre-rendered per field set, so building a prompt
+never touches MongoDB on the hot path. The cache is refreshed:
+  - in the background once the TTL has expired (stale data is served meanwhile),
+  - on an explicit refresh() / invalidate() call,
+  - on every change event when a Mongo change stream is available (replica sets).
+
+Any pymongo-compatible collection works, including mongomock for local tests
+(mongomock has no change streams, so only TTL/explicit refresh apply there).
+"""
+import time
+import json
+import hashlib
+import threading
+from string import Template
+
+
+def flatten_field_names(document, prefix=''):
+    """Recursively get all field names from a MongoDB document"""
+    field_names = []
+    for key, value in document.items():
+        if isinstance(value, dict):
+            field_names.extend(flatten_field_names(value, f"{prefix}{key}."))
+        else:
+            field_names.append(f"{prefix}{key}")
+    return field_names
+
+
+class SchemaSnapshot:
+    """Immutable view of the schema at one version"""
+    def __init__(self, version, fields, names, name_records, fingerprint, districts=()):
+        self.version = version
+        self.fields = fields
+        self.names = names
+        self.name_records = name_records
+        self.districts = list(districts)
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+
+
+class SchemaCache:
+    def __init__(self, collection, ttl=600, prompt_template=None):
+        self.collection = collection
+        self.ttl = ttl
+        self.prompt_template = prompt_template
+        self._snapshot = None
+        self._templates = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._refreshing = threading.Event()
+        self._watch_thread = None
+        self._stop_watch = threading.Event()
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot else 0
+
+    def add_listener(self, callback):
+        """Register callback(snapshot) to run whenever the cached schema changes"""
+        self._listeners.append(callback)
+
+    def _load(self):
+        """Read fields and names from the collection (the only place that hits the DB)"""
+        fields, seen_fields = [], set()
+        names, name_records = [], []
+        districts = set()
+        doc_hashes = []
+        for doc in self.collection.find({}, {"_id": 0}):
+            doc_hashes.append(hashlib.sha1(json.dumps(doc, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+            for field in flatten_field_names(doc):
+                if field not in seen_fields:
+                    seen_fields.add(field)
+                    fields.append(field)
+            metadata = doc.get("metadata", {})
+            if isinstance(metadata.get("district"), str):
+                districts.add(metadata["district"])
+            name = metadata.get("name")
+            if not name:
+                continue
+            alt_names = metadata.get("alt_names") or []
+            if isinstance(alt_names, str):
+                alt_names = [alt_names]
+            names.append(name)
+            name_records.append((name, list(alt_names)))
+        if "_id" not in seen_fields:
+            fields.insert(0, "_id")
+        names = sorted(set(names))
+        # Fingerprint covers field order and every document's content, so value edits
+        # also produce a new version (consumers such as the statistics snapshot rely on it)
+        digest = hashlib.sha1()
+        for field in fields:
+            digest.update(f"{field}\x1e".encode("utf-8"))
+        for doc_hash in sorted(doc_hashes):
+            digest.update(doc_hash.encode("utf-8"))
+        return fields, names, name_records, digest.hexdigest(), sorted(districts)
+
+    def refresh(self):
+        """Synchronously reload the schema; bumps the version only if content changed"""
+        self._refreshing.set()
+        try:
+            fields, names, name_records, fingerprint, districts = self._load()
+            with self._lock:
+                previous = self._snapshot
+                if previous and previous.fingerprint == fingerprint:
+                    previous.loaded_at = time.time()
+                    return previous
+                version = (previous.version if previous else 0) + 1
+                self._snapshot = SchemaSnapshot(version, fields, names, name_records, fingerprint, districts)
+                self._templates = {}
+                snapshot = self._snapshot
+            for callback in self._listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    print(f"[WARNING] Schema cache listener failed: {str(e)}")
+            return snapshot
+        finally:
+            self._refreshing.clear()
+
+    def _refresh_in_background(self):
+        if self._refreshing.is_set():
+            return
+        self._refreshing.set()
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                self._refreshing.clear()
+                print(f"[WARNING] Schema cache refresh failed: {str(e)}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self):
+        """Signal that the data changed; reload in the background and keep serving the old snapshot"""
+        self._refresh_in_background()
+
+    def get(self):
+        """Return the current snapshot. Only the very first call blocks on the database."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        if self.ttl and time.time() - snapshot.loaded_at > self.ttl:
+            self._refresh_in_background()
+        return snapshot
+
+    def get_prompt_template(self, snapshot=None):
+        """Prompt template with $query and $closest_name placeholders, rendered once per field set"""
+        snapshot = snapshot or self.get()
+        key = (tuple(snapshot.fields), tuple(snapshot.districts))
+        template = self._templates.get(key)
+        if template is None:
+            text = self.prompt_template.replace("$fields", str(list(snapshot.fields)))
+            text = text.replace("$districts", str(list(snapshot.districts)))
+            template = Template(text)
+            self._templates[key] = template
+        return template
+
+    def start_change_stream(self):
+        """Watch the collection and refresh on every change. Falls back to TTL if unsupported."""
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._stop_watch.clear()
+
+        def watch():
+            try:
+                with self.collection.watch(full_document=None) as stream:
+                    while not self._stop_watch.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            self._stop_watch.wait(1.0)
+                            continue
+                        self.refresh()
+            except Exception as e:
+                print(f"[WARNING] Schema change stream unavailable, using TTL refresh only: {str(e)}")
+
+        self._watch_thread = threading.Thread(target=watch, daemon=True)
+        self._watch_thread.start()
+
+    def stop_change_stream(self):
+        self._stop_watch.set()
@@ -0,0 +1,96 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When several callers ask for the same key while a computation for it is still
+running, only the first one (the leader) starts it; the others attach to it
+and get the same result. Tokens the computation streams are fanned out to
+every attached caller: a caller that joins late first gets a replay of the
+tokens emitted so far, then the rest live, so every stream is complete and in
+order. The computation runs in its own task, so the leader disconnecting does
+not cancel it for the others; it is cancelled once no caller is left.
+"""
+import asyncio
+
+_DONE = object()
+
+
+async def _emit(on_token, token):
+    if asyncio.iscoroutinefunction(on_token):
+        await on_token(token)
+    else:
+        on_token(token)
+
+
+class _Flight:
+    def __init__(self):
+        self.task = None
+        self.tokens = []
+        self.listeners = []
+        self.waiters = 0
+
+    def publish(self, token):
+        self.tokens.append(token)
+        for queue in self.listeners:
+            queue.put_nowait(token)
+
+    def close(self):
+        for queue in self.listeners:
+            queue.put_nowait(_DONE)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def run(self, key, compute, on_token=None):
+        """Await compute(publish) once per key while it is in flight; publish(token) streams a token to every caller.
+        Returns (result, leader, tokens) where tokens is how many streamed tokens this caller was given."""
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(compute(flight.publish))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.leaders += 1
+        else:
+            self.joined += 1
+        return await self._wait(flight, on_token), leader, len(flight.tokens) if on_token else 0
+
+    def _finish(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.close()
+
+    async def _wait(self, flight, on_token):
+        queue = None
+        replay = []
+        if on_token is not None and not flight.task.done():
+            # Snapshot and subscribe in one step (no await in between), so no token is missed or repeated
+            replay = list(flight.tokens)
+            queue = asyncio.Queue()
+            flight.listeners.append(queue)
+        elif on_token is not None:
+            replay = list(flight.tokens)
+        flight.waiters += 1
+        try:
+            for token in replay:
+                await _emit(on_token, token)
+            while queue is not None:
+                token = await queue.get()
+                if token is _DONE:
+                    break
+                await _emit(on_token, token)
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if queue is not None:
+                flight.listeners.remove(queue)
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller went away (e.g. all clients disconnected): stop the computation
+                flight.task.cancel()
+
+    def stats(self):
+        return {"in_flight": len(self._flights), "leaders": self.leaders, "joined": self.joined}
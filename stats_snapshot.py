@@ -0,0 +1,239 @@
+"""
+Read-through, in-memory columnar snapshot of the villageStatistics collection.
+
+The collection is small and almost static, so it is loaded once into one column
+per flattened field (NumPy arrays, row-aligned by village) plus a name -> row
+index. The {"query", "projection"} documents produced by the translators are
+evaluated locally; filters the snapshot cannot evaluate raise UnsupportedQuery
+and the caller falls back to MongoDB.
+
+Supported filter operators: equality, $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte,
+$exists, and top-level $and / $or.
+"""
+import threading
+import numpy as np
+from schema_cache import flatten_field_names
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+_RANGE_OPS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+_MISSING = object()
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+class _Table:
+    """One immutable, fully loaded version of the snapshot"""
+    def __init__(self, documents, version):
+        self.version = version
+        self.size = len(documents)
+        self.fields = []
+        for doc in documents:
+            for field in flatten_field_names(doc):
+                if field != "_id" and field not in self.fields:
+                    self.fields.append(field)
+        self.values = {}    # field -> object array of raw values (_MISSING where absent)
+        self.numeric = {}   # field -> float64 array (NaN where absent / non-numeric)
+        for field in self.fields:
+            raw = np.empty(self.size, dtype=object)
+            numbers = np.full(self.size, np.nan)
+            for row, doc in enumerate(documents):
+                value = _get_path(doc, field)
+                raw[row] = value
+                if _is_number(value):
+                    numbers[row] = float(value)
+            self.values[field] = raw
+            if not np.all(np.isnan(numbers)):
+                self.numeric[field] = numbers
+        self.name_rows = {}
+        self.id_rows = {}
+        for row, doc in enumerate(documents):
+            name = _get_path(doc, "metadata.name")
+            if name is not _MISSING and name is not None:
+                self.name_rows.setdefault(name, []).append(row)
+            village_id = _get_path(doc, "metadata.id")
+            if village_id is not _MISSING:
+                self.id_rows[village_id] = row
+
+
+class StatisticsSnapshot:
+    def __init__(self, collection):
+        self.collection = collection
+        self._table = None
+        self._loading = threading.Lock()
+
+    @property
+    def version(self):
+        return self._table.version if self._table else None
+
+    def is_ready(self):
+        return self._table is not None
+
+    def row_for_id(self, village_id):
+        """Row index of a village by metadata.id, or None"""
+        return self._table.id_rows.get(village_id) if self._table else None
+
+    def load(self, version=None):
+        """Read the whole collection and atomically swap in the new columns"""
+        with self._loading:
+            documents = list(self.collection.find({}, {"_id": 0}))
+            self._table = _Table(documents, version)
+        print(f"[OK] Statistics snapshot loaded ({len(documents)} documents, version {version})")
+
+    def reload_in_background(self, version=None):
+        """Load a new version without blocking readers, who keep using the current table"""
+        def run():
+            try:
+                self.load(version)
+            except Exception as e:
+                print(f"[WARNING] Statistics snapshot reload failed: {str(e)}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # --- filter evaluation -------------------------------------------------
+
+    def _equals(self, table, field, target):
+        column = table.values.get(field)
+        if column is None:
+            # Field never seen: only {field: None} matches (missing == null in Mongo)
+            return np.full(table.size, target is None)
+        if target is None:
+            return np.array([v is _MISSING or v is None for v in column], dtype=bool)
+        if _is_number(target) and field in table.numeric:
+            numbers = table.numeric[field]
+            mask = numbers == float(target)
+        else:
+            mask = np.array([v == target for v in column], dtype=bool)
+        # Array fields (e.g. metadata.alt_names) match when any element equals the target
+        for row, value in enumerate(column):
+            if isinstance(value, list) and target in value:
+                mask[row] = True
+        return mask
+
+    def _range(self, table, field, op, target):
+        if not _is_number(target):
+            raise UnsupportedQuery(f"{op} on non-numeric value")
+        numbers = table.numeric.get(field)
+        if numbers is None:
+            return np.zeros(table.size, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            return _RANGE_OPS[op](numbers, float(target))
+
+    def _field_mask(self, table, field, condition):
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            mask = np.ones(table.size, dtype=bool)
+            for op, target in condition.items():
+                if op == "$eq":
+                    mask &= self._equals(table, field, target)
+                elif op == "$ne":
+                    mask &= ~self._equals(table, field, target)
+                elif op in ("$in", "$nin"):
+                    if not isinstance(target, list):
+                        raise UnsupportedQuery(f"{op} requires a list")
+                    any_mask = np.zeros(table.size, dtype=bool)
+                    for item in target:
+                        any_mask |= self._equals(table, field, item)
+                    mask &= any_mask if op == "$in" else ~any_mask
+                elif op in _RANGE_OPS:
+                    mask &= self._range(table, field, op, target)
+                elif op == "$exists":
+                    column = table.values.get(field)
+                    present = np.zeros(table.size, dtype=bool) if column is None else \
+                        np.array([v is not _MISSING for v in column], dtype=bool)
+                    mask &= present if target else ~present
+                else:
+                    raise UnsupportedQuery(f"Operator {op} not supported by the snapshot")
+            return mask
+        if isinstance(condition, dict):
+            raise UnsupportedQuery("Embedded-document equality not supported by the snapshot")
+        return self._equals(table, field, condition)
+
+    def _mask(self, table, query):
+        mask = np.ones(table.size, dtype=bool)
+        for key, condition in query.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self._mask(table, sub)
+            elif key == "$or":
+                any_mask = np.zeros(table.size, dtype=bool)
+                for sub in condition:
+                    any_mask |= self._mask(table, sub)
+                mask &= any_mask
+            elif key.startswith("$"):
+                raise UnsupportedQuery(f"Operator {key} not supported by the snapshot")
+            else:
+                mask &= self._field_mask(table, key, condition)
+        return mask
+
+    def _candidate_rows(self, table, query):
+        # Fast path for the common single-village lookup
+        name = query.get("metadata.name")
+        if len(query) == 1 and isinstance(name, str):
+            return table.name_rows.get(name, [])
+        return np.flatnonzero(self._mask(table, query)).tolist()
+
+    # --- projection --------------------------------------------------------
+
+    @staticmethod
+    def _projected_fields(table, projection):
+        included = [path for path, flag in (projection or {}).items() if path != "_id" and flag]
+        excluded = [path for path, flag in (projection or {}).items() if path != "_id" and not flag]
+        if excluded:
+            raise UnsupportedQuery("Exclusion projections not supported by the snapshot")
+        if not included:
+            return list(table.fields)
+        return [
+            field for field in table.fields
+            if any(field == path or field.startswith(path + ".") for path in included)
+        ]
+
+    @staticmethod
+    def _to_python(value):
+        return value.item() if isinstance(value, np.generic) else value
+
+    def _build_document(self, table, row, fields):
+        document = {}
+        for field in fields:
+            value = table.values[field][row]
+            if value is _MISSING:
+                continue
+            target = document
+            parts = field.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = self._to_python(value)
+        return document
+
+    def find(self, query, projection=None, limit=None):
+        """Evaluate a Mongo filter/projection against the snapshot, returning at most limit documents"""
+        table = self._table
+        if table is None:
+            raise UnsupportedQuery("Snapshot not loaded")
+        if not isinstance(query, dict):
+            raise UnsupportedQuery("Filter must be a document")
+        if not projection or projection.get("_id", 1):
+            raise UnsupportedQuery("Snapshot does not keep _id")
+        fields = self._projected_fields(table, projection)
+        rows = self._candidate_rows(table, query)
+        if limit:
+            rows = rows[:limit]
+        return [self._build_document(table, row, fields) for row in rows]
@@ -0,0 +1,74 @@
+"""
+The query_village_stats tool for the single-call ("tool") pipeline mode.
+
+Instead of a separate translation round trip, the answer model is given this
+tool and writes the MongoDB query itself when the question needs statistics.
+The arguments use the translator's JSON format ({"query", "projection"[,
+"collection"]} or {"pipeline"}), so a call runs through the same parser, plan
+guard and in-memory snapshot as a translated query.
+"""
+import json
+
+from rollups import ROLLUP_FIELDS
+from query_compiler import ROLLUP_COLLECTION
+
+TOOL_NAME = "query_village_stats"
+
+STATISTICS_NOTE = (
+    "Not loaded. If the question needs population, land, ownership or other statistics about a village or "
+    "district, call the " + TOOL_NAME + " tool first.{village}"
+)
+
+
+def statistics_note(closest_name=None):
+    """Placeholder for the statistics section of the answer prompt, naming the village the question likely means"""
+    village = f' The question most likely refers to the village with metadata.name "{closest_name}".' \
+        if closest_name else ""
+    return STATISTICS_NOTE.format(village=village)
+
+
+def build_stats_tool(fields, districts):
+    """OpenAI tool definition; the field list and districts come from the current schema snapshot"""
+    description = (
+        "Look up statistics about Palestinian villages in the MongoDB statistics collection. "
+        "For a single village, pass query and projection, filtering on metadata.name and projecting up to 10 "
+        "relevant fields with _id: 0. Fields: " + ", ".join(fields) + ". "
+        "For district totals, set collection to \"" + ROLLUP_COLLECTION + "\" (one document per district, fields: "
+        + ", ".join(ROLLUP_FIELDS) + "; districts: " + ", ".join(districts) + "). "
+        "To filter, rank or compare several villages, pass an aggregation pipeline instead, using only "
+        "$match, $group, $project, $sort, $limit and $count stages."
+    )
+    return {
+        "type": "function",
+        "function": {
+            "name": TOOL_NAME,
+            "description": description,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "object", "description": "MongoDB filter, e.g. {\"metadata.name\": \"Lifta\"}"},
+                    "projection": {"type": "object",
+                                   "description": "MongoDB projection, e.g. {\"_id\": 0, \"field\": 1}; "
+                                                  "optional, every field is returned without it"},
+                    "collection": {"type": "string", "enum": [ROLLUP_COLLECTION],
+                                   "description": "Only for district totals"},
+                    "pipeline": {"type": "array", "items": {"type": "object"},
+                                 "description": "Aggregation pipeline over the village collection"},
+                },
+            },
+        },
+    }
+
+
+def tool_arguments(arguments):
+    """A tool call's arguments in the translator's JSON format. The projection is optional in the tool schema
+    and defaults to {"_id": 0} (every field); anything that does not parse is left for the query parser to reject."""
+    try:
+        parsed = json.loads(arguments)
+    except (TypeError, ValueError):
+        return arguments
+    if isinstance(parsed, dict) and "pipeline" not in parsed and "query" in parsed:
+        if not isinstance(parsed.get("projection"), dict) or not parsed["projection"]:
+            parsed["projection"] = {"_id": 0}
+        return json.dumps(parsed, ensure_ascii=False)
+    return arguments
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+
+local_translator = pytest.importorskip("local_translator")
+
+
+class SlowTranslator(local_translator.LocalQueryTranslator):
+    """The batching worker with generate() replaced: echoes prompts, and blocks while `gate` is closed"""
+    def __init__(self, **kwargs):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.batches = []
+        super().__init__(**kwargs)
+
+    def _load_model(self):
+        return None
+
+    def _generate(self, prompts, max_new_tokens):
+        self.batches.append(list(prompts))
+        self.started.set()
+        self.gate.wait(5)
+        return [f"out:{prompt}" for prompt in prompts]
+
+
+@pytest.fixture
+def translator(monkeypatch):
+    monkeypatch.setattr(local_translator.AutoTokenizer, "from_pretrained", lambda name: None)
+    return SlowTranslator(max_batch_size=8, max_wait_ms=5)
+
+
+def _hold_worker(translator):
+    """Keep the worker busy on one batch so the next requests queue up behind it"""
+    translator.gate.clear()
+    translator.started.clear()
+    first = translator.submit("first")
+    assert translator.started.wait(5)
+    return first
+
+
+def test_cancelled_caller_in_a_batch_does_not_kill_the_worker(translator):
+    first = _hold_worker(translator)
+    cancelled = translator.submit("cancelled")
+    kept = translator.submit("kept")
+    assert cancelled.cancel()
+    translator.gate.set()
+
+    assert first.result(timeout=5) == "out:first"
+    assert kept.result(timeout=5) == "out:kept"
+    assert all("cancelled" not in batch for batch in translator.batches)
+    assert translator._worker.is_alive()
+    assert translator.translate("after") == "out:after"
+
+
+def test_async_timeout_while_queued(translator):
+    first = _hold_worker(translator)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(translator.translate_async("timed out"), 0.05)
+        translator.gate.set()
+        return await asyncio.wait_for(translator.translate_async("next"), 5)
+
+    assert asyncio.run(run()) == "out:next"
+    assert first.result(timeout=5) == "out:first"
+    assert translator._worker.is_alive()
+
+
+def test_generate_error_reaches_every_caller(translator, monkeypatch):
+    def fail(prompts, max_new_tokens):
+        raise RuntimeError("model failed")
+
+    monkeypatch.setattr(translator, "_generate", fail)
+    with pytest.raises(RuntimeError):
+        translator.translate("x")
+    assert translator._worker.is_alive()
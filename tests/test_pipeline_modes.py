@@ -0,0 +1,172 @@
+"""
+Both answer pipelines end to end against benchmarks/openai_stub.py, with in-memory
+stand-ins for MongoDB, Chroma and the embedding model.
+"""
+import json
+import time
+import socket
+import asyncio
+import threading
+import functools
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+openai_stub = pytest.importorskip("benchmarks.openai_stub")
+RAGLLM = pytest.importorskip("RAGLLM")
+
+from stats_tool import build_stats_tool, TOOL_NAME
+
+QUESTION = "What was the population of Lifta in 1945?"
+LIFTA = {"metadata": {"name": "Lifta", "district": "Jerusalem"},
+         "demographics": {"population": {"year_1945": {"total": 2550}}}}
+
+
+class FakeEmbedding:
+    def __call__(self, input):
+        return [[float(len(text)), 1.0, 0.5] for text in input]
+
+
+class FakeMongoManager:
+    # Tool calls go through the real argument handling and query parser; only the database is replaced
+    execute_stats_tool_async = RAGLLM.AsyncMongoDBManager.execute_stats_tool_async
+    parse_query_json = staticmethod(RAGLLM.MongoDBManager._parse_query_json)
+
+    def __init__(self, embedding_fn, embedding_model=""):
+        self.schema_cache = None
+        self.async_collection = object()
+        self.translated = []
+        self.tool_calls = []
+
+    def resolve_villages(self, query):
+        return ["Lifta"] if "Lifta" in query else []
+
+    def closest_name(self, query):
+        return "Lifta"
+
+    def stats_tool(self):
+        return build_stats_tool(["metadata.name", "metadata.district", "demographics.population.year_1945.total"],
+                                ["Jerusalem"])
+
+    async def get_documents_by_query_async(self, natural_language_query, info=None):
+        self.translated.append(natural_language_query)
+        info["translation_path"] = "llm"
+        return [LIFTA]
+
+    async def _execute_query_async(self, query_json, info=None, natural_language_query=None):
+        self.tool_calls.append(self.parse_query_json(query_json))
+        return [LIFTA]
+
+    def record_stage_timeout(self, info):
+        pass
+
+
+class FakeVectorDBManager:
+    build_version = "test"
+
+    def __init__(self, embedding_fn):
+        pass
+
+    def query_text(self, query, villages=None):
+        return {"documents": [["Lifta - A village west of Jerusalem, on the slopes above the Sorek valley."]]}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    port = _free_port()
+    openai_stub.settings.update(latency_ms=0, token_ms=0)
+    server = uvicorn.Server(uvicorn.Config(openai_stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def rag_system(stub_url, monkeypatch):
+    monkeypatch.setattr(RAGLLM.embedding_functions, "SentenceTransformerEmbeddingFunction",
+                        lambda **kwargs: FakeEmbedding())
+    monkeypatch.setattr(RAGLLM, "MongoDBManager", FakeMongoManager)
+    monkeypatch.setattr(RAGLLM, "AsyncMongoDBManager", FakeMongoManager)
+    monkeypatch.setattr(RAGLLM, "VectorDBManager", FakeVectorDBManager)
+    monkeypatch.setattr(RAGLLM, "LLMChatbot", functools.partial(RAGLLM.LLMChatbot, openai_api_key="stub",
+                                                                base_url=stub_url))
+    for key in openai_stub.counters:
+        openai_stub.counters[key] = 0
+    openai_stub.recent.clear()
+    yield RAGLLM.RAGSystem()
+    openai_stub.settings["tool_projection"] = True
+
+
+@pytest.mark.parametrize("mode", ["tool", "tools"])
+@pytest.mark.parametrize("stream", [False, True])
+def test_tool_mode_queries_stats_through_the_tool(rag_system, mode, stream):
+    rag_system.pipeline_mode = mode
+    tokens = []
+    response, metadata = asyncio.run(rag_system.process_query_with_metadata(
+        QUESTION, stream=stream, on_token=tokens.append if stream else None))
+
+    assert rag_system.mongo_manager.translated == []
+    assert rag_system.mongo_manager.tool_calls == [{"query": {"metadata.name": "Lifta"}, "projection": {"_id": 0}}]
+    assert openai_stub.counters["tool_calls"] == 1
+    assert openai_stub.counters["translations"] == 0
+    assert metadata["translation_path"] == "tool"
+    # The tool result went back to the model, which quotes it in the answer
+    tool_messages = [m for m in openai_stub.recent[-1]["messages"] if m.get("role") == "tool"]
+    assert len(tool_messages) == 1 and "2550" in tool_messages[0]["content"]
+    assert "2550" in response
+    if stream:
+        assert "".join(tokens) == response
+
+
+def test_tool_call_without_projection_returns_every_field(rag_system):
+    rag_system.pipeline_mode = "tool"
+    openai_stub.settings["tool_projection"] = False
+    response, metadata = asyncio.run(rag_system.process_query_with_metadata(QUESTION))
+
+    call = next(m for m in openai_stub.recent[-1]["messages"] if m.get("tool_calls"))["tool_calls"][0]
+    assert "projection" not in json.loads(call["function"]["arguments"])
+    assert rag_system.mongo_manager.tool_calls == [{"query": {"metadata.name": "Lifta"}, "projection": {"_id": 0}}]
+    assert metadata["failed"] == {}
+    assert "2550" in response
+
+
+def test_tool_mode_skips_the_tool_for_other_questions(rag_system):
+    rag_system.pipeline_mode = "tool"
+    response, metadata = asyncio.run(rag_system.process_query_with_metadata("Tell me a story about Lifta"))
+
+    assert rag_system.mongo_manager.tool_calls == []
+    assert openai_stub.counters["tool_calls"] == 0
+    assert openai_stub.counters["requests"] == 1
+    assert response == openai_stub.ANSWER
+    assert TOOL_NAME in [t["function"]["name"] for t in openai_stub.recent[-1]["tools"]]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_two_call_mode_puts_stats_in_the_answer_prompt(rag_system, stream):
+    rag_system.pipeline_mode = "two_call"
+    tokens = []
+    response, metadata = asyncio.run(rag_system.process_query_with_metadata(
+        QUESTION, stream=stream, on_token=tokens.append if stream else None))
+
+    assert rag_system.mongo_manager.translated == [QUESTION]
+    assert rag_system.mongo_manager.tool_calls == []
+    assert openai_stub.counters["requests"] == 1
+    assert openai_stub.counters["tool_calls"] == 0
+    assert metadata["translation_path"] == "llm"
+    answer_request = openai_stub.recent[-1]
+    assert "tools" not in answer_request
+    assert "2550" in answer_request["messages"][-1]["content"]
+    assert response == openai_stub.ANSWER
+    if stream:
+        assert "".join(tokens) == response
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from query_compiler import QueryCompiler, ROLLUP_COLLECTION
+
+# Default QUERY_COMPILER_MIN_CONFIDENCE (env.py): below it the LLM translator is used
+MIN_CONFIDENCE = 0.75
+DISTRICTS = ["Acre", "Haifa", "Jaffa", "Safad"]
+
+
+@pytest.fixture(scope="module")
+def compiler():
+    return QueryCompiler()
+
+
+def test_single_village_population(compiler):
+    query_json, confidence, intents = compiler.compile("What was the population of Lifta?", "Lifta")
+    query = json.loads(query_json)
+    assert confidence >= MIN_CONFIDENCE
+    assert intents == ["population"]
+    assert query["query"] == {"metadata.name": "Lifta"}
+    assert query["projection"]["demographics.population.year_1945.total"] == 1
+
+
+def test_arabic_facility_group_narrows_projection(compiler):
+    query_json, confidence, _ = compiler.compile("كم مدرسة في لفتا", "Lifta")
+    projection = json.loads(query_json)["projection"]
+    assert confidence >= MIN_CONFIDENCE
+    assert "community.facilities.schools" in projection
+    assert "community.facilities.mosques" not in projection
+
+
+def test_threshold_next_to_its_noun(compiler):
+    query_json, confidence, intents = compiler.compile_aggregate("Villages with more than 10,000 dunums", DISTRICTS)
+    assert confidence >= MIN_CONFIDENCE
+    assert intents == ["land", "threshold"]
+    assert json.loads(query_json)["query"] == {"geography.land.total_dunums": {"$gt": 10000.0}}
+
+
+def test_threshold_after_noun_with_district(compiler):
+    query_json, confidence, _ = compiler.compile_aggregate("Villages in Haifa with a population over 1000",
+                                                           DISTRICTS)
+    assert confidence >= MIN_CONFIDENCE
+    assert json.loads(query_json)["query"] == {
+        "demographics.population.year_1945.total": {"$gt": 1000.0},
+        "metadata.district": "Haifa",
+    }
+
+
+def test_district_totals_use_rollups(compiler):
+    query_json, confidence, _ = compiler.compile_aggregate("How many villages were in Safad district?", DISTRICTS)
+    query = json.loads(query_json)
+    assert confidence >= MIN_CONFIDENCE
+    assert query["collection"] == ROLLUP_COLLECTION
+    assert query["query"] == {"district": "Safad"}
+
+
+def test_number_with_another_unit_is_not_a_threshold(compiler):
+    question = "Is there a church over 100 years old in Haifa?"
+    _, confidence, _ = compiler.compile(question, "Haifa")
+    assert confidence < MIN_CONFIDENCE
+    query_json, confidence, _ = compiler.compile_aggregate(question, DISTRICTS)
+    assert query_json is None or confidence < MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("question", [
+    "what is the area code",
+    "What was the cause of the fire in Lifta?",
+    "When did Lifta get electricity?",
+])
+def test_generic_keyword_alone_is_not_confident(compiler, question):
+    _, confidence, _ = compiler.compile(question, "Lifta")
+    assert confidence < MIN_CONFIDENCE
+
+
+def test_generic_keyword_alone_is_not_confident_for_districts(compiler):
+    query_json, confidence, _ = compiler.compile_aggregate("What is the area code of Haifa district?", DISTRICTS)
+    assert query_json is None or confidence < MIN_CONFIDENCE
+
+
+def test_generic_keyword_with_specific_one_stays_confident(compiler):
+    _, confidence, intents = compiler.compile("When did Lifta fall and which military operation?", "Lifta")
+    assert confidence >= MIN_CONFIDENCE
+    assert intents == ["occupation"]
+
+
+def test_acre_district_is_not_a_land_question(compiler):
+    query_json, confidence, intents = compiler.compile_aggregate(
+        "How many villages in Acre had more than 500 inhabitants?", DISTRICTS)
+    assert confidence >= MIN_CONFIDENCE
+    assert "land" not in intents
+    assert json.loads(query_json) == {"pipeline": [
+        {"$match": {"demographics.population.year_1945.total": {"$gt": 500.0}, "metadata.district": "Acre"}},
+        {"$count": "village_count"},
+    ]}
+
+
+def test_acre_district_totals_project_only_the_asked_field(compiler):
+    query_json, confidence, intents = compiler.compile_aggregate("how many mosques in Acre district", DISTRICTS)
+    query = json.loads(query_json)
+    assert confidence >= MIN_CONFIDENCE
+    assert intents == ["facilities", "district"]
+    assert query["projection"] == {"_id": 0, "district": 1, "facilities.mosques": 1}
+
+
+def test_land_matches_whole_words_only(compiler):
+    query_json, confidence, intents = compiler.compile("What is the landscape of Lifta like?", "Lifta")
+    assert query_json is None or confidence < MIN_CONFIDENCE
+    assert "land" not in intents
+    _, confidence, intents = compiler.compile("How much land did Lifta have?", "Lifta")
+    assert confidence >= MIN_CONFIDENCE
+    assert intents == ["land"]
+
+
+@pytest.mark.parametrize("question", [
+    "Which villages in Haifa district had a mosque?",
+    "How many villages in Haifa district had a school?",
+    "What was the largest village in Haifa district?",
+    "Villages in Haifa district with more than 2 schools and a mosque",
+])
+def test_per_village_district_questions_skip_the_rollup(compiler, question):
+    query_json, confidence, _ = compiler.compile_aggregate(question, DISTRICTS)
+    assert query_json is None or ROLLUP_COLLECTION not in query_json
+    # Nor are they answered as a lookup of the single closest village
+    _, confidence, _ = compiler.compile(question, "Haifa")
+    assert confidence < MIN_CONFIDENCE
+
+
+def test_district_total_still_uses_rollup(compiler):
+    query_json, confidence, _ = compiler.compile_aggregate("What was the total population of Haifa district?",
+                                                           DISTRICTS)
+    assert confidence >= MIN_CONFIDENCE
+    assert json.loads(query_json)["collection"] == ROLLUP_COLLECTION
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from schema_cache import SchemaCache
+
+mongomock = pytest.importorskip("mongomock")
+
+VILLAGES = [
+    {"metadata": {"name": "Lifta", "district": "Jerusalem", "alt_names": ["Lefta"]},
+     "demographics": {"population": {"year_1945": {"total": 2550}}}},
+    {"metadata": {"name": "Iqrit", "district": "Acre"},
+     "demographics": {"population": {"year_1945": {"total": 490}}}},
+]
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.villageStatistics
+    collection.insert_many([dict(v) for v in VILLAGES])
+    return collection
+
+
+def _wait_for_version(cache, version, timeout=5.0):
+    deadline = time.time() + timeout
+    while cache.version < version and time.time() < deadline:
+        time.sleep(0.01)
+    return cache.version
+
+
+def test_first_load(collection):
+    snapshot = SchemaCache(collection).get()
+    assert snapshot.version == 1
+    assert snapshot.names == ["Iqrit", "Lifta"]
+    assert snapshot.districts == ["Acre", "Jerusalem"]
+    assert "demographics.population.year_1945.total" in snapshot.fields
+
+
+def test_unchanged_data_keeps_version_and_fingerprint(collection):
+    cache = SchemaCache(collection)
+    first = cache.get()
+    second = cache.refresh()
+    assert second is first
+    assert second.version == 1
+
+
+def test_value_edit_changes_fingerprint_and_fires_listener(collection):
+    cache = SchemaCache(collection)
+    seen = []
+    cache.add_listener(seen.append)
+    first = cache.get()
+    collection.update_one({"metadata.name": "Iqrit"}, {"$set": {"demographics.population.year_1945.total": 491}})
+    second = cache.refresh()
+    assert second.version == 2
+    assert second.fingerprint != first.fingerprint
+    assert second.fields == first.fields
+    assert seen == [first, second]
+
+
+def test_expired_ttl_refreshes_in_background(collection):
+    cache = SchemaCache(collection, ttl=60)
+    seen = []
+    cache.add_listener(seen.append)
+    first = cache.get()
+    collection.insert_one({"metadata": {"name": "Saffuriyya", "district": "Nazareth"}})
+
+    # Within the TTL the cached snapshot is served as is
+    assert cache.get() is first
+
+    first.loaded_at -= 61
+    # The stale snapshot is still served while the reload runs
+    assert cache.get() is first
+    assert _wait_for_version(cache, 2) == 2
+    snapshot = cache.get()
+    assert "Saffuriyya" in snapshot.names
+    assert "Nazareth" in snapshot.districts
+    assert snapshot.fingerprint != first.fingerprint
+    assert [s.version for s in seen] == [1, 2]
+
+
+def test_failing_listener_does_not_block_others(collection):
+    cache = SchemaCache(collection)
+    seen = []
+
+    def broken(snapshot):
+        raise RuntimeError("listener bug")
+
+    cache.add_listener(broken)
+    cache.add_listener(seen.append)
+    cache.get()
+    assert len(seen) == 1
@@ -0,0 +1,42 @@
+"""
+Token counting for prompt/context budgets.
+
+Uses tiktoken when installed; otherwise estimates from UTF-8 length (about four
+bytes per token holds reasonably for both English and Arabic text).
+"""
+from functools import lru_cache
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    if not text:
+        return 0
+    if HAS_TIKTOKEN:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-4o-mini"):
+    """Cut text to at most max_tokens tokens (on a token boundary with tiktoken, by estimate otherwise)"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    if HAS_TIKTOKEN:
+        encoding = _encoding(model)
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    encoded = text.encode("utf-8")[:max_tokens * 4]
+    return encoded.decode("utf-8", errors="ignore")
@@ -1,43 +1,49 @@
 # data_preparation.py - Updated version
 import os
+import re
+import json
 import shutil
+import hashlib
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
-from env import CHROMA_COLLECTION_NAME, HF_TOKEN, CHROMA_PATH, TEXT_FILE_DIRECTORY
+from env import CHROMA_COLLECTION_NAME, HF_TOKEN, CHROMA_PATH, TEXT_FILE_DIRECTORY, LEXICAL_INDEX_PATH, \
+    FLAT_INDEX_PATH, FLAT_INDEX_DTYPE, FLAT_INDEX_QUANTIZATION, SHARD_BY, SHARD_MANIFEST_PATH, VILLAGE_DATA_PATH
+from lexical_index import BM25Index
+from vector_store import export_chroma_to_flat
+
+_ARABIC_LETTERS = re.compile(r"[؀-ۿ]")
+_LATIN_LETTERS = re.compile(r"[A-Za-z]")
+
+
+def shard_collection_name(shard):
+    """Chroma collection for a shard, e.g. VillageDocuments__acre"""
+    slug = re.sub(r"[^a-z0-9]+", "_", str(shard).lower()).strip("_")
+    if not slug:
+        slug = hashlib.sha1(str(shard).encode("utf-8")).hexdigest()[:10]
+    return f"{CHROMA_COLLECTION_NAME}__{slug}"
+
 
 class DataPreparer:
-    def __init__(self, embedding_model="LaBSE"):
+    def __init__(self, embedding_model="LaBSE", quantization=FLAT_INDEX_QUANTIZATION, shard_by=SHARD_BY):
         self.embedding_model = embedding_model
+        self.quantization = quantization  # flat index storage: "none", "int8" or "binary"
+        self.shard_by = shard_by or None  # None, "district" or "language"
         self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=embedding_model, 
+            model_name=embedding_model,
             token=HF_TOKEN
         )
         self.chroma_path = CHROMA_PATH
         self.text_file_directory = TEXT_FILE_DIRECTORY
+        self.lexical_index_path = LEXICAL_INDEX_PATH
+        self.manifest_path = SHARD_MANIFEST_PATH
 
-    def prepare_chroma_db(self, chunk_size=800, chunk_overlap=80):
-        """Create and populate the ChromaDB with text embeddings"""
-
-        # Clean up existing ChromaDB directory
-        if os.path.exists(self.chroma_path):
-            print(f"Removing existing ChromaDB directory: {self.chroma_path}")
-            shutil.rmtree(self.chroma_path)
-
-        print("Initializing ChromaDB client...")
-        chroma_client = chromadb.PersistentClient(
-            path=self.chroma_path, 
-            settings=Settings()  # Remove allow_reset=True for production
-        )
-
-        # Create fresh collection
-        chroma_collection = chroma_client.create_collection(
-            CHROMA_COLLECTION_NAME, 
-            embedding_function=self.embedding_fn
-        )
-
+    def _load_chunks(self, chunk_size, chunk_overlap):
+        """Chunk every text file. Chunk ids are "<file key>_<idx>" with a key derived from the file name,
+        so ids stay stable when other files are added or a single shard is rebuilt."""
+        chunks_by_file = {}
         print("Loading and chunking text files...")
-        for file_idx, file_name in enumerate(os.listdir(self.text_file_directory)):
+        for file_name in sorted(os.listdir(self.text_file_directory)):
             if not file_name.endswith(".txt"):
                 continue
 
@@ -47,36 +53,183 @@ class DataPreparer:
 
             # Split text into chunks
             chunks = self._split_text(text_content, chunk_size, chunk_overlap)
+            file_key = hashlib.sha1(file_name.encode("utf-8")).hexdigest()[:12]
 
-            # Prepare documents for batch addition
             documents = []
             metadatas = []
             ids = []
-
             for idx, chunk in enumerate(chunks):
-                full_idx = f'{file_idx}_{idx}'
-                preprocessed_text = f'{file_name[:-4]} - {chunk}'
-
-                documents.append(preprocessed_text)
+                documents.append(f'{file_name[:-4]} - {chunk}')
                 metadatas.append({"source": "text_file", "file_name": file_name})
-                ids.append(full_idx)
-
-            # Add in batches to avoid ChromaDB "batch size exceeds maximum" error
-            # SQLite limit is ~41k; use 500 per batch to stay safe across systems
-            BATCH_SIZE = 500
-            if documents:
-                for i in range(0, len(documents), BATCH_SIZE):
-                    batch_docs = documents[i:i + BATCH_SIZE]
-                    batch_metas = metadatas[i:i + BATCH_SIZE]
-                    batch_ids = ids[i:i + BATCH_SIZE]
-                    chroma_collection.add(
-                        documents=batch_docs,
-                        metadatas=batch_metas,
-                        ids=batch_ids
-                    )
-                print(f"Processed {file_name}: {len(chunks)} chunks")
+                ids.append(f'{file_key}_{idx}')
+            chunks_by_file[file_name] = (ids, documents, metadatas, text_content)
+        return chunks_by_file
+
+    def _village_records(self):
+        """(name, alt_names, district) rows from the village spreadsheet, parsed like the Mongo import"""
+        import pandas as pd
+        records = []
+        for _, row in pd.read_excel(VILLAGE_DATA_PATH).iterrows():
+            village = str(row["Village"])
+            alt_names = []
+            if "(" in village:
+                notes = village.split("(")[1].replace(")", "").strip()
+                alt_names = [n.strip() for n in notes.split(",") if n.strip()]
+            records.append((village.split("(")[0].strip(), alt_names, row["District"]))
+        return records
+
+    def _assign_shards(self, chunks_by_file, lexical_index):
+        """file_name -> shard"""
+        if self.shard_by == "language":
+            shards = {}
+            for file_name, (_, _, _, text) in chunks_by_file.items():
+                arabic, latin = len(_ARABIC_LETTERS.findall(text)), len(_LATIN_LETTERS.findall(text))
+                shards[file_name] = "ar" if arabic >= latin else "en"
+            return shards
+        if self.shard_by == "district":
+            records = self._village_records()
+            village_files = lexical_index.village_groups([(name, alt) for name, alt, _ in records])
+            districts = {name: district for name, _, district in records}
+            votes = {}
+            for village, files in village_files.items():
+                for file_name in files:
+                    votes.setdefault(file_name, {}).setdefault(districts[village], 0)
+                    votes[file_name][districts[village]] += 1
+            # A file goes to the district most of the villages it is about belong to; unmatched files to "other"
+            return {file_name: max(votes[file_name], key=votes[file_name].get) if file_name in votes else "other"
+                    for file_name in chunks_by_file}
+        return {file_name: None for file_name in chunks_by_file}
+
+    def _add_to_collection(self, chroma_collection, ids, documents, metadatas):
+        # Add in batches to avoid ChromaDB "batch size exceeds maximum" error
+        # SQLite limit is ~41k; use 500 per batch to stay safe across systems
+        BATCH_SIZE = 500
+        for i in range(0, len(documents), BATCH_SIZE):
+            chroma_collection.add(
+                documents=documents[i:i + BATCH_SIZE],
+                metadatas=metadatas[i:i + BATCH_SIZE],
+                ids=ids[i:i + BATCH_SIZE]
+            )
+
+    def prepare_chroma_db(self, chunk_size=800, chunk_overlap=80, only_shard=None):
+        """Create and populate the ChromaDB with text embeddings.
+        With only_shard, only that shard's collection is re-embedded; the other shards are kept as they are."""
+        if only_shard is not None and not self.shard_by:
+            raise ValueError("only_shard requires shard_by ('district' or 'language')")
+
+        # Clean up existing ChromaDB directory
+        if only_shard is None and os.path.exists(self.chroma_path):
+            print(f"Removing existing ChromaDB directory: {self.chroma_path}")
+            shutil.rmtree(self.chroma_path)
+
+        print("Initializing ChromaDB client...")
+        chroma_client = chromadb.PersistentClient(
+            path=self.chroma_path,
+            settings=Settings()  # Remove allow_reset=True for production
+        )
+
+        chunks_by_file = self._load_chunks(chunk_size, chunk_overlap)
+
+        # Every chunk added to Chroma also goes into the BM25 index under the same id.
+        # The lexical index needs no embeddings, so it is always rebuilt over the whole corpus.
+        all_ids, all_documents, all_files = [], [], []
+        for file_name, (ids, documents, _, _) in chunks_by_file.items():
+            all_ids.extend(ids)
+            all_documents.extend(documents)
+            all_files.extend([file_name] * len(ids))
+        lexical_index = self.build_lexical_index(all_ids, all_documents, all_files)
+
+        shard_of = self._assign_shards(chunks_by_file, lexical_index)
+        if only_shard is not None:
+            shard_of = self._keep_other_shards(shard_of, str(only_shard))
+        collections = {}
+        for file_name, shard in shard_of.items():
+            collection_name = shard_collection_name(shard) if shard is not None else CHROMA_COLLECTION_NAME
+            collections.setdefault(collection_name, []).append(file_name)
+        if only_shard is not None:
+            target = shard_collection_name(only_shard)
+            if target not in collections:
+                raise ValueError(f"Unknown shard: {only_shard}")
+
+        for collection_name, file_names in collections.items():
+            if only_shard is not None and collection_name != target:
+                continue
+            if only_shard is not None:
+                try:
+                    chroma_client.delete_collection(collection_name)
+                except Exception:
+                    pass
+            chroma_collection = chroma_client.create_collection(
+                collection_name,
+                embedding_function=self.embedding_fn
+            )
+            for file_name in file_names:
+                ids, documents, metadatas, _ = chunks_by_file[file_name]
+                if shard_of[file_name] is not None:
+                    metadatas = [dict(meta, shard=str(shard_of[file_name])) for meta in metadatas]
+                if documents:
+                    self._add_to_collection(chroma_collection, ids, documents, metadatas)
+                    print(f"Processed {file_name}: {len(ids)} chunks -> {collection_name}")
         print(f"ChromaDB preparation complete! Database saved to: {self.chroma_path}")
 
+        self.write_manifest(collections, shard_of)
+        # The flat NumPy index is a copy of the Chroma embeddings, so either backend can serve queries
+        export_chroma_to_flat(self.chroma_path, sorted(collections), FLAT_INDEX_PATH, dtype=FLAT_INDEX_DTYPE,
+                              quantization=self.quantization)
+
+    def _keep_other_shards(self, shard_of, only_shard):
+        """Assignments for a single-shard rebuild. Only the target collection is re-embedded, so every file the
+        existing manifest places elsewhere stays where it is (even if it would now be assigned differently);
+        a new file that belongs to another shard cannot be added without rebuilding that shard."""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"only_shard needs the existing shard manifest ({self.manifest_path}): {str(e)}")
+        if manifest.get("shard_by") != self.shard_by:
+            raise ValueError(f"The existing vector DB is sharded by {manifest.get('shard_by')}, not {self.shard_by}; "
+                             "rebuild every shard")
+        previous = manifest.get("shards", {})
+        kept, moved, unplaced = {}, [], []
+        for file_name, shard in previous.items():
+            if shard != only_shard:
+                kept[file_name] = shard  # still embedded in its old collection, on disk or not
+        for file_name, shard in shard_of.items():
+            if file_name in kept:
+                if shard != kept[file_name]:
+                    moved.append(file_name)
+            elif file_name in previous or shard == only_shard:
+                # Previously in the target shard, or new to it: (re-)embedded into the target now
+                kept[file_name] = only_shard if file_name in previous else shard
+                if shard != only_shard:
+                    moved.append(file_name)
+            else:
+                unplaced.append(file_name)
+        if unplaced:
+            raise ValueError(f"New files belong to other shards and need a rebuild of those shards: {sorted(unplaced)}")
+        if moved:
+            print(f"[WARNING] {len(moved)} files would now be assigned to a different shard; kept in their current "
+                  f"shard until a full rebuild: {sorted(moved)}")
+        return kept
+
+    def write_manifest(self, collections, shard_of):
+        """Record which collections make up the vector DB, and the files in each, for VectorDBManager"""
+        manifest = {
+            "shard_by": self.shard_by,
+            "collections": {name: sorted(files) for name, files in collections.items()},
+            "shards": {file_name: shard for file_name, shard in shard_of.items() if shard is not None},
+        }
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def build_lexical_index(self, ids, documents, file_names):
+        """Build and persist the BM25 index over the chunks stored in Chroma (grouped by source file)"""
+        lexical_index = BM25Index(self.lexical_index_path)
+        lexical_index.build(ids, documents, groups=file_names)
+        lexical_index.save()
+        print(f"Lexical index built with {len(ids)} chunks: {self.lexical_index_path}")
+        return lexical_index
+
     def _split_text(self, text, chunk_size, chunk_overlap):
         """Split text into overlapping chunks"""
         chunks = []
@@ -90,5 +243,11 @@ class DataPreparer:
         return chunks
 
 if __name__ == "__main__":
-    preparer = DataPreparer()
-    preparer.prepare_chroma_db(chunk_size=800, chunk_overlap=80)
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the Chroma vector DB, lexical index and flat index")
+    parser.add_argument("--shard-by", choices=["district", "language"], default=SHARD_BY or None)
+    parser.add_argument("--only-shard", help="Re-embed a single shard (e.g. a district) and keep the others")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default=FLAT_INDEX_QUANTIZATION)
+    args = parser.parse_args()
+    preparer = DataPreparer(quantization=args.quantization, shard_by=args.shard_by)
+    preparer.prepare_chroma_db(chunk_size=800, chunk_overlap=80, only_shard=args.only_shard)
@@ -0,0 +1,357 @@
+"""
+Vector store backends behind VectorDBManager.
+
+  - ChromaVectorStore: the existing Chroma PersistentClient collection (SQLite + HNSW).
+  - ShardedVectorStore: several Chroma collections (one per district or language
+    shard, see vectorDB_preperation.py) searched concurrently and merged by distance.
+  - FlatVectorStore: an exact in-process index for small corpora. Embeddings are a
+    memory-mapped float32/float16 .npy matrix, ids/documents/metadatas a JSON file
+    next to it. Top-k is one BLAS matmul plus argpartition, with no server, SQLite
+    or HNSW graph to load.
+
+Both return results in Chroma's query()/get() shape, and distances are squared
+L2 like Chroma's default space, so callers and thresholds don't change.
+
+The flat index can also be built quantized ("int8": per-dimension symmetric
+scalar codes, "binary": one sign bit per dimension). Only the codes and row
+norms are loaded into memory; the search ranks all rows on the codes (a matmul
+for int8, Hamming distance for binary) and rescores the best
+n_results * rescore_factor candidates against the full-precision vectors,
+which stay on disk in the memory map and are only read for those rows.
+
+Export an existing chroma_data directory to a flat index:
+    python vector_store.py --dtype float16 --quantization int8
+"""
+import os
+import json
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+NORMS_FILE = "sq_norms.npy"
+CODES_FILE = "codes.npy"
+SCALES_FILE = "scales.npy"
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Number of set bits of every byte value, for Hamming distances on packed sign bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _matches(metadata, where):
+    """Evaluate the subset of Chroma's `where` syntax used here ($eq/$ne/$in/$nin, $and/$or)"""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, c) for c in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(metadata, c) for c in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported where operator for the flat index: {op}")
+    return True
+
+
+class VectorStore(ABC):
+    """Interface: query by text (embedded by the store's embedding function) and fetch by id"""
+
+    @abstractmethod
+    def query(self, query_texts, n_results=5, where=None, include=("documents", "metadatas", "distances")):
+        ...
+
+    @abstractmethod
+    def get(self, ids, include=("documents", "metadatas")):
+        ...
+
+    @abstractmethod
+    def count(self):
+        ...
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, embedding_fn, collection_name, chroma_path):
+        import chromadb
+        from chromadb.config import Settings
+        self.client = chromadb.PersistentClient(path=chroma_path, settings=Settings(allow_reset=True))
+        self.collection = self.client.get_or_create_collection(collection_name, embedding_function=embedding_fn)
+
+    def query(self, query_texts, n_results=5, where=None, include=("documents", "metadatas", "distances")):
+        return self.collection.query(query_texts=list(query_texts), n_results=n_results, where=where,
+                                     include=list(include))
+
+    def get(self, ids, include=("documents", "metadatas")):
+        return self.collection.get(ids=list(ids), include=list(include))
+
+    def count(self):
+        return self.collection.count()
+
+
+class ShardedVectorStore(VectorStore):
+    """Fans a query out to several shard stores concurrently and merges each query's hits by distance"""
+
+    def __init__(self, shards, shard_files=None, max_workers=8):
+        self.shards = shards                    # collection name -> VectorStore
+        self.shard_files = shard_files or {}    # collection name -> file names it holds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+
+    def _targets(self, where):
+        """Skip shards that can't match a file_name $in/$eq filter"""
+        condition = (where or {}).get("file_name")
+        if condition is None or not self.shard_files:
+            return list(self.shards)
+        files = set(condition.get("$in", [])) if isinstance(condition, dict) else {condition}
+        if isinstance(condition, dict) and "$eq" in condition:
+            files.add(condition["$eq"])
+        if not files:
+            return list(self.shards)
+        return [name for name in self.shards if files & set(self.shard_files.get(name, ()))]
+
+    def query(self, query_texts, n_results=5, where=None, include=("documents", "metadatas", "distances")):
+        query_texts = list(query_texts)
+        include = list(include) + ([] if "distances" in include else ["distances"])
+        futures = [self._pool.submit(self.shards[name].query, query_texts, n_results, where, include)
+                   for name in self._targets(where)]
+        partials = [future.result() for future in futures]
+        merged = {key: [] for key in ["ids"] + include}
+        for i in range(len(query_texts)):
+            hits = []
+            for partial in partials:
+                for j, doc_id in enumerate(partial["ids"][i]):
+                    hits.append((partial["distances"][i][j], doc_id, partial, j))
+            hits.sort(key=lambda hit: hit[0])
+            hits = hits[:n_results]
+            merged["ids"].append([doc_id for _, doc_id, _, _ in hits])
+            for key in include:
+                merged[key].append([partial[key][i][j] for _, _, partial, j in hits])
+        return merged
+
+    def get(self, ids, include=("documents", "metadatas")):
+        futures = [self._pool.submit(store.get, ids, include) for store in self.shards.values()]
+        merged = {key: [] for key in ["ids"] + list(include)}
+        for future in futures:
+            partial = future.result()
+            for key in merged:
+                merged[key].extend(partial.get(key) if partial.get(key) is not None else [])
+        return merged
+
+    def count(self):
+        return sum(store.count() for store in self.shards.values())
+
+
+class FlatVectorStore(VectorStore):
+    def __init__(self, embedding_fn, index_dir, rescore_factor=10):
+        self.embedding_fn = embedding_fn
+        self.index_dir = index_dir
+        self.rescore_factor = rescore_factor
+        self.quantization = "none"
+        self.vectors = None          # (n, dim) memmap, float32 or float16 (full precision, on disk)
+        self.sq_norms = None         # (n,) float32 squared norms for the L2 expansion
+        self.codes = None            # in memory when quantized: (n, dim) int8 or (n, dim / 8) packed uint8
+        self.scales = None           # (dim,) float32 int8 dequantization scales
+        self.ids, self.documents, self.metadatas = [], [], []
+        self._rows = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        embeddings_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        records_path = os.path.join(self.index_dir, RECORDS_FILE)
+        if not (os.path.exists(embeddings_path) and os.path.exists(records_path)):
+            raise FileNotFoundError(f"No flat vector index in {self.index_dir}. Run: python vector_store.py")
+        vectors = np.load(embeddings_path, mmap_mode="r")
+        with open(records_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        quantization = records.get("quantization", "none")
+        norms_path = os.path.join(self.index_dir, NORMS_FILE)
+        if os.path.exists(norms_path):
+            sq_norms = np.load(norms_path)
+        else:
+            sq_norms = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float32)
+        codes = scales = None
+        if quantization != "none":
+            codes = np.load(os.path.join(self.index_dir, CODES_FILE))
+            if quantization == "int8":
+                scales = np.load(os.path.join(self.index_dir, SCALES_FILE))
+        with self._lock:
+            self.vectors, self.sq_norms = vectors, sq_norms
+            self.quantization, self.codes, self.scales = quantization, codes, scales
+            self.ids, self.documents, self.metadatas = records["ids"], records["documents"], records["metadatas"]
+            self._rows = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    def count(self):
+        return len(self.ids)
+
+    def memory_bytes(self):
+        """Bytes the search keeps in memory (full-precision vectors count only when unquantized)"""
+        resident = self.sq_norms.nbytes
+        if self.quantization == "none":
+            return resident + self.vectors.nbytes
+        return resident + self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _distances(self, query_vectors, rows=None):
+        """Exact squared L2 distance of every query to the stored rows (all rows by default), shape (m, n)"""
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+        dots = query_vectors @ matrix.T.astype(np.float32, copy=False)
+        q_norms = np.einsum("ij,ij->i", query_vectors, query_vectors)
+        return np.maximum(q_norms[:, None] + sq_norms[None, :] - 2 * dots, 0)
+
+    def _approximate(self, query_vectors):
+        """Ranking scores on the quantized codes, lower is closer, shape (m, n)"""
+        if self.quantization == "int8":
+            dots = (query_vectors * self.scales) @ self.codes.T.astype(np.float32)
+            return self.sq_norms[None, :] - 2 * dots
+        query_bits = np.packbits(query_vectors > 0, axis=1)
+        return np.stack([_POPCOUNT[np.bitwise_xor(self.codes, bits)].sum(axis=1) for bits in query_bits])
+
+    @staticmethod
+    def _top(scores, k):
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return top[np.argsort(scores[top])][:k]
+
+    def _search(self, query_vectors, n_results, allowed):
+        """(rows, exact distances) per query"""
+        if self.quantization == "none":
+            distances = self._distances(query_vectors)
+            if allowed is not None:
+                distances[:, ~allowed] = np.inf
+            return [(top, row[top]) for row in distances for top in [self._top(row, n_results)]]
+
+        approximate = self._approximate(query_vectors).astype(np.float32)
+        if allowed is not None:
+            approximate[:, ~allowed] = np.inf
+        hits = []
+        for query_vector, scores in zip(query_vectors, approximate):
+            candidates = np.sort(self._top(scores, n_results * self.rescore_factor))
+            exact = self._distances(query_vector[None, :], candidates)[0]
+            best = self._top(exact, n_results)
+            hits.append((candidates[best], exact[best]))
+        return hits
+
+    def query(self, query_texts, n_results=5, where=None, include=("documents", "metadatas", "distances")):
+        query_vectors = np.asarray(self.embedding_fn(list(query_texts)), dtype=np.float32)
+        with self._lock:
+            allowed = None
+            if where:
+                allowed = np.array([_matches(meta, where) for meta in self.metadatas], dtype=bool)
+            results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+            for top, distances in self._search(query_vectors, n_results, allowed):
+                results["ids"].append([self.ids[i] for i in top])
+                results["documents"].append([self.documents[i] for i in top])
+                results["metadatas"].append([self.metadatas[i] for i in top])
+                results["distances"].append([float(d) for d in distances])
+                results["embeddings"].append([np.array(self.vectors[i], dtype=np.float32) for i in top])
+        return {key: value for key, value in results.items() if key == "ids" or key in include}
+
+    def get(self, ids, include=("documents", "metadatas")):
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        result = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.array(self.vectors[i], dtype=np.float32) for i in rows]
+        return result
+
+
+def quantize(matrix, quantization):
+    """(codes, scales) for a float matrix; scales is None for binary codes"""
+    if quantization == "int8":
+        scales = np.abs(matrix).max(axis=0) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if quantization == "binary":
+        return np.packbits(matrix > 0, axis=1), None
+    raise ValueError(f"Unknown quantization: {quantization} (expected one of {QUANTIZATIONS})")
+
+
+def write_flat_index(index_dir, ids, documents, metadatas, embeddings, dtype="float32", quantization="none"):
+    """Write a flat index: full-precision embeddings.npy, row norms, optional quantized codes, and records.json"""
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    np.save(os.path.join(index_dir, EMBEDDINGS_FILE), matrix.astype(np.dtype(dtype)))
+    np.save(os.path.join(index_dir, NORMS_FILE), np.einsum("ij,ij->i", matrix, matrix))
+    for stale in (CODES_FILE, SCALES_FILE):
+        if os.path.exists(os.path.join(index_dir, stale)):
+            os.remove(os.path.join(index_dir, stale))
+    if quantization != "none":
+        codes, scales = quantize(matrix, quantization)
+        np.save(os.path.join(index_dir, CODES_FILE), codes)
+        if scales is not None:
+            np.save(os.path.join(index_dir, SCALES_FILE), scales)
+    tmp_path = os.path.join(index_dir, RECORDS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas),
+                   "quantization": quantization}, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(index_dir, RECORDS_FILE))
+
+
+def read_chroma_collection(chroma_path, collection_name, batch_size=500):
+    """(ids, documents, metadatas, embeddings) of every chunk in a Chroma collection"""
+    import chromadb
+    from chromadb.config import Settings
+    client = chromadb.PersistentClient(path=chroma_path, settings=Settings())
+    collection = client.get_collection(collection_name)
+    total = collection.count()
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        ids.extend(batch["ids"])
+        documents.extend(batch["documents"])
+        metadatas.extend(batch["metadatas"])
+        embeddings.extend(batch["embeddings"])
+    return ids, documents, metadatas, embeddings
+
+
+def export_chroma_to_flat(chroma_path, collection_names, index_dir, dtype="float32", quantization="none",
+                          batch_size=500):
+    """Copy ids, documents, metadatas and stored embeddings from Chroma collection(s) into one flat index"""
+    if isinstance(collection_names, str):
+        collection_names = [collection_names]
+    ids, documents, metadatas, embeddings = [], [], [], []
+    for collection_name in collection_names:
+        for target, values in zip((ids, documents, metadatas, embeddings),
+                                  read_chroma_collection(chroma_path, collection_name, batch_size)):
+            target.extend(values)
+    write_flat_index(index_dir, ids, documents, metadatas, embeddings, dtype=dtype, quantization=quantization)
+    print(f"Exported {len(ids)} chunks from {chroma_path} to {index_dir} ({dtype}, quantization={quantization})")
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from env import CHROMA_PATH, CHROMA_COLLECTION_NAME, FLAT_INDEX_PATH
+    parser = argparse.ArgumentParser(description="Export the Chroma collection to a flat NumPy index")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    parser.add_argument("--collection", nargs="+", default=[CHROMA_COLLECTION_NAME],
+                        help="Collection(s) to export; list every shard collection for a sharded DB")
+    parser.add_argument("--out", default=FLAT_INDEX_PATH)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none")
+    args = parser.parse_args()
+    export_chroma_to_flat(args.chroma_path, args.collection, args.out, dtype=args.dtype,
+                          quantization=args.quantization)